@@ -1,15 +1,25 @@
+from graph import read_graph, sidecar_path, graph_version
+from journal import atomic_write_bytes, atomic_write_json
+from metrics import timed
+import os
+import io
 import json
+import hashlib
+import threading
 import networkx as nx
 import matplotlib.pyplot as plt
-from collections import defaultdict
 import numpy as np
+from scipy import sparse
 import seaborn as sns
 
+_render_lock = threading.Lock()
+
+@timed("analysis.load")
 def load_data(file_path):
-    """Load the graph data from a JSON file."""
-    with open(file_path, 'r') as f:
-        return json.load(f)
+    """Load the graph data from a JSON file, including journaled changes."""
+    return read_graph(file_path)
 
+@timed("analysis.build_graph")
 def build_graph(data):
     """Construct a NetworkX graph from the dataset."""
     G = nx.Graph()
@@ -25,104 +35,277 @@ def build_graph(data):
     
     return G
 
-def compute_centrality(G):
-    """Compute centrality metrics for graph nodes."""
-    degree_centrality = nx.degree_centrality(G)
-    betweenness_centrality = nx.betweenness_centrality(G)
-    eigenvector_centrality = nx.eigenvector_centrality(G, max_iter=1000)
-    
-    return {
-        "degree": degree_centrality,
-        "betweenness": betweenness_centrality,
-        "eigenvector": eigenvector_centrality,
-    }
-
-def find_clusters(G):
-    """Detect clusters using the Louvain method (if available) or connected components."""
-    try:
-        import community as community_louvain
-        partition = community_louvain.best_partition(G)
-        return partition
-    except ImportError:
-        return list(nx.connected_components(G))
-
-def tag_cooccurrence_analysis(data):
-    """Find notes that share multiple tags to infer hidden relationships."""
-    tag_map = defaultdict(set)
-    for tag, notes in data['tags'].items():
-        for note in notes:
-            tag_map[note].add(tag)
-    
-    cooccurrence = defaultdict(lambda: defaultdict(int))
-    notes = list(tag_map.keys())
-    
-    for i, note1 in enumerate(notes):
-        for j in range(i + 1, len(notes)):
-            note2 = notes[j]
-            common_tags = tag_map[note1] & tag_map[note2]
-            if common_tags:
-                cooccurrence[note1][note2] = len(common_tags)
-                cooccurrence[note2][note1] = len(common_tags)
-    
+CENTRALITY_METRICS = ("degree", "betweenness", "eigenvector")
+
+@timed("analysis.centrality")
+def compute_centrality(G, metrics=CENTRALITY_METRICS, k=None, seed=0):
+    """
+    Compute centrality metrics for graph nodes.
+    With k set, betweenness is estimated from k sampled source nodes instead
+    of all of them, which turns O(VE) into O(kE).
+    """
+    centrality = {}
+    if "degree" in metrics:
+        centrality["degree"] = nx.degree_centrality(G)
+    if "betweenness" in metrics:
+        if k is not None and k < G.number_of_nodes():
+            centrality["betweenness"] = nx.betweenness_centrality(G, k=k, seed=seed)
+        else:
+            centrality["betweenness"] = nx.betweenness_centrality(G)
+    if "eigenvector" in metrics:
+        centrality["eigenvector"] = nx.eigenvector_centrality(G, max_iter=1000)
+    return centrality
+
+def cached_centrality(file_path, data, G=None, metrics=CENTRALITY_METRICS, k=None):
+    """
+    Centrality metrics from graph.centrality.json when they were computed for
+    the same graph version and k, computing (and storing) only what is missing.
+    """
+    cache_path = sidecar_path(file_path, "centrality.json")
+    key = {"version": graph_version(data), "k": k}
+    cache = {}
+    if os.path.exists(cache_path):
+        with open(cache_path, "r") as f:
+            try:
+                cache = json.load(f)
+            except json.JSONDecodeError:
+                cache = {}
+    if cache.get("key") != key:
+        cache = {"key": key, "metrics": {}}
+
+    missing = [metric for metric in metrics if metric not in cache["metrics"]]
+    if missing:
+        if G is None:
+            G = build_graph(data)
+        cache["metrics"].update(compute_centrality(G, missing, k=k))
+        atomic_write_json(cache_path, cache)
+    return {metric: cache["metrics"][metric] for metric in metrics}
+
+def find_clusters(G, method="louvain", seed=0):
+    """Detect clusters with NetworkX's Louvain or label propagation. Returns {note: community id}."""
+    from clusters import detect_communities
+    return detect_communities(G, method, seed)
+
+def tag_incidence(data):
+    """Build the note x tag incidence matrix (CSR, 0/1 entries) with its row and column labels."""
+    note_ids = {}
+    tags = list(data['tags'])
+    rows, cols = [], []
+    for j, tag in enumerate(tags):
+        for note in data['tags'][tag]:
+            rows.append(note_ids.setdefault(note, len(note_ids)))
+            cols.append(j)
+    A = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.int32), (rows, cols)), shape=(len(note_ids), len(tags))
+    )
+    A.data[:] = 1  # duplicate tag entries were summed; keep set semantics
+    return A, list(note_ids), tags
+
+@timed("analysis.cooccurrence")
+def tag_cooccurrence_analysis(data, top_k=None, max_entries=5_000_000):
+    """
+    Find notes that share multiple tags to infer hidden relationships.
+
+    Co-occurrence counts are the sparse product A @ A.T of the note x tag
+    incidence matrix, computed in row blocks sized so that no block produces
+    more than about max_entries nonzeros. With top_k set, only the k strongest
+    pairs are kept per note.
+    """
+    A, notes, _ = tag_incidence(data)
+    if not notes:
+        return {}
+    AT = A.T.tocsr()
+    # Upper bound on each row's nonzeros: the summed popularity of its tags
+    row_estimate = A @ np.asarray(A.sum(axis=0)).ravel()
+
+    cooccurrence = {}
+    start = 0
+    while start < len(notes):
+        end = start + 1
+        budget = row_estimate[start]
+        while end < len(notes) and budget + row_estimate[end] <= max_entries:
+            budget += row_estimate[end]
+            end += 1
+
+        block = (A[start:end] @ AT).tocsr()
+        for offset in range(end - start):
+            i = start + offset
+            cols = block.indices[block.indptr[offset]:block.indptr[offset + 1]]
+            counts = block.data[block.indptr[offset]:block.indptr[offset + 1]]
+            keep = cols != i
+            cols, counts = cols[keep], counts[keep]
+            if not len(cols):
+                continue
+            if top_k is not None and len(cols) > top_k:
+                strongest = np.argpartition(-counts, top_k - 1)[:top_k]
+                cols, counts = cols[strongest], counts[strongest]
+            order = np.argsort(-counts, kind="stable")
+            cooccurrence[notes[i]] = {notes[j]: int(c) for j, c in zip(cols[order], counts[order])}
+        start = end
+
     return cooccurrence
 
-def visualize_graph(G):
+@timed("analysis.layout")
+def cached_layout(file_path, data, G):
+    """
+    Spring layout positions, persisted in graph.layout.json. An unchanged graph
+    reuses the saved positions as-is; otherwise the saved positions seed a
+    shorter spring layout run so the picture stays stable between renders.
+    """
+    layout_path = sidecar_path(file_path, "layout.json")
+    saved = {}
+    if os.path.exists(layout_path):
+        with open(layout_path, "r") as f:
+            try:
+                saved = json.load(f)
+            except json.JSONDecodeError:
+                saved = {}
+
+    version = graph_version(data)
+    pos = {node: tuple(xy) for node, xy in saved.get("pos", {}).items() if node in G}
+    if saved.get("version") == version and len(pos) == G.number_of_nodes():
+        return pos
+
+    pos = nx.spring_layout(G, pos=pos or None, iterations=15 if pos else 50, seed=0)
+    pos = {node: (float(x), float(y)) for node, (x, y) in pos.items()}
+    atomic_write_json(layout_path, {"version": version, "pos": pos})
+    return pos
+
+@timed("analysis.plot")
+def visualize_graph(G, pos=None, show=True):
     """Visualize the graph with Matplotlib."""
-    plt.figure(figsize=(8, 6))
-    pos = nx.spring_layout(G)
-    nx.draw(G, pos, with_labels=True, node_color='skyblue', edge_color='gray', node_size=2000, font_size=10)
+    fig = plt.figure(figsize=(8, 6))
+    if pos is None:
+        pos = nx.spring_layout(G)
+    nx.draw(G, pos, ax=fig.gca(), with_labels=True, node_color='skyblue', edge_color='gray', node_size=2000, font_size=10)
     plt.title("Graph Visualization")
-    plt.show()
-
-def plot_cooccurrence(cooccurrence):
+    if show:
+        plt.show()
+    return fig
 
-    notes = list(cooccurrence.keys())
+@timed("analysis.plot")
+def plot_cooccurrence(cooccurrence, top_n=30, show=True):
+    """Heatmap of tag co-occurrence between the top_n notes with the most shared tags."""
+    totals = {note: sum(related.values()) for note, related in cooccurrence.items()}
+    notes = sorted(totals, key=totals.get, reverse=True)[:top_n]
     matrix = np.zeros((len(notes), len(notes)))
 
     for i, note in enumerate(notes):
         for j, related_note in enumerate(notes):
             matrix[i, j] = cooccurrence[note].get(related_note, 0)
 
-    plt.figure(figsize=(8, 6))
-    sns.heatmap(matrix, xticklabels=notes, yticklabels=notes, cmap="coolwarm", annot=True)
+    fig = plt.figure(figsize=(8, 6))
+    sns.heatmap(matrix, xticklabels=notes, yticklabels=notes, cmap="coolwarm", annot=len(notes) <= 20)
     plt.title("Tag Co-occurrence Heatmap")
-    plt.show()
+    if show:
+        plt.show()
+    return fig
 
-def plot_centrality(centrality):
+@timed("analysis.plot")
+def plot_centrality(centrality, top_n=30, show=True):
     """
-    Plots bar charts for different centrality measures.
+    Plots bar charts for different centrality measures, one panel per metric,
+    limited to the top_n notes of each.
     """
     sns.set(style="whitegrid")  # Set a clean style for Seaborn
-    for metric, scores in centrality.items():
-        sorted_scores = sorted(scores.items(), key=lambda x: x[1], reverse=True)
+    fig, axes = plt.subplots(len(centrality), 1, figsize=(10, 5 * len(centrality)), squeeze=False)
+    for ax, (metric, scores) in zip(axes[:, 0], centrality.items()):
+        sorted_scores = sorted(scores.items(), key=lambda x: x[1], reverse=True)[:top_n]
+        if not sorted_scores:
+            continue
         nodes, values = zip(*sorted_scores)  # Extract names & values
 
-        plt.figure(figsize=(10, 5))
-        sns.barplot(x=list(nodes), y=list(values), palette="viridis")
-        plt.xticks(rotation=45, ha="right")
-        plt.ylabel(metric.capitalize())
-        plt.xlabel("Notes")
-        plt.title(f"{metric.capitalize()} Centrality")
+        sns.barplot(x=list(nodes), y=list(values), hue=list(nodes), palette="viridis", legend=False, ax=ax)
+        ax.tick_params(axis="x", rotation=45)
+        ax.set_ylabel(metric.capitalize())
+        ax.set_xlabel("Notes")
+        ax.set_title(f"{metric.capitalize()} Centrality")
+    fig.tight_layout()
+    if show:
         plt.show()
+    return fig
 
+@timed("analysis.render")
+def render(file_path, mode, fmt="png", data=None, k=None, top_k=None, top_n=30):
+    """Draw one graph view off-screen and return the image bytes."""
+    if data is None:
+        data = load_data(file_path)
+    if mode == "hmap":
+        fig = plot_cooccurrence(tag_cooccurrence_analysis(data, top_k=top_k), top_n=top_n, show=False)
+    elif mode == "cen":
+        fig = plot_centrality(cached_centrality(file_path, data, k=k), top_n=top_n, show=False)
+    elif mode == "viz":
+        G = build_graph(data)
+        fig = visualize_graph(G, cached_layout(file_path, data, G), show=False)
+    else:
+        raise ValueError(f"Unknown graph mode: {mode}")
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format=fmt, bbox_inches="tight")
+    plt.close(fig)
+    return buffer.getvalue()
 
-def analyse(file_path, flag):
-    data = load_data(file_path)
-    G = build_graph(data)
-    
-    centrality = compute_centrality(G)
-    clusters = find_clusters(G)
-    cooccurrence = tag_cooccurrence_analysis(data)
-    
-   
+def _version_tag(data):
+    return hashlib.sha1(graph_version(data).encode("utf-8")).hexdigest()[:12]
 
+def render_path(file_path, mode, fmt="png", data=None, **params):
+    """
+    Where render_cached keeps a graph view for this graph version and
+    parameters: (path, etag). File names are <mode>-<graph version tag>-<etag>.
+    """
+    if data is None:
+        data = load_data(file_path)
+    key = json.dumps([graph_version(data), mode, fmt, params], sort_keys=True)
+    etag = hashlib.sha1(key.encode("utf-8")).hexdigest()
+    return os.path.join(sidecar_path(file_path, "renders"), f"{mode}-{_version_tag(data)}-{etag}.{fmt}"), etag
+
+def render_cached(file_path, mode, fmt="png", data=None, **params):
+    """
+    Render a graph view into graph.renders/, reusing the file while the graph
+    version and parameters are unchanged. Renders of older graph versions
+    are removed; each parameter set of the current version keeps its file.
+    Returns (path, etag).
+    """
+    if data is None:
+        data = load_data(file_path)
+    path, etag = render_path(file_path, mode, fmt, data, **params)
+    render_dir = os.path.dirname(path)
+    current = f"{mode}-{_version_tag(data)}-"
+
+    with _render_lock:  # pyplot is not thread-safe
+        if not os.path.exists(path):
+            image = render(file_path, mode, fmt, data=data, **params)
+            os.makedirs(render_dir, exist_ok=True)
+            for name in os.listdir(render_dir):
+                if name.startswith(f"{mode}-") and name.endswith(f".{fmt}") and not name.startswith(current):
+                    try:
+                        os.remove(os.path.join(render_dir, name))
+                    except FileNotFoundError:
+                        pass  # another process cleaned up first
+            atomic_write_bytes(path, image)
+    return path, etag
+
+def render_job(file_path, mode, fmt="png", **params):
+    """render_cached from the graph file, for the server's job queue. Returns {"path", "etag"}."""
+    path, etag = render_cached(file_path, mode, fmt, **params)
+    return {"path": path, "etag": etag}
+
+
+def analyse(file_path, flag, k=None, top_k=None, top_n=30):
+    """Run only the analysis the flag needs and plot it. Returns the computed data."""
+    data = load_data(file_path)
 
     if flag == "hmap":
-        plot_cooccurrence(tag_cooccurrence_analysis(data))
+        cooccurrence = tag_cooccurrence_analysis(data, top_k=top_k)
+        plot_cooccurrence(cooccurrence, top_n=top_n)
         print("\nTag Co-occurrence Analysis:")
         for note, related in cooccurrence.items():
             print(f"  {note} -> {dict(related)}")
+        return cooccurrence
     elif flag == "cen":
-        plot_centrality(centrality)
+        centrality = cached_centrality(file_path, data, k=k)
+        plot_centrality(centrality, top_n=top_n)
+        return centrality
     elif flag == "viz":
-        visualize_graph(G)
\ No newline at end of file
+        G = build_graph(data)
+        visualize_graph(G, cached_layout(file_path, data, G))
+        return None
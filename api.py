@@ -0,0 +1,301 @@
+import os
+import base64
+import json
+import zlib
+from bisect import bisect_left, bisect_right
+from collections import deque
+from flask import Blueprint, Response, request, stream_with_context
+from storage import graph
+from jobs import JobQueue
+
+api = Blueprint("api", __name__, url_prefix="/api")
+
+# Slow graph work (renders, clustering, init) runs here instead of on request threads
+job_queue = JobQueue(
+    graph.sidecar_path("jobs"),
+    max_workers=int(os.getenv("SODIUM_JOB_WORKERS", "0")) or None,
+    max_pending=int(os.getenv("SODIUM_JOB_QUEUE", "16")),
+)
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+MAX_SUBGRAPH_NODES = 5000
+MAX_COMPLETIONS = 50
+
+_sorted_cache = {}
+
+
+def sorted_keys(section):
+    """Sorted keys of graph.graph[section], recomputed only when the graph version changes."""
+    cached = _sorted_cache.get(section)
+    if cached is None or cached[0] != graph.version:
+        with graph.lock:
+            cached = (graph.version, sorted(graph.graph.get(section, {})))
+        _sorted_cache[section] = cached
+    return cached[1]
+
+
+def encode_cursor(value):
+    return base64.urlsafe_b64encode(json.dumps(value).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor):
+    if not cursor:
+        return None
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def page(keys, cursor, limit):
+    """Return (keys after the cursor, next cursor or None) from a sorted key list."""
+    after = decode_cursor(cursor)
+    start = bisect_right(keys, after) if isinstance(after, str) else 0
+    items = keys[start:start + limit]
+    next_cursor = encode_cursor(items[-1]) if start + limit < len(keys) else None
+    return items, next_cursor
+
+
+def request_limit():
+    return max(1, min(request.args.get("limit", DEFAULT_LIMIT, type=int), MAX_LIMIT))
+
+
+def stream_json(sections, extra=None):
+    """
+    Stream a JSON object whose values are produced lazily.
+    sections maps a key to an iterable of JSON-serialisable items; extra is a
+    callable returning trailing fields (e.g. the next cursor) once those are consumed.
+    """
+    yield "{"
+    first_section = True
+    for name, items in sections.items():
+        yield ("" if first_section else ",") + json.dumps(name) + ":["
+        first_section = False
+        first = True
+        for item in items:
+            yield ("" if first else ",") + json.dumps(item)
+            first = False
+        yield "]"
+    for name, value in (extra() if extra else {}).items():
+        yield "," + json.dumps(name) + ":" + json.dumps(value)
+    yield "}"
+
+
+def gzip_stream(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def json_response(chunks):
+    """Wrap a chunk generator in a streamed response, gzip-compressed if the client accepts it."""
+    chunks = stream_with_context(chunks)
+    if "gzip" in request.headers.get("Accept-Encoding", ""):
+        response = Response(gzip_stream(chunks), mimetype="application/json")
+        response.headers["Content-Encoding"] = "gzip"
+    else:
+        response = Response(chunks, mimetype="application/json")
+    response.headers["Vary"] = "Accept-Encoding"
+    return response
+
+
+def paged_section(section, describe):
+    """Paginated listing of graph.graph[section] using describe(key, value) for each item."""
+    keys, next_cursor = page(sorted_keys(section), request.args.get("cursor"), request_limit())
+    data = graph.graph.get(section, {})
+
+    def items():
+        for key in keys:
+            value = data.get(key)
+            if value is not None:
+                yield describe(key, value)
+
+    return json_response(stream_json({"items": items()}, lambda: {"next": next_cursor}))
+
+
+@api.route("/notes")
+def notes():
+    return paged_section("notes", lambda title, path: {"title": title, "path": path})
+
+
+@api.route("/tags")
+def tags():
+    return paged_section("tags", lambda tag, notes: {"tag": tag, "notes": notes})
+
+
+def log_cursor():
+    """LogStore position from the cursor parameter, or None."""
+    position = decode_cursor(request.args.get("cursor"))
+    if isinstance(position, list) and len(position) == 2 and all(isinstance(n, int) for n in position):
+        return position
+    return None
+
+
+def links_cursor():
+    """[source, edge index] from the /links cursor parameter, or None."""
+    after = decode_cursor(request.args.get("cursor"))
+    if isinstance(after, list) and len(after) == 2 and isinstance(after[0], str) and isinstance(after[1], int) and after[1] >= 0:
+        return after
+    return None
+
+
+def log_entries(limit):
+    """
+    (entries, next cursor) for the log query in the request: newest first,
+    optionally one ?title= and ?since=/?until= in epoch seconds. entries is
+    a generator; the cursor is known once it has been consumed.
+    """
+    entries = graph.logs.entries(
+        title=request.args.get("title") or None,
+        since=request.args.get("since", type=float),
+        until=request.args.get("until", type=float),
+        cursor=log_cursor(),
+        reverse=True,
+    )
+    state = {"next": None}
+
+    def items():
+        for n, entry in enumerate(entries):
+            if n == limit:
+                state["next"] = encode_cursor(last)
+                return
+            last = entry["id"]
+            yield entry
+
+    return items(), lambda: state["next"]
+
+
+@api.route("/logs")
+def logs():
+    """Log entries {id, ts, title, text}, newest first; see log_entries for the filters."""
+    entries, next_cursor = log_entries(request_limit())
+    return json_response(stream_json({"items": entries}, lambda: {"next": next_cursor()}))
+
+
+@api.route("/links")
+def links():
+    """Edges as {source, target}, paginated by edge; the cursor is [source, index of the next edge]."""
+    limit = request_limit()
+    after = links_cursor()
+    sources = sorted_keys("links")
+    start, skip = 0, 0
+    if after is not None:
+        start = bisect_left(sources, after[0])
+        if start < len(sources) and sources[start] == after[0]:
+            skip = after[1]
+    state = {"next": None}
+
+    def items():
+        emitted = 0
+        for position in range(start, len(sources)):
+            source = sources[position]
+            targets = graph.graph["links"].get(source, [])
+            for i in range(skip if position == start else 0, len(targets)):
+                if emitted == limit:
+                    state["next"] = encode_cursor([source, i])
+                    return
+                yield {"source": source, "target": targets[i]}
+                emitted += 1
+
+    return json_response(stream_json({"items": items()}, lambda: state))
+
+
+@api.route("/jobs/<job_id>")
+def job_status(job_id):
+    """State of a background job: queued, running, done (with its result) or failed (with the error)."""
+    status = job_queue.status(job_id)
+    if status is None:
+        return {"error": f"Job '{job_id}' not found"}, 404
+    status.pop("traceback", None)
+    return status
+
+
+@api.route("/subgraph/<title>")
+def subgraph(title):
+    """Node-link ego network: every note within depth hops of title, in either direction."""
+    if title not in graph.graph["notes"]:
+        return {"error": f"Note '{title}' not found"}, 404
+    depth = max(0, request.args.get("depth", 1, type=int))
+    max_nodes = max(1, min(request.args.get("limit", 500, type=int), MAX_SUBGRAPH_NODES))
+
+    with graph.lock:
+        seen = {title: 0}
+        queue = deque([title])
+        while queue and len(seen) < max_nodes:
+            note = queue.popleft()
+            if seen[note] == depth:
+                continue
+            for neighbor in sorted(graph.index.outgoing(note) | graph.index.incoming(note)):
+                if neighbor not in seen and len(seen) < max_nodes:
+                    seen[neighbor] = seen[note] + 1
+                    queue.append(neighbor)
+        edges = [
+            {"source": note, "target": target}
+            for note in seen
+            for target in sorted(graph.index.outgoing(note))
+            if target in seen
+        ]
+
+    nodes = ({"id": note, "depth": hops} for note, hops in seen.items())
+    return json_response(stream_json({"nodes": nodes, "links": edges}, lambda: {"truncated": len(seen) >= max_nodes}))
+
+
+@api.route("/complete")
+def complete():
+    """Note titles completing ?q=, prefix matches first and tolerating a typo per word."""
+    limit = max(1, min(request.args.get("limit", 10, type=int), MAX_COMPLETIONS))
+    return {"items": graph.titles.complete(request.args.get("q", ""), limit)}
+
+
+def note_or_404(*titles):
+    for title in titles:
+        if title not in graph.graph["notes"]:
+            return {"error": f"Note '{title}' not found"}, 404
+    return None
+
+
+@api.route("/path/<source>/<target>")
+def path(source, target):
+    """Shortest path following links; ?directed=0 also follows them backwards."""
+    missing = note_or_404(source, target)
+    if missing:
+        return missing
+    directed = request.args.get("directed", 1, type=int) != 0
+    return {"path": graph.query.shortest_path(source, target, directed=directed)}
+
+
+@api.route("/neighbors/<title>")
+def neighbors(title):
+    """Notes within depth hops of title as [{title, hops}], nearest first."""
+    missing = note_or_404(title)
+    if missing:
+        return missing
+    depth = max(0, request.args.get("depth", 1, type=int))
+    directed = request.args.get("directed", 0, type=int) != 0
+    found = graph.query.k_hop(title, depth, directed=directed, limit=request_limit())
+    return {"items": [{"title": note, "hops": hops} for note, hops in found]}
+
+
+@api.route("/common/<a>/<b>")
+def common(a, b):
+    missing = note_or_404(a, b)
+    if missing:
+        return missing
+    return {"items": graph.query.common_neighbors(a, b)}
+
+
+@api.route("/related/<title>")
+def related(title):
+    """Notes ranked by shared links plus shared tags."""
+    missing = note_or_404(title)
+    if missing:
+        return missing
+    found = graph.query.related(title, max(1, min(request.args.get("limit", 10, type=int), MAX_LIMIT)))
+    return {"items": [
+        {"title": note, "score": score, "shared_links": shared_links, "shared_tags": shared_tags}
+        for note, score, shared_links, shared_tags in found
+    ]}
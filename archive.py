@@ -0,0 +1,394 @@
+"""
+Streaming export and import of a vault as a single tar archive.
+
+    sodium.json     {"format": "sodium-archive", "version": 1}
+    notes/...       one member per note file, its title in a SODIUM.title PAX header
+    graph.ndjson    {"ref": [source, target], "weight": n} and {"tag": [note, tag]} records
+    logs.ndjson     {"ts", "title", "text"} log entries, oldest first
+
+The archive is compressed according to its extension (.tar, .tar.gz/.tgz,
+.tar.bz2, .tar.xz, or .tar.zst with the zstandard package) and "-" means
+stdout/stdin, so it can be piped. Both directions stream: note files are
+read ahead and written by a thread pool a bounded number at a time, and
+the NDJSON members are spooled through temporary files on export because
+tar needs each member's size before its data.
+"""
+import io
+import os
+import sys
+import json
+import time
+import tarfile
+import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import metrics
+
+FORMAT = "sodium-archive"
+VERSION = 1
+HEADER_MEMBER = "sodium.json"
+GRAPH_MEMBER = "graph.ndjson"
+LOGS_MEMBER = "logs.ndjson"
+NOTES_PREFIX = "notes/"
+TITLE_HEADER = "SODIUM.title"
+
+# Note files read or written ahead of the tar stream
+WINDOW = 64
+# Graph operations and log entries applied per call while importing
+CHUNK = 1000
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def _compression(path):
+    for suffix, name in ((".tar.gz", "gz"), (".tgz", "gz"), (".tar.bz2", "bz2"), (".tar.xz", "xz"), (".tar.zst", "zst")):
+        if path.endswith(suffix):
+            return name
+    return ""
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ArchiveError("Install the zstandard package for .tar.zst archives") from None
+    return zstandard
+
+
+def _open_write(path):
+    """(tarfile, [streams to close, or callables to run, after it]) for writing to path or stdout."""
+    compression = _compression(path)
+    zstandard = _zstandard() if compression == "zst" else None
+    raw = sys.stdout.buffer if path == "-" else open(path, "wb")
+    owned = [raw.flush] if path == "-" else [raw]
+    if zstandard is not None:
+        stream = zstandard.ZstdCompressor().stream_writer(raw, closefd=False)
+        return tarfile.open(fileobj=stream, mode="w|", format=tarfile.PAX_FORMAT), [stream] + owned
+    return tarfile.open(fileobj=raw, mode=f"w|{compression}", format=tarfile.PAX_FORMAT), owned
+
+
+def _open_read(path):
+    """(tarfile, [streams to close after it]) for reading path or stdin."""
+    raw = sys.stdin.buffer if path == "-" else open(path, "rb")
+    owned = [] if path == "-" else [raw]
+    try:
+        if _compression(path) == "zst":
+            stream = _zstandard().ZstdDecompressor().stream_reader(raw, closefd=False)
+            owned.insert(0, stream)
+            return tarfile.open(fileobj=stream, mode="r|"), owned
+        return tarfile.open(fileobj=raw, mode="r|*"), owned
+    except (tarfile.TarError, ArchiveError) as e:
+        _close(owned)
+        raise ArchiveError(f"{path} is not a readable archive: {e}") from None
+
+
+def _close(resources):
+    for resource in resources:
+        if callable(resource):
+            resource()
+        else:
+            resource.close()
+
+
+def _ahead(pool, fn, items, window=WINDOW):
+    """Yield (item, fn(item)) in order, running fn in pool for at most window items ahead."""
+    pending = deque()
+    for item in items:
+        pending.append((item, pool.submit(fn, item)))
+        if len(pending) >= window:
+            item, future = pending.popleft()
+            yield item, future.result()
+    while pending:
+        item, future = pending.popleft()
+        yield item, future.result()
+
+
+def _note_file(note_data):
+    # graph["notes"] values are paths; very old graphs stored {"path": ...}
+    return note_data if isinstance(note_data, str) else note_data.get("path", "")
+
+
+def _read_note(item):
+    _, path = item
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    metrics.count_io("note", "read", len(data))
+    return data
+
+
+def _add_member(tar, name, fileobj, size, pax_headers=None):
+    info = tarfile.TarInfo(name)
+    info.size = size
+    info.mtime = int(time.time())
+    if pax_headers:
+        info.pax_headers = pax_headers
+    tar.addfile(info, fileobj)
+
+
+def _add_spooled(tar, name, records):
+    """Add an NDJSON member from an iterable of records, spooled through a temporary file."""
+    with tempfile.TemporaryFile() as spool:
+        for record in records:
+            spool.write((json.dumps(record) + "\n").encode("utf-8"))
+        size = spool.tell()
+        spool.seek(0)
+        _add_member(tar, name, spool, size)
+
+
+def select_notes(graph, tags=None, subgraph=None, depth=1):
+    """
+    Titles to export: notes carrying any of tags and/or within depth links
+    of subgraph (both filters must hold when both are given). None means
+    every note.
+    """
+    selected = None
+    if tags:
+        selected = set()
+        for tag in tags:
+            selected.update(graph.graph["tags"].get(tag, ()))
+    if subgraph is not None:
+        if subgraph not in graph.graph["notes"]:
+            raise ArchiveError(f"Note '{subgraph}' does not exist.")
+        nearby = {subgraph} | {title for title, _ in graph.query.k_hop(subgraph, depth)}
+        selected = nearby if selected is None else selected & nearby
+    return selected
+
+
+def _graph_records(data, selected):
+    keep = (lambda title: True) if selected is None else selected.__contains__
+    weights = data.get("weights", {})
+    for source, targets in data["links"].items():
+        if not keep(source):
+            continue
+        counts = weights.get(source, {})
+        for target in targets:
+            if keep(target):
+                yield {"ref": [source, target], "weight": counts.get(target, 1)}
+    for tag, notes in data["tags"].items():
+        for note in notes:
+            if keep(note):
+                yield {"tag": [note, tag]}
+
+
+def _log_records(graph, selected):
+    for entry in graph.logs.entries():
+        if selected is None or entry["title"] in selected:
+            yield {"ts": entry.get("origin_ts", entry["ts"]), "title": entry["title"], "text": entry["text"]}
+
+
+@metrics.timed("archive.export")
+def export_vault(graph, path, tags=None, subgraph=None, depth=1, workers=None):
+    """
+    Stream the vault, or the notes selected by tags/subgraph, into an
+    archive; returns the counts written. Raises ArchiveError if the
+    selection or archive type is invalid.
+    """
+    out = sys.stderr if path == "-" else sys.stdout
+    selected = select_notes(graph, tags, subgraph, depth)
+    data = graph.graph
+    notes = ((title, _note_file(note_data)) for title, note_data in data["notes"].items()
+             if selected is None or title in selected)
+    counts = {"notes": 0, "missing": 0}
+
+    tar, resources = _open_write(path)
+    try:
+        header = json.dumps({"format": FORMAT, "version": VERSION}).encode("utf-8")
+        _add_member(tar, HEADER_MEMBER, io.BytesIO(header), len(header))
+        with ThreadPoolExecutor(workers) as pool:
+            for (title, _), content in _ahead(pool, _read_note, notes):
+                if content is None:
+                    counts["missing"] += 1
+                    continue
+                _add_member(tar, f"{NOTES_PREFIX}{title}.na.md", io.BytesIO(content), len(content), {TITLE_HEADER: title})
+                counts["notes"] += 1
+        _add_spooled(tar, GRAPH_MEMBER, _graph_records(data, selected))
+        _add_spooled(tar, LOGS_MEMBER, _log_records(graph, selected))
+        tar.close()
+    finally:
+        _close(resources)
+
+    print(f"Exported {counts['notes']} notes to {path}.", file=out)
+    if counts["missing"]:
+        print(f"Skipped {counts['missing']} notes whose files are missing.", file=out)
+    return counts
+
+
+def _write_note(item):
+    path, content = item
+    with open(path, "wb") as f:
+        f.write(content)
+    metrics.count_io("note", "write", len(content))
+
+
+def _valid_title(title):
+    return bool(title) and title not in (".", "..") and os.path.basename(title) == title and "\0" not in title
+
+
+@metrics.timed("archive.import")
+def import_vault(graph, path, overwrite=False, workers=None):
+    """
+    Stream an archive into the vault: note files are written by a thread
+    pool and notes, links and tags are journaled in one batch. Notes that
+    already exist are kept unless overwrite. Returns the counts imported;
+    raises ArchiveError for archives that cannot be read.
+    """
+    counts = {"notes": 0, "skipped": 0, "links": 0, "tags": 0, "logs": 0}
+    tar, resources = _open_read(path)
+    try:
+        with graph.batch():
+            members = iter(tar)
+            first = next(members, None)
+            if first is None or first.name != HEADER_MEMBER:
+                raise ArchiveError(f"{path} is not a Sodium archive")
+            try:
+                header = json.load(tar.extractfile(first))
+            except (json.JSONDecodeError, UnicodeDecodeError) as e:
+                raise ArchiveError(f"Invalid {HEADER_MEMBER}: {e}") from None
+            version = header.get("version", 0) if isinstance(header, dict) else None
+            if not isinstance(header, dict) or header.get("format") != FORMAT or not _is_number(version) or version > VERSION:
+                raise ArchiveError(f"Unsupported archive format: {header}")
+
+            pending = deque()  # (title, note path, write future)
+            # One directory listing instead of a stat per imported note
+            files = set(os.listdir(graph.notes_dir))
+
+            def commit_written(keep=0):
+                ops = []
+                while len(pending) > keep:
+                    title, note_path, future = pending.popleft()
+                    future.result()
+                    ops.append(("note", (title, note_path)))
+                if ops:
+                    graph.transact(lambda _: ops)
+
+            with ThreadPoolExecutor(workers) as pool:
+                for member in members:
+                    if member.name.startswith(NOTES_PREFIX) and member.isfile():
+                        title = member.pax_headers.get(TITLE_HEADER) or os.path.basename(member.name).removesuffix(".na.md")
+                        if not _valid_title(title):
+                            counts["skipped"] += 1
+                            continue
+                        filename = f"{title}.na.md"
+                        if not overwrite and (title in graph.graph["notes"] or filename in files):
+                            counts["skipped"] += 1
+                            continue
+                        files.add(filename)
+                        note_path = os.path.join(graph.notes_dir, filename)
+                        content = tar.extractfile(member).read()
+                        pending.append((title, note_path, pool.submit(_write_note, (note_path, content))))
+                        counts["notes"] += 1
+                        if len(pending) >= 2 * WINDOW:
+                            commit_written(keep=WINDOW)
+                    elif member.name == GRAPH_MEMBER:
+                        commit_written()
+                        _import_graph_records(graph, tar.extractfile(member), counts)
+                    elif member.name == LOGS_MEMBER:
+                        _import_logs(graph, tar.extractfile(member), counts)
+                commit_written()
+    except (tarfile.TarError, EOFError) as e:
+        # What was read before a truncated or corrupt member stays imported
+        raise ArchiveError(f"{path} is damaged: {e}") from None
+    finally:
+        _close(resources)
+
+    print(
+        f"Imported {counts['notes']} notes, {counts['links']} links, {counts['tags']} tags "
+        f"and {counts['logs']} log entries from {path}."
+    )
+    if counts["skipped"]:
+        print(f"Skipped {counts['skipped']} notes that already exist or have invalid titles.")
+    return counts
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _is_pair(value):
+    return isinstance(value, list) and len(value) == 2 and all(isinstance(item, str) for item in value)
+
+
+def _records(stream, member):
+    """(line number, record) for each NDJSON object in an archive member."""
+    # Members of a streamed tar are not seekable, which rules out io.TextIOWrapper
+    for number, line in enumerate(iter(stream.readline, b""), 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            raise ArchiveError(f"Invalid record in {member} on line {number}: {e}") from None
+        if not isinstance(record, dict):
+            raise ArchiveError(f"Invalid record in {member} on line {number}: expected an object")
+        yield number, record
+
+
+def _import_graph_records(graph, stream, counts):
+    notes = graph.graph["notes"]
+    ops = []
+    for number, record in _records(stream, GRAPH_MEMBER):
+        if "ref" in record:
+            weight = record.get("weight", 1)
+            if not _is_pair(record["ref"]) or not isinstance(weight, int) or isinstance(weight, bool) or weight < 1:
+                raise ArchiveError(f"Invalid record in {GRAPH_MEMBER} on line {number}: expected a [source, target] ref and a positive weight")
+            source, target = record["ref"]
+            # Links the vault already has are kept as they are, so importing twice changes nothing
+            if source in notes and target in notes and target not in graph.index.outgoing(source):
+                # Each repetition of a link adds to its weight
+                ops.extend([("ref", (source, target))] * weight)
+                counts["links"] += 1
+        elif "tag" in record:
+            if not _is_pair(record["tag"]):
+                raise ArchiveError(f"Invalid record in {GRAPH_MEMBER} on line {number}: expected a [note, tag] pair")
+            note, tag = record["tag"]
+            if note in notes and tag not in graph.index.tags_of(note):
+                ops.append(("tag", (note, tag)))
+                counts["tags"] += 1
+        if len(ops) >= CHUNK:
+            graph.transact(lambda _, ops=ops: ops)
+            ops = []
+    if ops:
+        graph.transact(lambda _: ops)
+
+
+def _log_key(entry):
+    """(original time, title, text) of a stored entry; imports may have stamped it later than it was written."""
+    return entry.get("origin_ts", entry["ts"]), entry["title"], entry["text"]
+
+
+def _import_logs(graph, stream, counts):
+    existing = {"since": None, "keys": set()}
+    chunk = []
+    for number, record in _records(stream, LOGS_MEMBER):
+        ts, title, text = record.get("ts", 0.0), record.get("title"), record.get("text")
+        if not _is_number(ts) or not isinstance(title, str) or not isinstance(text, str):
+            raise ArchiveError(f"Invalid record in {LOGS_MEMBER} on line {number}: expected a numeric ts and string title and text")
+        chunk.append((ts, title, text))
+        if len(chunk) >= CHUNK:
+            _append_logs(graph.logs, chunk, counts, existing)
+            chunk = []
+    if chunk:
+        _append_logs(graph.logs, chunk, counts, existing)
+
+
+def _append_logs(logs, chunk, counts, existing):
+    """
+    Append a chunk of (ts, title, text) records, skipping entries the store
+    already has (from an earlier import of the same archive). Stored entries
+    are never older than their original time, so only those from the
+    chunk's oldest time on are read, once per import as archives are in
+    time order.
+    """
+    since = min(ts for ts, _, _ in chunk)
+    if existing["since"] is None or since < existing["since"]:
+        existing["keys"] = {_log_key(entry) for entry in logs.entries(since=since)}
+        existing["since"] = since
+    new = [entry for entry in chunk if entry not in existing["keys"]]
+    if new:
+        logs.append_many([(title, text) for _, title, text in new], [ts for ts, _, _ in new])
+        counts["logs"] += len(new)
@@ -0,0 +1,67 @@
+import io
+import json
+import contextlib
+
+# op -> (Graph method, field names of its arguments), mirroring the CLI subcommands
+OPERATIONS = {
+    "new": ("create_note", ("title",)),
+    "link": ("create_link", ("note1", "note2")),
+    "ref": ("create_ref", ("note1", "note2")),
+    "tag": ("add_tag", ("note", "tag")),
+    "log": ("add_log", ("title", "log")),
+    "remove": ("remove_note", ("title",)),
+}
+
+
+def apply_operation(graph, operation):
+    """Run one operation dict against graph; returns (ok, message)."""
+    if not isinstance(operation, dict):
+        return False, "Operation must be a JSON object"
+    op = operation.get("op")
+    if op not in OPERATIONS:
+        return False, f"Unknown operation: {op!r}"
+    method, fields = OPERATIONS[op]
+    missing = [field for field in fields if not isinstance(operation.get(field), str)]
+    if missing:
+        return False, f"Missing or non-string field(s): {', '.join(missing)}"
+
+    output = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(output):
+            ok = getattr(graph, method)(*(operation[field] for field in fields))
+    except Exception as e:
+        # e.g. a title that is not a valid file name; the other lines still run
+        return False, f"{type(e).__name__}: {e}"
+    return bool(ok), output.getvalue().strip()
+
+
+def run_batch(graph, lines, out):
+    """
+    Apply newline-delimited JSON operations, e.g.
+
+        {"op": "new", "title": "Ideas"}
+        {"op": "link", "note1": "Ideas", "note2": "Projects"}
+        {"op": "tag", "note": "Ideas", "tag": "draft"}
+
+    against graph in a single batch, so everything is journaled with one
+    flush at the end. One JSON result per input line is written to out:
+    {"line": n, "op": ..., "ok": true/false, "message": ...}. Blank lines are
+    skipped. Returns the number of failed operations.
+    """
+    failed = 0
+    with graph.batch():
+        for number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                operation = json.loads(line)
+            except json.JSONDecodeError as e:
+                operation, ok, message = {}, False, f"Invalid JSON: {e}"
+            else:
+                ok, message = apply_operation(graph, operation)
+            if not ok:
+                failed += 1
+            op = operation.get("op") if isinstance(operation, dict) else None
+            out.write(json.dumps({"line": number, "op": op, "ok": ok, "message": message}) + "\n")
+    out.flush()
+    return failed
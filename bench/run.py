@@ -0,0 +1,355 @@
+"""
+Benchmark the Graph, analysis and web hot paths and CLI startup against a
+synthetic vault.
+
+    python bench/run.py --notes 2000 --out results.json
+    python bench/run.py --notes 2000 --save-baseline bench/baseline.json
+    python bench/run.py --notes 2000 --baseline bench/baseline.json
+
+Results are JSON: per benchmark the iteration count, mean and p50/p95/p99
+latency in ms, throughput and peak traced memory. With --baseline the run
+exits non-zero if any benchmark's p50 regressed by more than --tolerance.
+"""
+import os
+import io
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+import warnings
+import contextlib
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from vaultgen import generate_vault
+
+# Differences below this many milliseconds are treated as noise when comparing.
+NOISE_FLOOR_MS = 1.0
+
+
+def percentile(sorted_values, q):
+    index = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def measure(fn, repeat, setup=None):
+    """
+    Time fn(state) repeat times, with state = setup() prepared outside the
+    timed region, then run it once more under tracemalloc for peak memory.
+    """
+    timings = []
+    for _ in range(repeat):
+        state = setup() if setup else None
+        with quiet():
+            start = time.perf_counter()
+            fn(state)
+            timings.append(time.perf_counter() - start)
+
+    state = setup() if setup else None
+    tracemalloc.start()
+    with quiet():
+        fn(state)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    timings.sort()
+    total = sum(timings)
+    return {
+        "n": len(timings),
+        "mean_ms": total / len(timings) * 1000,
+        "p50_ms": percentile(timings, 0.50) * 1000,
+        "p95_ms": percentile(timings, 0.95) * 1000,
+        "p99_ms": percentile(timings, 0.99) * 1000,
+        "ops_per_s": len(timings) / total if total else float("inf"),
+        "peak_kb": peak / 1024,
+    }
+
+
+@contextlib.contextmanager
+def quiet():
+    """Silence the CLI-style prints and plotting warnings of the code under test."""
+    with contextlib.redirect_stdout(io.StringIO()), warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        yield
+
+
+class Cycle:
+    """Endless round-robin over a list, for benchmarks that need a different argument each call."""
+
+    def __init__(self, items):
+        self.items = list(items)
+        self.position = 0
+
+    def __call__(self):
+        item = self.items[self.position % len(self.items)]
+        self.position += 1
+        return item
+
+
+def make_vault(args, workdir, name, **kwargs):
+    return generate_vault(
+        os.path.join(workdir, name), args.notes, args.links_per_note, args.tags,
+        args.tags_per_note, args.note_words, args.logs, seed=args.seed, **kwargs
+    )
+
+
+def prepare(args, workdir):
+    """Generate and initialise the main vault shared by all benchmark groups."""
+    from graph import Graph
+
+    graph_file, notes_dir = make_vault(args, workdir, "main")
+    with quiet():
+        g = Graph(graph_file, notes_dir)
+        g.init_graph()
+    return g
+
+
+def graph_benchmarks(args, workdir, g):
+    from graph import Graph, migrate_graph
+    from archive import export_vault, import_vault
+
+    graph_file, notes_dir = g.storage_file, g.notes_dir
+    snap_file = os.path.join(workdir, "main", "graph-copy.snap")
+    with quiet():
+        migrate_graph(graph_file, snap_file)
+    _, raw_notes_dir = make_vault(args, workdir, "raw", write_graph=False)
+    removal_graph_file, removal_notes_dir = make_vault(args, workdir, "removal")
+    titles = sorted(g.graph["notes"])
+    runs = iter(range(10 ** 9))
+
+    def fresh_raw_copy():
+        target = os.path.join(workdir, f"init-{next(runs)}")
+        shutil.copytree(raw_notes_dir, os.path.join(target, "notes"))
+        return os.path.join(target, "graph.json"), os.path.join(target, "notes")
+
+    def fresh_import_target():
+        target = os.path.join(workdir, f"import-{next(runs)}")
+        return Graph(os.path.join(target, "graph.json"), os.path.join(target, "notes"))
+
+    def without_search_index():
+        for suffix in ("index.db", "index.db-wal", "index.db-shm"):
+            if os.path.exists(g.sidecar_path(suffix)):
+                os.remove(g.sidecar_path(suffix))
+        return Graph(graph_file, notes_dir)
+
+    queries = Cycle(["graph", "knowledge index", '"research draft"', "proj*", "nonexistentword"])
+    backlink_titles = Cycle(titles)
+    # Prefixes and one-typo variants of existing titles, as typed into a completion box
+    completions = Cycle(q for title in titles[::max(1, len(titles) // 50)] for q in (title[:3], title[1:]))
+    removal_graph = Graph(removal_graph_file, removal_notes_dir)
+    removal_titles = Cycle(sorted(removal_graph.graph["notes"]))
+    repeat = args.repeat
+    archive_file = os.path.join(workdir, "vault.tar.gz")
+    with quiet():
+        export_vault(g, archive_file)
+
+    return {
+        "graph.load_graph": measure(lambda _: Graph(graph_file, notes_dir).graph, repeat),
+        "graph.load_graph.snap": measure(lambda _: Graph(snap_file, notes_dir).graph, repeat),
+        "graph.save_graph": measure(lambda _: g.save_graph(), repeat),
+        "graph.init_graph": measure(lambda paths: Graph(*paths).init_graph(), max(1, repeat // 5), fresh_raw_copy),
+        "graph.init_graph.incremental": measure(lambda _: g.init_graph(incremental=True), max(1, repeat // 5)),
+        "graph.auto_create_links": measure(lambda _: g.auto_create_links(), max(1, repeat // 5)),
+        "graph.search_notes.cold": measure(lambda graph: graph.search_notes("graph"), max(1, repeat // 5), without_search_index),
+        "graph.search_notes": measure(lambda query: g.search_notes(query), repeat * 5, queries),
+        "graph.search_notes.new_graph": measure(lambda query: Graph(graph_file, notes_dir).search_notes(query), repeat, queries),
+        "graph.list_backlinks": measure(lambda title: g.list_backlinks(title), repeat * 20, backlink_titles),
+        "graph.find_notes": measure(lambda query: g.find_notes(query), repeat * 20, completions),
+        "archive.export": measure(lambda _: export_vault(g, archive_file), max(1, repeat // 5)),
+        "archive.import": measure(lambda graph: import_vault(graph, archive_file), max(1, repeat // 5), fresh_import_target),
+        "graph.remove_note": measure(lambda title: removal_graph.remove_note(title), min(repeat * 5, args.notes - 1), removal_titles),
+    }
+
+
+def analysis_benchmarks(args, graph_file):
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import analysis
+    from graph import sidecar_path
+
+    def analyse(flag):
+        analysis.analyse(graph_file, flag, k=args.betweenness_k)
+        plt.close("all")
+
+    def drop_centrality_cache():
+        cache = sidecar_path(graph_file, "centrality.json")
+        if os.path.exists(cache):
+            os.remove(cache)
+
+    repeat = max(1, args.repeat // 5)
+    return {
+        "analysis.analyse.viz": measure(lambda _: analyse("viz"), repeat),
+        "analysis.analyse.cen.uncached": measure(lambda _: analyse("cen"), repeat, drop_centrality_cache),
+        "analysis.analyse.cen": measure(lambda _: analyse("cen"), repeat),
+        "analysis.analyse.hmap": measure(lambda _: analyse("hmap"), repeat),
+    }
+
+
+def route_benchmarks(args, graph_file, notes_dir, titles):
+    os.environ["GRAPH_FILE"] = graph_file
+    os.environ["NOTES_DIR"] = notes_dir
+    os.environ["SODIUM_WATCH"] = "0"
+    with quiet():
+        import server
+    client = server.app.test_client()
+
+    def get(url):
+        response = client.get(url)
+        response.get_data()
+        if response.status_code >= 400:
+            raise RuntimeError(f"GET {url} returned {response.status_code}")
+        return response
+
+    def get_image(url):
+        """Images not rendered yet come back as 202 with a job to poll."""
+        response = get(url)
+        while response.status_code == 202:
+            while client.get(response.json["status"]).json["state"] not in ("done", "failed"):
+                time.sleep(0.05)
+            response = get(url)
+
+    note_urls = Cycle(f"/note/{title}" for title in titles)
+    subgraph_urls = Cycle(f"/api/subgraph/{title}?depth=2" for title in titles)
+    repeat = args.repeat * 5
+    return {
+        "route.index": measure(lambda _: get("/"), repeat),
+        "route.view_note": measure(get, repeat, note_urls),
+        "route.search": measure(lambda _: get("/search?q=knowledge"), repeat),
+        "route.api_notes": measure(lambda _: get("/api/notes?limit=500"), repeat),
+        "route.api_subgraph": measure(get, repeat, subgraph_urls),
+        "route.api_complete": measure(lambda _: get("/api/complete?q=know"), repeat),
+        "route.graph_viz_png": measure(lambda _: get_image("/graph/viz.png"), args.repeat),
+    }
+
+
+def startup_benchmarks(args, graph_file, notes_dir, titles):
+    """Wall time of whole CLI invocations, i.e. interpreter start, imports and the command."""
+    main_py = os.path.join(os.path.dirname(BENCH_DIR), "main.py")
+    env = dict(os.environ, GRAPH_FILE=graph_file, NOTES_DIR=notes_dir)
+
+    def cli(*argv):
+        subprocess.run([sys.executable, main_py, *argv], env=env, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def python_only(_):
+        subprocess.run([sys.executable, "-c", "pass"], check=True)
+
+    note_titles = Cycle(titles)
+    repeat = args.repeat
+    return {
+        "startup.python": measure(python_only, repeat),
+        "startup.help": measure(lambda _: cli("--help"), repeat),
+        "startup.list": measure(lambda title: cli("list", title), repeat, note_titles),
+        "startup.backlinks": measure(lambda title: cli("backlinks", title), repeat, note_titles),
+        "startup.tag": measure(lambda title: cli("tag", title, "bench"), repeat, note_titles),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Return a list of human-readable regressions of results against baseline."""
+    regressions = []
+    for name, stats in results["benchmarks"].items():
+        base = baseline.get("benchmarks", {}).get(name)
+        if base is None:
+            continue
+        limit = base["p50_ms"] * (1 + tolerance)
+        if stats["p50_ms"] > limit and stats["p50_ms"] - base["p50_ms"] > NOISE_FLOOR_MS:
+            regressions.append(f"{name}: p50 {stats['p50_ms']:.2f} ms vs baseline {base['p50_ms']:.2f} ms")
+    return regressions
+
+
+def print_table(results):
+    print(f"{'benchmark':34} {'n':>5} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'ops/s':>10} {'peak KB':>10}", file=sys.stderr)
+    for name, s in results["benchmarks"].items():
+        print(f"{name:34} {s['n']:>5} {s['p50_ms']:>10.2f} {s['p95_ms']:>10.2f} {s['p99_ms']:>10.2f} "
+              f"{s['ops_per_s']:>10.1f} {s['peak_kb']:>10.0f}", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sodium benchmark suite")
+    parser.add_argument("--notes", type=int, default=1000)
+    parser.add_argument("--links-per-note", type=int, default=5)
+    parser.add_argument("--tags", type=int, default=50)
+    parser.add_argument("--tags-per-note", type=int, default=2)
+    parser.add_argument("--note-words", type=int, default=200)
+    parser.add_argument("--logs", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=10, help="Base iteration count; cheap benchmarks run more")
+    parser.add_argument("--betweenness-k", type=int, default=None, help="Sampled betweenness for the cen benchmarks")
+    parser.add_argument("--only", choices=["graph", "analysis", "routes", "startup"], action="append",
+                        help="Run only these groups (repeatable)")
+    parser.add_argument("--out", help="Write results JSON here instead of stdout")
+    parser.add_argument("--baseline", help="Compare against this results file")
+    parser.add_argument("--save-baseline", help="Also write the results to this baseline file")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed p50 slowdown before failing")
+    parser.add_argument("--keep", action="store_true", help="Keep the generated vaults")
+    args = parser.parse_args()
+    groups = args.only or ["graph", "analysis", "routes", "startup"]
+
+    workdir = tempfile.mkdtemp(prefix="sodium-bench-")
+    try:
+        g = prepare(args, workdir)
+        benchmarks = {}
+        if "graph" in groups:
+            benchmarks.update(graph_benchmarks(args, workdir, g))
+        if "analysis" in groups:
+            benchmarks.update(analysis_benchmarks(args, g.storage_file))
+        if "routes" in groups:
+            benchmarks.update(route_benchmarks(args, g.storage_file, g.notes_dir, sorted(g.graph["notes"])))
+        if "startup" in groups:
+            benchmarks.update(startup_benchmarks(args, g.storage_file, g.notes_dir, sorted(g.graph["notes"])))
+    finally:
+        if args.keep:
+            print(f"Vaults kept in {workdir}", file=sys.stderr)
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    results = {
+        "meta": {
+            "notes": args.notes,
+            "links_per_note": args.links_per_note,
+            "tags": args.tags,
+            "tags_per_note": args.tags_per_note,
+            "note_words": args.note_words,
+            "logs": args.logs,
+            "seed": args.seed,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "benchmarks": benchmarks,
+    }
+    print_table(results)
+
+    output = json.dumps(results, indent=4)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            f.write(output)
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        if baseline.get("meta", {}).get("notes") != args.notes:
+            print("Warning: baseline was recorded with a different vault size.", file=sys.stderr)
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
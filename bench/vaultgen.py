@@ -0,0 +1,87 @@
+"""Generate synthetic Sodium vaults for benchmarking."""
+import os
+import sys
+import json
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from log_store import LogStore
+
+WORDS = (
+    "graph note link tag idea memory brain system knowledge index search query "
+    "vault journal entry thought project research draft summary concept theory "
+    "method result question answer source quote reference design pattern data"
+).split()
+
+
+def generate_vault(root, notes=1000, links_per_note=5, tags=50, tags_per_note=2,
+                   note_words=200, logs=100, zipf=1.2, seed=0, write_graph=True):
+    """
+    Write a vault under root: root/notes/*.na.md, root/graph.json and the
+    log store root/graph.logs/.
+
+    Link targets and tags are drawn from a Zipf-like distribution (exponent
+    zipf) so that a few notes and tags are very popular, as in real vaults.
+    Every link also appears as a [[wiki]] reference in the source note, so
+    init_graph rediscovers the same structure. With write_graph=False only the
+    note files are written, for benchmarking init from scratch.
+    Returns (graph_file, notes_dir).
+    """
+    rng = random.Random(seed)
+    notes_dir = os.path.join(root, "notes")
+    os.makedirs(notes_dir, exist_ok=True)
+    titles = [f"Note {i:06d}" for i in range(notes)]
+    tag_names = [f"tag{i}" for i in range(tags)]
+    note_weights = [1 / (i + 1) ** zipf for i in range(notes)]
+    tag_weights = [1 / (i + 1) ** zipf for i in range(tags)]
+
+    data = {"notes": {}, "links": {}, "tags": {}}
+    for title in titles:
+        path = os.path.join(notes_dir, f"{title}.na.md")
+        targets = [t for t in rng.choices(titles, note_weights, k=links_per_note) if t != title]
+        body = " ".join(rng.choice(WORDS) for _ in range(note_words))
+        with open(path, "w") as f:
+            f.write(f"# {title}\n\n{body}\n")
+            for target in targets:
+                f.write(f"\n[[{target}]]\n")
+        data["notes"][title] = path
+        for target in dict.fromkeys(targets):
+            data["links"].setdefault(title, []).append(target)
+            data["links"].setdefault(target, []).append(title)
+        if tag_names:
+            for tag in set(rng.choices(tag_names, tag_weights, k=tags_per_note)):
+                data["tags"].setdefault(tag, []).append(title)
+
+    graph_file = os.path.join(root, "graph.json")
+    if write_graph:
+        with open(graph_file, "w") as f:
+            json.dump(data, f)
+        if logs:
+            LogStore(os.path.join(root, "graph.logs")).append_many(
+                [(f"log {i}", " ".join(rng.choice(WORDS) for _ in range(20))) for i in range(logs)]
+            )
+    return graph_file, notes_dir
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic Sodium vault")
+    parser.add_argument("root", help="Directory to create the vault in")
+    parser.add_argument("--notes", type=int, default=1000)
+    parser.add_argument("--links-per-note", type=int, default=5)
+    parser.add_argument("--tags", type=int, default=50)
+    parser.add_argument("--tags-per-note", type=int, default=2)
+    parser.add_argument("--note-words", type=int, default=200)
+    parser.add_argument("--logs", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    graph_file, notes_dir = generate_vault(
+        args.root, args.notes, args.links_per_note, args.tags, args.tags_per_note,
+        args.note_words, args.logs, seed=args.seed,
+    )
+    print(f"Wrote {args.notes} notes to {notes_dir} and {graph_file}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
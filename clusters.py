@@ -0,0 +1,200 @@
+import os
+import json
+import hashlib
+from collections import Counter, deque
+from graph import read_graph, sidecar_path, graph_version
+from journal import atomic_write_json
+from metrics import timed
+
+METHODS = ("louvain", "lpa")
+# Above this fraction of notes with changed links, recompute from scratch.
+INCREMENTAL_MAX_CHANGED = 0.05
+
+_loaded = {}
+
+
+def detect_communities(G, method="louvain", seed=0):
+    """Community detection on an undirected NetworkX graph. Ids are numbered by decreasing size."""
+    import networkx as nx
+
+    if method == "louvain":
+        communities = nx.community.louvain_communities(G, seed=seed)
+    elif method == "lpa":
+        communities = nx.community.label_propagation_communities(G)
+    else:
+        raise ValueError(f"Unknown clustering method: {method}")
+    communities = sorted(communities, key=lambda members: (-len(members), min(members)))
+    return {note: cid for cid, members in enumerate(communities) for note in members}
+
+
+def _adjacency(notes, links):
+    adjacency = {note: set() for note in notes}
+    for source, targets in links.items():
+        for target in targets:
+            if source != target and source in adjacency and target in adjacency:
+                adjacency[source].add(target)
+                adjacency[target].add(source)
+    return adjacency
+
+
+def _fingerprint(neighbors):
+    return hashlib.blake2b("\0".join(sorted(neighbors)).encode("utf-8"), digest_size=8).hexdigest()
+
+
+def _propagate(adjacency, labels, seeds):
+    """
+    Label propagation restricted to the notes around seeds: a note takes the
+    most common label among its neighbors and, when it changes, queues its
+    neighbors. Everything the seeds do not reach keeps its previous label.
+    """
+    queue = deque(seeds)
+    queued = set(seeds)
+    budget = 20 * len(queued) + 1000  # guarantees termination on oscillating labels
+    while queue and budget:
+        budget -= 1
+        note = queue.popleft()
+        queued.discard(note)
+        counts = Counter(labels[neighbor] for neighbor in adjacency[note])
+        if not counts:
+            continue
+        best = max(counts.values())
+        if counts.get(labels[note]) == best:
+            continue
+        labels[note] = min(label for label, count in counts.items() if count == best)
+        for neighbor in adjacency[note]:
+            if neighbor not in queued:
+                queued.add(neighbor)
+                queue.append(neighbor)
+
+
+@timed("clusters.compute")
+def compute_clusters(notes, links, previous=None, method="louvain", seed=0):
+    """
+    Community id per note, as {"method", "communities", "fingerprints",
+    "incremental"}. With a previous result for the same method, only notes
+    whose links changed (by neighbor fingerprint) and their surroundings are
+    relabelled, as long as few of them did; otherwise detection runs from scratch.
+    """
+    adjacency = _adjacency(notes, links)
+    fingerprints = {note: _fingerprint(neighbors) for note, neighbors in adjacency.items()}
+
+    if previous and previous.get("method") == method:
+        old_communities = previous.get("communities", {})
+        old_fingerprints = previous.get("fingerprints", {})
+        changed = [note for note, digest in fingerprints.items() if old_fingerprints.get(note) != digest]
+        removed = old_fingerprints.keys() - fingerprints.keys()
+        if len(changed) + len(removed) <= INCREMENTAL_MAX_CHANGED * max(len(fingerprints), 1):
+            labels = {note: old_communities[note] for note in adjacency if note in old_communities}
+            next_id = max(old_communities.values(), default=-1) + 1
+            for note in adjacency:
+                if note not in labels:
+                    labels[note] = next_id
+                    next_id += 1
+            # Neighbors of removed notes lost a link, so they are among the changed notes
+            seeds = set(changed)
+            for note in changed:
+                seeds.update(adjacency[note])
+            _propagate(adjacency, labels, seeds)
+            return {"method": method, "communities": labels, "fingerprints": fingerprints, "incremental": True}
+
+    import networkx as nx
+
+    G = nx.Graph()
+    G.add_nodes_from(adjacency)
+    G.add_edges_from((note, neighbor) for note, neighbors in adjacency.items() for neighbor in neighbors)
+    communities = detect_communities(G, method, seed)
+    return {"method": method, "communities": communities, "fingerprints": fingerprints, "incremental": False}
+
+
+def load_clusters(file_path):
+    """The persisted clustering in graph.clusters.json, or None. Reread only when the file changes."""
+    path = sidecar_path(file_path, "clusters.json")
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    stamp = (st.st_ino, st.st_mtime_ns, st.st_size)
+    cached = _loaded.get(path)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    with open(path, "r") as f:
+        try:
+            result = json.load(f)
+        except json.JSONDecodeError:
+            return None
+    _loaded[path] = (stamp, result)
+    return result
+
+
+def _cluster_job(file_path, version, notes, links, method):
+    """Compute and persist clusters for one graph version (runs in the worker process)."""
+    result = compute_clusters(notes, links, load_clusters(file_path), method)
+    result["version"] = version
+    atomic_write_json(sidecar_path(file_path, "clusters.json"), result)
+    return result
+
+
+def _snapshot(data):
+    return list(data["notes"]), {source: list(targets) for source, targets in data["links"].items()}
+
+
+def cluster_async(file_path, data, job_queue, method="louvain", version=None):
+    """
+    The persisted clustering, scheduling a recompute on job_queue (a
+    jobs.JobQueue) if it is missing or was made for another graph version.
+    Returns (clusters or None, current), where current is False while it is
+    stale. Callers must hold whatever lock protects data while this copies it.
+    """
+    from jobs import QueueFull
+
+    if version is None:
+        version = graph_version(data)
+    saved = load_clusters(file_path)
+    if saved and saved.get("version") == version and saved.get("method") == method:
+        return saved, True
+    try:
+        job_queue.submit(_cluster_job, file_path, version, *_snapshot(data), method,
+                         key=("clusters", file_path), name="clusters")
+    except QueueFull:
+        pass  # the next request tries again
+    return saved, False
+
+
+def cached_clusters(file_path, data=None, method="louvain"):
+    """
+    Clusters for the current graph version, computing them in this process
+    if needed (the CLI waits for them anyway; the server uses cluster_async).
+    """
+    if data is None:
+        data = read_graph(file_path)
+    version = graph_version(data)
+    saved = load_clusters(file_path)
+    if saved and saved.get("version") == version and saved.get("method") == method:
+        return saved
+    return _cluster_job(file_path, version, *_snapshot(data), method)
+
+
+def group_clusters(communities):
+    """{community id: sorted member titles}, largest community first."""
+    groups = {}
+    for note, cid in communities.items():
+        groups.setdefault(cid, []).append(note)
+    return dict(sorted(((cid, sorted(members)) for cid, members in groups.items()), key=lambda item: (-len(item[1]), item[0])))
+
+
+def show_clusters(file_path, note=None, method="louvain", top=20):
+    """Print the largest clusters, or the cluster a note belongs to."""
+    result = cached_clusters(file_path, method=method)
+    communities = result["communities"]
+    groups = group_clusters(communities)
+    if note is not None:
+        if note not in communities:
+            print(f"Note '{note}' does not exist.")
+            return
+        cid = communities[note]
+        print(f"{note} is in cluster {cid} ({len(groups[cid])} notes): {', '.join(groups[cid])}")
+        return
+    print(f"{len(groups)} clusters ({method}{', updated incrementally' if result.get('incremental') else ''})")
+    for cid, members in list(groups.items())[:top]:
+        shown = ", ".join(members[:10]) + (", ..." if len(members) > 10 else "")
+        print(f"  #{cid} ({len(members)} notes): {shown}")
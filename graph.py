@@ -1,127 +1,593 @@
 import os
-import json
 import re
+import json
+import hashlib
+import threading
+from contextlib import contextmanager, suppress
+from itertools import islice
+import metrics
+from search_index import SearchIndex, log_position
+from journal import Journal, apply_op, atomic_write_json, atomic_write_text
+from locking import FileLock
+from log_store import LogStore
+from title_index import TitleIndex
+
+LINK_PATTERN = re.compile(r'\[\[(.*?)\]\]')
+# A line holding nothing but a [[wiki]] reference, as appended by create_link
+FOOTER_LINK = re.compile(r'\[\[[^\[\]\n]*\]\]')
+
+
+def sidecar_path(storage_file, suffix):
+    """Path of a file kept next to the graph file, e.g. graph.index.json."""
+    base, _ = os.path.splitext(storage_file)
+    return f"{base}.{suffix}"
+
+
+def file_digest(path):
+    """SHA-1 of a note file, or None if it is gone."""
+    try:
+        with open(path, "rb") as f:
+            raw = f.read()
+    except FileNotFoundError:
+        return None
+    metrics.count_io("note", "read", len(raw))
+    return hashlib.sha1(raw).hexdigest()
+
+
+def scan_note(path):
+    """Fingerprint a note file and extract its [[wiki]] references (runs in worker processes)."""
+    try:
+        st = os.stat(path)
+        with open(path, "rb") as f:
+            raw = f.read()
+    except FileNotFoundError:
+        return None
+    metrics.count_io("note", "read", len(raw))
+    digest = hashlib.sha1(raw).hexdigest()
+    links = LINK_PATTERN.findall(raw.decode("utf-8", errors="replace"))
+    return [st.st_mtime_ns, st.st_size, digest, links]
+
+
+def graph_version(data):
+    """Cache key for derived results: the journal version plus the graph's size."""
+    links = data["links"]
+    n_links = links.value_count() if hasattr(links, "value_count") else sum(len(targets) for targets in links.values())
+    return f"{data.get('version', 0)}-{len(data['notes'])}-{n_links}"
+
+
+SQLITE_SUFFIXES = (".db", ".sqlite", ".sqlite3")
+SNAPSHOT_SUFFIXES = (".snap",)
+
+
+def open_store(storage_file):
+    """
+    Storage backend for a graph file: SQLite for .db/.sqlite/.sqlite3 files,
+    otherwise a snapshot with an append-only journal; the snapshot is binary
+    and memory-mapped for .snap files and JSON for anything else.
+    """
+    if storage_file.endswith(SQLITE_SUFFIXES):
+        from sqlite_store import SqliteStore
+        return SqliteStore(storage_file)
+    return Journal(storage_file, sidecar_path(storage_file, "journal"), binary=storage_file.endswith(SNAPSHOT_SUFFIXES))
+
+
+def read_graph(storage_file):
+    """Load graph data from any backend without constructing a Graph."""
+    return open_store(storage_file).load()
+
+
+def migrate_graph(source_file, target_file):
+    """Copy a graph and its log entries between backends, e.g. graph.json -> graph.db."""
+    data = read_graph(source_file)
+    open_store(target_file).compact(data)
+    copied = migrate_logs(sidecar_path(source_file, "logs"), sidecar_path(target_file, "logs"))
+    print(f"Migrated {len(data['notes'])} notes and {copied} log entries from {source_file} to {target_file}")
+
+
+def migrate_logs(source_dir, target_dir, chunk=1000):
+    """
+    Copy the entries of one LogStore into another that is still empty,
+    keeping their timestamps. Returns the number of entries copied.
+    """
+    if os.path.abspath(source_dir) == os.path.abspath(target_dir) or not os.path.isdir(source_dir):
+        return 0
+    target = LogStore(target_dir)
+    if target.end() != [0, 0]:
+        print(f"{target_dir} already has log entries; not copying logs.")
+        return 0
+    copied = 0
+    entries = LogStore(source_dir).entries()
+    while batch := list(islice(entries, chunk)):
+        # Given the original times, the clamped stamps come out as the source's ts again
+        times = [entry.get("origin_ts", entry["ts"]) for entry in batch]
+        copied += len(target.append_many([(entry["title"], entry["text"]) for entry in batch], times))
+    return copied
+
+
+def init_vault(storage_file, notes_dir, incremental=True):
+    """Run init in a separate process (e.g. a server job); other processes pick the changes up via refresh()."""
+    import io
+    import contextlib
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        g = Graph(storage_file, notes_dir)
+        g.init_graph(incremental=incremental)
+    return {"notes": len(g.graph["notes"])}
+
+
+class GraphConflict(RuntimeError):
+    """Raised when Graph.transact keeps losing the race against other writers."""
+
+
+class GraphIndex:
+    """
+    Lookup structures derived from graph["links"] and graph["tags"]: forward and
+    reverse adjacency sets plus a note -> tags map. The JSON lists stay the
+    source of truth on disk; these are rebuilt on load and kept in sync by apply_op.
+    """
+
+    def __init__(self, data):
+        self.forward = {}
+        self.reverse = {}
+        self.note_tags = {}
+        for note, links in data.get("links", {}).items():
+            for target in links:
+                self.add_link(note, target)
+        for tag, notes in data.get("tags", {}).items():
+            for note in notes:
+                self.add_tag(note, tag)
+
+    def add_link(self, source, target):
+        self.forward.setdefault(source, set()).add(target)
+        self.reverse.setdefault(target, set()).add(source)
+
+    def remove_link(self, source, target):
+        self.forward.get(source, set()).discard(target)
+        self.reverse.get(target, set()).discard(source)
+
+    def add_tag(self, note, tag):
+        self.note_tags.setdefault(note, set()).add(tag)
+
+    def outgoing(self, note):
+        return self.forward.get(note, set())
+
+    def incoming(self, note):
+        return self.reverse.get(note, set())
+
+    def tags_of(self, note):
+        return self.note_tags.get(note, set())
+
+    def remove_note(self, note):
+        for target in self.forward.pop(note, ()):
+            self.reverse.get(target, set()).discard(note)
+        for source in self.reverse.pop(note, ()):
+            self.forward.get(source, set()).discard(note)
+        self.note_tags.pop(note, None)
+
 
 class Graph:
+    # Fold the journal into graph.json after this many appended operations.
+    COMPACT_EVERY = 1000
+    # Below this many changed files, init parses serially instead of starting a process pool.
+    PARALLEL_SCAN_MIN = 64
+    # How often Graph.transact recomputes a plan that was invalidated by another writer.
+    TRANSACT_RETRIES = 10
+
     def __init__(self, storage_file, notes_dir):
         self.storage_file = storage_file
         self.notes_dir = notes_dir
         os.makedirs(self.notes_dir, exist_ok=True)
-        self.graph = self.load_graph()
-
+        self.store = open_store(storage_file)
+        # lock guards the in-memory graph; file_lock (graph.lock) serializes writers across processes.
+        # Writers take file_lock first, so readers never wait on lock while a writer waits for another process.
+        self.lock = threading.RLock()
+        self.file_lock = FileLock(self.sidecar_path("lock"))
+        self._graph = None
+        self._index = None
+        self._search_index = None
+        self._logs = None
+        self._query = None
+        self._titles = None
+        self._batch = None
+
+    def sidecar_path(self, suffix):
+        """Path of a file kept next to the graph file, e.g. graph.index.json."""
+        return sidecar_path(self.storage_file, suffix)
+
+    @property
+    def search_index(self):
+        """Full-text index (graph.index.db), opened on first use."""
+        if self._search_index is None:
+            with self.lock:
+                if self._search_index is None:
+                    with suppress(FileNotFoundError):
+                        os.remove(self.sidecar_path("index.json"))  # the JSON index of older versions
+                    self._search_index = SearchIndex(self.sidecar_path("index.db"))
+        return self._search_index
+
+    @property
+    def logs(self):
+        """LogStore holding log entries (graph.logs/); logging never loads or writes the graph."""
+        if self._logs is None:
+            self._logs = LogStore(self.sidecar_path("logs"))
+        return self._logs
+
+    @property
+    def query(self):
+        """GraphQuery (CSR adjacency) over the current graph, rebuilt when the graph version changes."""
+        from query import GraphQuery  # numpy is only needed for relationship queries
+
+        with self.lock:
+            if self._query is None or self._query.version != self.version:
+                self._query = GraphQuery(self.graph)
+            return self._query
+
+    @property
+    def titles(self):
+        """
+        TitleIndex for completing note titles. Built on first use and updated
+        by each note and remove operation; changes from other processes are
+        reconciled when the graph version has moved past it.
+        """
+        with self.lock:
+            self.refresh()
+            if self._titles is None:
+                self._titles = TitleIndex(self.graph["notes"], self.version)
+            elif self._titles.version != self.version:
+                self._titles.sync(self.graph["notes"], self.version)
+            return self._titles
+
+    @property
+    def graph(self):
+        """The graph dict, loaded from storage on first use."""
+        if self._graph is None:
+            with self.lock:
+                if self._graph is None:
+                    self._load()
+        return self._graph
+
+    @property
+    def index(self):
+        """GraphIndex over the graph, built on first use; a lazily decoded snapshot stays undecoded until then."""
+        if self._index is None:
+            with self.lock:
+                if self._index is None:
+                    self._index = GraphIndex(self.graph)
+        return self._index
+
+    def _load(self):
+        self._graph = self.load_graph()
+        self._index = None
+        legacy = self._graph.pop("logs", None)
+        if legacy:
+            # Older versions kept logs in the graph; move them to the log store once
+            stamp = os.path.getmtime(self.storage_file) if os.path.exists(self.storage_file) else 0.0
+            self.logs.import_legacy(legacy, stamp)
+
+    @metrics.timed("graph.load")
     def load_graph(self):
-        """Load graph from storage file."""
-        if os.path.exists(self.storage_file):
-            with open(self.storage_file, "r") as f:
-                data = json.load(f)
-                if not isinstance(data, dict):  # ✅ Ensure it's a dictionary
-                    data = {"notes": {}, "links": {}, "tags": {}}
-                return data
-        return {"notes": {}, "links": {}, "tags": {}}
-
+        """Load graph from storage file, replaying any journaled operations."""
+        return self.store.load()
 
+    @metrics.timed("graph.refresh")
+    def refresh(self):
+        """
+        Pick up changes other processes made to the graph file or journal.
+        Only the journal tail is replayed unless the snapshot itself was replaced.
+        Returns True if anything changed.
+        """
+        with self.lock:
+            if self._graph is None:
+                return False  # nothing loaded yet, so nothing can be stale
+            if self._batch is not None:
+                return False  # a batch holds the file lock, so no one else can have written
+            applied = self.store.catch_up(self._graph, self._index)
+            if applied is None:
+                self._load()
+                return True
+            return applied > 0
+
+    @metrics.timed("graph.save")
     def save_graph(self):
-        """Save graph to file."""
-        with open(self.storage_file, "w") as f:
-            json.dump(self.graph, f, indent=4)
+        """Compact: write the whole graph as a new snapshot and reset the journal."""
+        with self.file_lock, self.lock:
+            self.refresh()  # fold in what other processes appended, or the snapshot would drop it
+            self.store.compact(self.graph)
+            if self._batch:
+                self._batch.clear()  # already part of the snapshot
+
+    @metrics.timed("graph.commit")
+    def _commit(self, op, *args):
+        """Apply an operation in memory and append it to the journal."""
+        with self.file_lock, self.lock:
+            if self._batch is None:
+                self.refresh()
+            version = self.version
+            apply_op(self.graph, op, args, self.index)
+            self._track_titles(op, args, version)
+            if self._batch is not None:
+                self._batch.append((op, args))
+                return
+            self.store.append(op, *args)
+            if self.store.pending >= self.COMPACT_EVERY:
+                self.save_graph()
+
+    def _track_titles(self, op, args, version):
+        """Keep a built title index current with an operation applied on top of version."""
+        titles = self._titles
+        if titles is None or titles.version != version:
+            return  # not built, or already stale and reconciled on next use
+        if op == "note":
+            titles.add(args[0])
+        elif op == "remove":
+            titles.remove(args[0])
+        titles.version = self.version
+
+    @contextmanager
+    def batch(self):
+        """
+        Group mutations so they are journaled with a single fsync when the block
+        exits. Other writers, in this process or others, wait for the block.
+        """
+        with self.file_lock:
+            if self._batch is not None:
+                yield
+                return
+            # Readers only wait for lock while the batch starts and ends, not for the whole block
+            with self.lock:
+                self.refresh()
+                self._batch = []
+            try:
+                yield
+            finally:
+                with self.lock:
+                    entries, self._batch = self._batch, None
+                    self.store.append_many(entries)
+                    if self.store.pending >= self.COMPACT_EVERY:
+                        self.save_graph()
+
+    def transact(self, plan):
+        """
+        Optimistic update: plan(graph) inspects the current graph without holding
+        the write locks and returns a list of (op, args) to apply, or a falsy
+        value to do nothing. The operations are committed only if no other
+        writer changed the graph in the meantime; otherwise plan runs again on
+        the refreshed graph. Returns what plan returned.
+        """
+        for _ in range(self.TRANSACT_RETRIES):
+            self.refresh()
+            version = self.version
+            ops = plan(self.graph)
+            if not ops:
+                return ops
+            with self.file_lock, self.lock:
+                self.refresh()
+                if self.version != version:
+                    continue
+                for op, args in ops:
+                    self._commit(op, *args)
+                return ops
+        raise GraphConflict(f"Gave up after {self.TRANSACT_RETRIES} conflicting updates")
+
+    @property
+    def version(self):
+        """Monotonic counter bumped by every mutation."""
+        return self.graph.get("version", 0)
 
     def create_note(self, title):
         """Create a new note."""
         note_path = os.path.join(self.notes_dir, f"{title}.na.md")
         if os.path.exists(note_path):
             print(f"Note {title} already exists.")
-            return
+            return False
 
         with open(note_path, "w") as f:
             f.write(f"# {title}\n\n")
-        self.graph["notes"][title] = note_path
-        self.save_graph()
+            metrics.count_io("note", "write", f.tell())
+        self._commit("note", title, note_path)
         print(f"Note '{title}' created.")
+        return True
+
+    def register_note(self, title, note_path):
+        """Add an existing note file (e.g. one created outside Sodium) to the graph."""
+        self.transact(lambda graph: title not in graph["notes"] and [("note", (title, note_path))])
 
     def create_link(self, note1, note2):
         """Create a bidirectional link between two notes."""
-        if note1 not in self.graph["notes"] or note2 not in self.graph["notes"]:
+        # Update graph structure, unless another writer removed one of the notes first
+        if not self.transact(lambda graph: self._link_plan(graph, "link", note1, note2)):
             print("One or both notes do not exist.")
-            return
+            return False
 
         # Insert [[note2]] into note1
         self._insert_link(note1, note2)
         self._insert_link(note2, note1)
-
-        # Update graph structure
-        self.graph["links"].setdefault(note1, []).append(note2)
-        self.graph["links"].setdefault(note2, []).append(note1)
-        self.save_graph()
         print(f"Linked {note1} <-> {note2}")
+        return True
 
     def create_ref(self, note1, note2):
         """Create a bidirectional link between two notes."""
-        if note1 not in self.graph["notes"] or note2 not in self.graph["notes"]:
+        # Update graph structure, unless another writer removed one of the notes first
+        if not self.transact(lambda graph: self._link_plan(graph, "ref", note1, note2)):
             print("One or both notes do not exist.")
-            return
+            return False
 
         # Insert [[note2]] into note1
         self._insert_link(note1, note2)
-
-        # Update graph structure
-        self.graph["links"].setdefault(note1, []).append(note2)
-        self.save_graph()
         print(f"Linked {note1} -> {note2}")
+        return True
+
+    @staticmethod
+    def _link_plan(graph, op, note1, note2):
+        if note1 not in graph["notes"] or note2 not in graph["notes"]:
+            return None
+        return [(op, (note1, note2))]
+
+    def sync_note(self, title):
+        """
+        Bring a note's links in line with its [[references]] after it was edited.
+
+        References to existing notes that are not linked yet become links (both
+        ways, as init makes them). Links the note no longer references are
+        dropped unless the other note still references it. Only this note and
+        the notes it stopped referencing are read, and the delta is journaled
+        as one batch. The note is also re-indexed for search. Returns (added,
+        removed) lists of titles.
+        """
+        path = self.note_path(title)
+        fingerprint = scan_note(path) if isinstance(path, str) else None
+        if fingerprint is None:
+            return [], []
+        references = set(fingerprint[3])
+
+        with self.batch():
+            notes = self.graph["notes"]
+            if title not in notes:
+                return [], []
+            current = self.index.outgoing(title)
+            added = sorted(note for note in references if note in notes and note != title and note not in current)
+            removed = []
+            for note in sorted(current - references):
+                other = notes.get(note)
+                other_fingerprint = scan_note(other) if isinstance(other, str) else None
+                if other_fingerprint is None or title not in other_fingerprint[3]:
+                    removed.append(note)
+            for note in added:
+                self._commit("link", title, note)
+            for note in removed:
+                self._commit("unlink", title, note)
+
+        self.search_index.refresh_note(f"note:{title}", path)
+        if added or removed:
+            print(f"Updated links of {title}: +{len(added)} -{len(removed)}")
+        return added, removed
 
     def _insert_link(self, note, target):
-        """Insert a wiki-style link [[target]] into note."""
+        """Insert a wiki-style link [[target]] into note, unless the note already references it."""
         path = self.graph["notes"][note]
-        with open(path, "a") as f:
-            f.write(f"\n[[{target}]]\n")
+        reference = f"[[{target}]]"
+        with open(path, "a+") as f:
+            f.seek(0)
+            text = f.read()
+            metrics.count_io("note", "read", len(text))
+            if reference not in text:
+                f.write(f"\n{reference}\n")
+                metrics.count_io("note", "write", len(reference) + 2)
+
+    def note_path(self, title):
+        """Path of a note file, or None if the note does not exist."""
+        if self._graph is None and hasattr(self.store, "note_path"):
+            return self.store.note_path(title)
+        return self.graph["notes"].get(title)
+
+    def links_of(self, note):
+        """Outgoing links of a note."""
+        if self._graph is None and hasattr(self.store, "links_of"):
+            return self.store.links_of(note)
+        return self.graph["links"].get(note, [])
 
     def list_links(self, note):
         """List all links inside a note."""
-        links = self.graph["links"].get(note, [])
+        links = self.links_of(note)
         if links:
             print(f"Links in {note}: {', '.join(links)}")
         else:
             print(f"No links in {note}.")
 
+    def backlinks(self, note):
+        """Notes linking to a given note."""
+        if self._graph is None and hasattr(self.store, "backlinks_of"):
+            return self.store.backlinks_of(note)
+        return sorted(self.index.incoming(note))
+
+    def tags_of(self, note):
+        """Tags attached to a given note."""
+        if self._graph is None and hasattr(self.store, "tags_of"):
+            return self.store.tags_of(note)
+        return sorted(self.index.tags_of(note))
+
     def list_backlinks(self, note):
         """List all notes linking to a given note."""
-        backlinks = [n for n, links in self.graph["links"].items() if note in links]
+        backlinks = self.backlinks(note)
         if backlinks:
             print(f"Backlinks to {note}: {', '.join(backlinks)}")
         else:
             print(f"No backlinks to {note}.")
 
-    def search_notes(self, query):
+    def list_path(self, source, target):
+        """Print the shortest chain of links from source to target."""
+        if source not in self.graph["notes"] or target not in self.graph["notes"]:
+            print("One or both notes do not exist.")
+            return
+        path = self.query.shortest_path(source, target)
+        if path:
+            print(" -> ".join(path))
+        else:
+            print(f"No path from {source} to {target}.")
+
+    def list_neighborhood(self, note, depth=2):
+        """Print every note within depth links of a note, in either direction."""
+        if note not in self.graph["notes"]:
+            print(f"Note '{note}' does not exist.")
+            return
+        neighborhood = self.query.k_hop(note, depth)
+        if not neighborhood:
+            print(f"No notes within {depth} hops of {note}.")
+        for title, hops in neighborhood:
+            print(f"{hops}  {title}")
+
+    def list_common(self, note1, note2):
+        """Print the notes linked with both note1 and note2."""
+        if note1 not in self.graph["notes"] or note2 not in self.graph["notes"]:
+            print("One or both notes do not exist.")
+            return
+        common = self.query.common_neighbors(note1, note2)
+        if common:
+            print(f"Common neighbors of {note1} and {note2}: {', '.join(common)}")
+        else:
+            print(f"{note1} and {note2} have no common neighbors.")
+
+    def list_related(self, note, limit=10):
+        """Print the notes sharing the most links and tags with a note."""
+        if note not in self.graph["notes"]:
+            print(f"Note '{note}' does not exist.")
+            return
+        related = self.query.related(note, max(1, limit))
+        if not related:
+            print(f"No related notes for {note}.")
+        for title, score, shared_links, shared_tags in related:
+            print(f"{score:g}  {title} ({shared_links} shared links, {shared_tags} shared tags)")
+
+    @metrics.timed("graph.search")
+    def search(self, query, limit=None):
+        """
+        Ranked full-text search over notes and logs.
+        Returns (note_titles, [(log_title, log_text)]), best matches first.
+        """
+        index = self.search_index
+
+        def notes():
+            # Only needed when the index rescans; writers mutate graph["notes"] under the lock, so it gets a copy
+            with self.lock:
+                return dict(self.graph.get("notes", {}).items())
+
+        index.refresh(notes, self.logs, self.notes_dir)
 
         note_results = []
         log_results = []
+        for doc_id, _score in index.search(query, limit):
+            kind, key = doc_id.split(":", 1)
+            if kind == "note":
+                note_results.append(key)
+            else:
+                entry = self.logs.get(log_position(key))
+                if entry is not None:
+                    log_results.append((entry["title"], entry["text"]))
+        return note_results, log_results
 
-        # --- Search in notes ---
-        for note, path in self.graph.get("notes", {}).items():
-            try:
-                with open(path, "r") as f:
-                    content = f.read()
-                    if query.lower() in content.lower():
-                        note_results.append(note)
-            except FileNotFoundError:
-                print(f"Warning: Note file '{path}' not found.")
-
-        # --- Search in logs (titles & content) ---
-        if "logs" in self.graph and isinstance(self.graph["logs"], dict):
-            for title, log_data in self.graph["logs"].items():
-                # Check if query matches the log title
-                if query.lower() in title.lower():
-                    log_results.append((title, "[TITLE MATCH] " + str(log_data)))
-
-                # Handle logs stored as a **single string**
-                if isinstance(log_data, str):
-                    if query.lower() in log_data.lower():
-                        log_results.append((title, log_data))
-
-                # Handle logs stored as a **list of strings**
-                elif isinstance(log_data, list):
-                    for log in log_data:
-                        if isinstance(log, str) and query.lower() in log.lower():
-                            log_results.append((title, log))
+    def search_notes(self, query):
+        """Search notes and logs. Supports "exact phrases" and prefix* terms."""
+        note_results, log_results = self.search(query)
 
         # --- Print Results ---
         if note_results:
@@ -135,13 +601,28 @@ class Graph:
         if not note_results and not log_results:
             print(f"No matches found.")
 
+    @metrics.timed("graph.find")
+    def find_notes(self, query, limit=10):
+        """Print note titles matching a partial or misspelt title, best first."""
+        titles = self.titles.complete(query, limit)
+        if not titles:
+            print(f"No notes match '{query}'.")
+        for title in titles:
+            print(title)
+        return titles
 
 
     def add_tag(self, note, tag):
         """Add a tag to a note."""
-        self.graph["tags"].setdefault(tag, []).append(note)
-        self.save_graph()
+        self._commit("tag", note, tag)
         print(f"Added tag #{tag} to {note}")
+        return True
+
+    def add_log(self, title, log_text):
+        """Append a log entry to the log store."""
+        self.logs.append(title, log_text)
+        print(f"Log saved: {title}")
+        return True
 
     def list_tags(self):
         """List all tags and associated notes."""
@@ -149,85 +630,178 @@ class Graph:
             print(f"#{tag}: {', '.join(notes)}")
 
 
-    def init_graph(self):
+    @metrics.timed("graph.init")
+    def init_graph(self, incremental=False):
         # Initialize the graph with unique notes and remove any duplicates
-        for filename in os.listdir(self.notes_dir):
-            if filename.endswith(".na.md"):
-                title = filename[:-6]
-                note_path = os.path.join(self.notes_dir, filename)
-                
-                # Only add note if it doesn't already exist in the graph
-                if title not in self.graph["notes"]:
-                    self.graph["notes"][title] = note_path
-                    print(f"Found and added note: {title}")
-                else:
-                    print(f"Duplicate found, skipping note: {title}")
-
-        # Remove duplicates in links and tags
-        for note, linked_notes in self.graph["links"].items():
-            self.graph["links"][note] = list(set(linked_notes))  # Remove duplicate links
-
-        for tag, notes in self.graph["tags"].items():
-            self.graph["tags"][tag] = list(set(notes))  # Remove duplicate tags
-
-        # Auto-create links and save the graph
-        self.auto_create_links()
-        self.save_graph()
-
+        with self.batch():
+            for filename in os.listdir(self.notes_dir):
+                if filename.endswith(".na.md"):
+                    title = filename[:-6]
+                    note_path = os.path.join(self.notes_dir, filename)
+                    
+                    # Only add note if it doesn't already exist in the graph
+                    if title not in self.graph["notes"]:
+                        self._commit("note", title, note_path)
+                        print(f"Found and added note: {title}")
+                    else:
+                        print(f"Duplicate found, skipping note: {title}")
+
+            # Remove duplicates in links and tags
+            self._commit("dedupe")
+
+            # Auto-create links; the batch journals everything at once and
+            # compacts only if that leaves COMPACT_EVERY entries pending
+            self.auto_create_links(incremental)
+
+
+    @metrics.timed("graph.auto_links")
+    def auto_create_links(self, incremental=False):
+        """
+        Automatically create links based on wiki-style references in notes.
+
+        Each note's mtime, size, content hash and references are stored in
+        graph.fingerprints.json. With incremental=True, notes whose mtime and
+        size are unchanged reuse their stored references instead of being
+        reread, as do notes that were only touched (same size and content
+        hash, new mtime); changed notes are parsed in a process pool when
+        there are many.
+        """
+        fingerprints = self._load_fingerprints() if incremental else {}
+        current = {}
+        changed = {}
 
-    def auto_create_links(self):
-        """Automatically create links based on wiki-style references in notes."""
-        link_pattern = re.compile(r'\[\[(.*?)\]\]')
-        
         for note, path in self.graph["notes"].items():
+            if not isinstance(path, str):
+                continue
+            old = fingerprints.get(note)
+            if old:
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    print(f"Warning: Note file '{path}' not found.")
+                    continue
+                if old[1] == st.st_size and (old[0] == st.st_mtime_ns or old[2] == file_digest(path)):
+                    current[note] = [st.st_mtime_ns, st.st_size, old[2], old[3]]
+                    continue
+            changed[note] = path
+
+        for note, fingerprint in self._scan_notes(changed).items():
+            if fingerprint is None:
+                print(f"Warning: Note file '{changed[note]}' not found.")
+                continue
+            current[note] = fingerprint
+
+        with self.batch():
+            touched = set()
+            for note in list(current):
+                for linked_note in current[note][3]:
+                    if linked_note in self.graph["notes"] and linked_note not in self.index.outgoing(note):
+                        self.create_link(note, linked_note)
+                        touched.update((note, linked_note))
+
+        # create_link appended to these files, so fingerprint them again
+        for note in touched:
+            fingerprint = scan_note(self.graph["notes"][note])
+            if fingerprint is not None:
+                current[note] = fingerprint
+        atomic_write_json(self.sidecar_path("fingerprints.json"), current)
+
+    @metrics.timed("graph.scan_notes")
+    def _scan_notes(self, paths):
+        """Run scan_note over {note: path}, in parallel when there are enough files."""
+        notes = list(paths)
+        files = [paths[note] for note in notes]
+        if len(files) < self.PARALLEL_SCAN_MIN:
+            results = map(scan_note, files)
+        else:
+            from concurrent.futures import ProcessPoolExecutor  # slow to import; most commands never scan
+
+            workers = os.cpu_count() or 1
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(scan_note, files, chunksize=max(1, len(files) // (workers * 4))))
+        return dict(zip(notes, results))
+
+    def _load_fingerprints(self):
+        path = self.sidecar_path("fingerprints.json")
+        if not os.path.exists(path):
+            return {}
+        with open(path, "r") as f:
             try:
-                with open(path, "r") as f:
-                    content = f.read()
-                    links = link_pattern.findall(content)
-                    for linked_note in links:
-                        if linked_note in self.graph["notes"] and linked_note not in self.graph["links"].get(note, []):
-                            self.create_link(note, linked_note)
-            except FileNotFoundError:
-                print(f"Warning: Note file '{path}' not found.")
-                
+                return json.load(f)
+            except json.JSONDecodeError:
+                return {}
+
+    def compact(self):
+        """
+        Deduplicate links and tags (repeats become link weights), drop repeated
+        [[link]] footer lines from note files and write a fresh snapshot.
+        """
+        with self.batch():
+            self._commit("dedupe")
+            rewritten = 0
+            for note, path in self.graph["notes"].items():
+                if isinstance(path, str) and self._dedupe_footer(path):
+                    rewritten += 1
+            self.save_graph()
+        print(f"Compacted graph; rewrote {rewritten} note file(s).")
+        return rewritten
+
+    @staticmethod
+    def _dedupe_footer(path):
+        """Remove repeated lines that only hold a [[link]], with the blank line before each. Returns True if changed."""
+        try:
+            with open(path, "r") as f:
+                text = f.read()
+        except FileNotFoundError:
+            return False
+        metrics.count_io("note", "read", len(text))
+        lines = text.splitlines(keepends=True)
+        kept = []
+        seen = set()
+        for line in lines:
+            stripped = line.strip()
+            if FOOTER_LINK.fullmatch(stripped):
+                if stripped in seen:
+                    if kept and not kept[-1].strip():
+                        kept.pop()
+                    continue
+                seen.add(stripped)
+            kept.append(line)
+        if len(kept) == len(lines):
+            return False
+        atomic_write_text(path, "".join(kept), "note")
+        return True
+
     def remove_note(self, title):
         """
         Remove a note from the graph, delete its file, and clean up associated links and tags.
         """
-        if title not in self.graph["notes"]:
+        removed = {}
+
+        def plan(graph):
+            if title not in graph["notes"]:
+                return None
+            removed["path"] = graph["notes"][title]
+            return [("remove", (title,))]
+
+        # Drop the note, its links, backlinks and tag memberships
+        if not self.transact(plan):
             print(f"Note '{title}' does not exist.")
-            return
-        
+            return False
+
         # Handle case where graph["notes"][title] is either a path string or a dictionary
-        note_data = self.graph["notes"].pop(title)
-        
+        note_data = removed["path"]
+
         # Extract the actual path
         note_path = note_data if isinstance(note_data, str) else note_data.get("path", "")
 
-        # Remove this note from all links
-        if title in self.graph["links"]:
-            del self.graph["links"][title]  # Remove direct links
-
-        # Remove backlinks pointing to this note
-        for note, links in self.graph["links"].items():
-            if title in links:
-                links.remove(title)
-
-        # Remove the note from all tags
-        for tag in list(self.graph["tags"]):
-            if title in self.graph["tags"][tag]:
-                self.graph["tags"][tag].remove(title)
-                if not self.graph["tags"][tag]:  # Remove empty tag lists
-                    del self.graph["tags"][tag]
-
         # Delete the actual note file
         if note_path and os.path.exists(note_path):
             os.remove(note_path)
             print(f"Deleted file: {note_path}")
 
-        # Save changes to graph.json
-        self.save_graph()
         print(f"Note '{title}' removed successfully.")
+        return True
 
 
 
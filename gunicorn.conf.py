@@ -0,0 +1,27 @@
+# Production serving: gunicorn -c gunicorn.conf.py server:app
+#
+# Pre-forked workers, each with a few threads. Every worker keeps its own
+# in-memory graph (kept in sync through the journal and the watcher) and its
+# own small job pool for renders and clustering; job state lives in
+# graph.jobs/, so a status poll can land on any worker.
+import os
+import multiprocessing
+
+bind = os.getenv("SODIUM_BIND", "127.0.0.1:8000")
+workers = int(os.getenv("SODIUM_WORKERS", min(4, multiprocessing.cpu_count() + 1)))
+worker_class = "gthread"
+threads = int(os.getenv("SODIUM_THREADS", "4"))
+
+# The app starts a watcher thread and job pools on import; let each worker
+# build its own rather than inheriting them across fork().
+preload_app = False
+
+# One job process per worker keeps heavy graph work from starving the web workers
+os.environ.setdefault("SODIUM_JOB_WORKERS", "1")
+
+timeout = 60
+graceful_timeout = 30
+keepalive = 5
+max_requests = 2000
+max_requests_jitter = 200
+accesslog = "-"
@@ -0,0 +1,126 @@
+import os
+import re
+import json
+import time
+import uuid
+import threading
+import traceback
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from journal import atomic_write_json
+
+JOB_ID = re.compile(r"[0-9a-f]{32}")
+
+
+class QueueFull(RuntimeError):
+    """Raised by JobQueue.submit when max_pending jobs are already waiting or running."""
+
+
+def _write_state(state_dir, job_id, state, **fields):
+    atomic_write_json(os.path.join(state_dir, f"{job_id}.json"), dict(fields, id=job_id, state=state, updated=time.time()))
+
+
+def _run(state_dir, job_id, name, fn, args, kwargs):
+    """Job wrapper executed in the worker process; records progress where any server process can read it."""
+    _write_state(state_dir, job_id, "running", name=name)
+    try:
+        result = fn(*args, **kwargs)
+    except Exception as e:
+        _write_state(state_dir, job_id, "failed", name=name, error=f"{type(e).__name__}: {e}", traceback=traceback.format_exc())
+        raise
+    _write_state(state_dir, job_id, "done", name=name, result=result)
+    return result
+
+
+class JobQueue:
+    """
+    Bounded process pool for slow work (graph rendering, clustering, init),
+    with job ids that clients can poll.
+
+    Job state (queued, running, done or failed, plus the JSON result) is kept
+    as one small file per job in state_dir, so any server process, e.g. any
+    gunicorn worker, can answer a status poll. Jobs submitted with the same
+    key while one is still pending share its id. Functions must be importable
+    module-level callables and results JSON-serialisable, since workers are
+    spawned processes. If a worker dies, its jobs are marked failed and the
+    next submit starts a fresh pool.
+    """
+
+    def __init__(self, state_dir, max_workers=None, max_pending=16, ttl=3600):
+        self.state_dir = state_dir
+        self.max_workers = max_workers or min(2, os.cpu_count() or 1)
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self._executor = None
+        self._pending = {}  # job id -> future
+        self._keys = {}  # key -> job id
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        if self._executor is None:
+            # spawn: forking a threaded server could copy held locks into the child
+            self._executor = ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._executor
+
+    def submit(self, fn, *args, key=None, name=None, **kwargs):
+        """Queue fn(*args, **kwargs) and return its job id. Raises QueueFull when the queue is at capacity."""
+        with self._lock:
+            self._pending = {job_id: future for job_id, future in self._pending.items() if not future.done()}
+            if key is not None and self._keys.get(key) in self._pending:
+                return self._keys[key]
+            if len(self._pending) >= self.max_pending:
+                raise QueueFull(f"{len(self._pending)} jobs already pending")
+            self._prune()
+
+            job_id = uuid.uuid4().hex
+            name = name or getattr(fn, "__name__", "job")
+            _write_state(self.state_dir, job_id, "queued", name=name)
+            try:
+                future = self._pool().submit(_run, self.state_dir, job_id, name, fn, args, kwargs)
+            except BrokenProcessPool:
+                # A worker died (e.g. killed for running out of memory); start over with a fresh pool
+                self._executor.shutdown(wait=False)
+                self._executor = None
+                future = self._pool().submit(_run, self.state_dir, job_id, name, fn, args, kwargs)
+            future.add_done_callback(lambda future: self._record_crash(job_id, name, future))
+            self._pending[job_id] = future
+            if key is not None:
+                self._keys = {k: v for k, v in self._keys.items() if v in self._pending}
+                self._keys[key] = job_id
+            return job_id
+
+    def _record_crash(self, job_id, name, future):
+        """Mark a job failed when its worker died before _run could record the outcome."""
+        if not future.cancelled() and isinstance(future.exception(), BrokenProcessPool):
+            _write_state(self.state_dir, job_id, "failed", name=name, error="BrokenProcessPool: the worker process died")
+
+    def status(self, job_id):
+        """State dict of a job ({id, state, name, updated, result or error}), or None if unknown."""
+        if not JOB_ID.fullmatch(job_id or ""):
+            return None
+        try:
+            with open(os.path.join(self.state_dir, f"{job_id}.json"), "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _prune(self):
+        """Forget finished job states older than ttl."""
+        cutoff = time.time() - self.ttl
+        try:
+            entries = os.scandir(self.state_dir)
+        except FileNotFoundError:
+            return
+        with entries:
+            for entry in entries:
+                if entry.name.endswith(".json") and entry.name[:-5] not in self._pending:
+                    try:
+                        if entry.stat().st_mtime < cutoff:
+                            os.remove(entry.path)
+                    except FileNotFoundError:
+                        pass
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,339 @@
+import os
+import json
+import threading
+import contextlib
+from collections import Counter
+import metrics
+import snapshot
+
+
+def empty_graph():
+    return {"notes": {}, "links": {}, "tags": {}}
+
+
+def _add_edge(data, source, target, index):
+    """Add source -> target once; repeating it bumps the edge's weight instead of duplicating it."""
+    exists = target in index.outgoing(source) if index is not None else target in data["links"].get(source, ())
+    if exists:
+        weights = data.setdefault("weights", {}).setdefault(source, {})
+        weights[target] = weights.get(target, 1) + 1
+        return
+    data["links"].setdefault(source, []).append(target)
+    if index is not None:
+        index.add_link(source, target)
+
+
+def _drop_weight(data, source, target):
+    """
+    Remove graph["weights"][source][target]. The row is replaced rather than
+    edited in place: a snapshot table hands out decoded copies of its rows.
+    """
+    weights = data.get("weights")
+    row = weights.get(source) if weights else None
+    if not row or target not in row:
+        return
+    row = {other: count for other, count in row.items() if other != target}
+    if row:
+        weights[source] = row
+    else:
+        del weights[source]
+
+
+def apply_op(data, op, args, index=None):
+    """
+    Apply one journaled operation to an in-memory graph dict.
+    If a GraphIndex is given it is kept in sync and used to make removals O(degree).
+
+    Links and tags have set semantics: graph["links"] and graph["tags"] hold
+    each relationship once, and graph["weights"][source][target] counts how
+    often a link was made when that is more than once.
+    """
+    if op == "note":
+        title, path = args
+        data["notes"][title] = path
+    elif op == "link":
+        note1, note2 = args
+        _add_edge(data, note1, note2, index)
+        _add_edge(data, note2, note1, index)
+    elif op == "ref":
+        note1, note2 = args
+        _add_edge(data, note1, note2, index)
+    elif op == "unlink":
+        # Drop the links between two notes in both directions, with their weights
+        note1, note2 = args
+        for source, target in ((note1, note2), (note2, note1)):
+            if target in data["links"].get(source, ()):
+                data["links"][source] = [link for link in data["links"][source] if link != target]
+                if index is not None:
+                    index.remove_link(source, target)
+            _drop_weight(data, source, target)
+    elif op == "tag":
+        note, tag = args
+        exists = tag in index.tags_of(note) if index is not None else note in data["tags"].get(tag, ())
+        if not exists:
+            data["tags"].setdefault(tag, []).append(note)
+            if index is not None:
+                index.add_tag(note, tag)
+    elif op == "log":
+        # Only journals written by older versions; Graph moves these logs to its LogStore
+        title, log_text = args
+        data.setdefault("logs", {})[title] = log_text
+    elif op == "remove":
+        (title,) = args
+        if index is not None:
+            sources = index.incoming(title)
+            tags = index.tags_of(title)
+        else:
+            sources = [note for note, links in data["links"].items() if title in links]
+            tags = [tag for tag, notes in data["tags"].items() if title in notes]
+        data["notes"].pop(title, None)
+        data["links"].pop(title, None)
+        data.get("weights", {}).pop(title, None)
+        for note in sources:
+            if note in data["links"]:
+                data["links"][note] = [link for link in data["links"][note] if link != title]
+            _drop_weight(data, note, title)
+        for tag in tags:
+            remaining = [note for note in data["tags"].get(tag, []) if note != title]
+            if remaining:
+                data["tags"][tag] = remaining
+            else:
+                data["tags"].pop(tag, None)
+        if index is not None:
+            index.remove_note(title)
+    elif op == "dedupe":
+        # Repeated links left by older versions become weights
+        for note, links in data["links"].items():
+            counts = Counter(links)
+            data["links"][note] = list(counts)
+            for target, count in counts.items():
+                if count > 1:
+                    weights = data.setdefault("weights", {}).setdefault(note, {})
+                    weights[target] = weights.get(target, 1) + count - 1
+        for tag, notes in data["tags"].items():
+            data["tags"][tag] = list(dict.fromkeys(notes))
+    else:
+        raise ValueError(f"Unknown journal operation: {op}")
+    data["version"] = data.get("version", 0) + 1
+
+
+def atomic_write_json(path, data, target="sidecar", **dump_kwargs):
+    """Write JSON to a temp file, fsync it and rename it over path."""
+    atomic_write_text(path, json.dumps(data, **dump_kwargs), target)
+
+
+def atomic_write_text(path, text, target="sidecar"):
+    """Write text to a temp file, fsync it and rename it over path. target labels the bytes in the I/O metrics."""
+    atomic_write_bytes(path, text.encode("utf-8"), target)
+
+
+def temp_path(path):
+    """A temp file name next to path that no other process or thread uses at the same time."""
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+def atomic_write_bytes(path, data, target="sidecar"):
+    """Write bytes to a temp file, fsync it and rename it over path."""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = temp_path(path)
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+            metrics.count_io(target, "write", len(data))
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(tmp_path)
+        raise
+    _fsync_dir(directory)
+
+
+def _fsync_dir(directory):
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class Journal:
+    """
+    Append-only operation log layered over the graph.json snapshot.
+
+    The snapshot carries a "version" counter and the journal starts with a
+    header naming the snapshot version it applies to. Mutations append one
+    fsync'd JSON line each; compact() folds them into a fresh snapshot. If a
+    crash happens between replacing the snapshot and resetting the journal,
+    the header no longer matches and the already-applied journal is ignored.
+    Torn lines left by a crash are skipped on replay.
+
+    With binary=True the snapshot is written in the memory-mapped format of
+    snapshot.py instead of JSON.
+    """
+
+    def __init__(self, snapshot_file, journal_file, binary=False):
+        self.snapshot_file = snapshot_file
+        self.journal_file = journal_file
+        self.binary = binary
+        self.base_version = 0
+        self.pending = 0
+        self.stale = True
+        self.offset = 0
+        self.snapshot_stamp = None
+
+    @property
+    def watch_files(self):
+        """Files whose changes mean another process modified the graph."""
+        return [self.snapshot_file, self.journal_file]
+
+    def load(self):
+        """Return the snapshot with all valid journal entries replayed on top."""
+        self.snapshot_stamp = _file_stamp(self.snapshot_file)
+        data = self._load_snapshot()
+        self.base_version = data.get("version", 0)
+        self.pending = 0
+        self.stale = True
+        self.offset = 0
+
+        if not os.path.exists(self.journal_file):
+            return data
+
+        with open(self.journal_file, "rb") as f:
+            header_line = f.readline()
+            header = self._parse(header_line)
+            if header is None or header.get("base") != self.base_version:
+                return data
+            self.stale = False
+            self.offset = len(header_line)
+            self._replay(f, data)
+        metrics.count_io("journal", "read", self.offset)
+        return data
+
+    def catch_up(self, data, index=None):
+        """
+        Replay entries other processes appended since the last load or catch_up.
+        Returns how many were applied, or None if the snapshot was replaced and
+        the caller has to load() from scratch.
+        """
+        if _file_stamp(self.snapshot_file) != self.snapshot_stamp:
+            return None
+        try:
+            size = os.path.getsize(self.journal_file)
+        except FileNotFoundError:
+            return 0 if self.stale else None
+        if self.stale or size < self.offset:
+            return None
+        if size == self.offset:
+            return 0
+        with open(self.journal_file, "rb") as f:
+            f.seek(self.offset)
+            start = self.offset
+            applied = self._replay(f, data, index)
+        metrics.count_io("journal", "read", self.offset - start)
+        return applied
+
+    def _replay(self, f, data, index=None):
+        applied = 0
+        for line in f:
+            if not line.endswith(b"\n"):
+                break  # still being written, or torn by a crash
+            self.offset += len(line)
+            entry = self._parse(line)
+            if entry is None:
+                continue  # torn line followed by newer appends
+            apply_op(data, entry["op"], entry["args"], index)
+            applied += 1
+        self.pending += applied
+        return applied
+
+    def _load_snapshot(self):
+        data = None
+        if self.binary:
+            data = snapshot.load(self.snapshot_file)
+        elif os.path.exists(self.snapshot_file):
+            with open(self.snapshot_file, "r") as f:
+                try:
+                    data = json.load(f)
+                except json.JSONDecodeError:
+                    data = None
+                metrics.count_io("graph", "read", f.tell())
+        if not isinstance(data, dict):  # ✅ Ensure it's a dictionary
+            data = empty_graph()
+        for key, value in empty_graph().items():
+            data.setdefault(key, value)
+        return data
+
+    @staticmethod
+    def _parse(line):
+        if not line.endswith(b"\n"):
+            return None
+        try:
+            return json.loads(line)
+        except json.JSONDecodeError:
+            return None
+
+    def append(self, op, *args):
+        """Durably record one operation."""
+        self.append_many([(op, args)])
+
+    def append_many(self, entries):
+        """Durably record several operations with a single fsync."""
+        if not entries:
+            return
+        lines = [json.dumps({"op": op, "args": list(args)}) + "\n" for op, args in entries]
+        os.makedirs(os.path.dirname(os.path.abspath(self.journal_file)), exist_ok=True)
+        if self.stale:
+            header = json.dumps({"base": self.base_version}) + "\n"
+            with open(self.journal_file, "wb") as f:
+                self._write(f, header + "".join(lines))
+        else:
+            with open(self.journal_file, "ab") as f:
+                if f.tell() > 0 and not self._ends_with_newline():
+                    lines.insert(0, "\n")  # isolate a torn line left by a crash
+                self._write(f, "".join(lines))
+        self.stale = False
+        self.pending += len(entries)
+
+    def _write(self, f, text):
+        encoded = text.encode("utf-8")
+        f.write(encoded)
+        f.flush()
+        os.fsync(f.fileno())
+        self.offset = f.tell()
+        metrics.count_io("journal", "write", len(encoded))
+
+    def _ends_with_newline(self):
+        with open(self.journal_file, "rb") as reader:
+            reader.seek(-1, os.SEEK_END)
+            return reader.read(1) == b"\n"
+
+    def compact(self, data):
+        """Write data as the new snapshot and start an empty journal for it."""
+        if self.binary:
+            atomic_write_bytes(self.snapshot_file, snapshot.encode(data), "graph")
+        else:
+            atomic_write_json(self.snapshot_file, snapshot.plain(data), "graph", indent=4)
+        self.snapshot_stamp = _file_stamp(self.snapshot_file)
+        self.base_version = data.get("version", 0)
+        header = json.dumps({"base": self.base_version}) + "\n"
+        atomic_write_text(self.journal_file, header, "journal")
+        self.offset = len(header.encode("utf-8"))
+        self.pending = 0
+        self.stale = False
+
+
+def _file_stamp(path):
+    """Identity of a file's current contents, or None if it does not exist."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
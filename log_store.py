@@ -0,0 +1,270 @@
+import os
+import json
+import time
+import threading
+from bisect import bisect_left, bisect_right
+from journal import atomic_write_json, atomic_write_text
+from locking import FileLock
+import metrics
+
+SEGMENT_BYTES = 4 * 1024 * 1024
+
+
+def _segment_name(seq):
+    return f"{seq:08d}.jsonl"
+
+
+class Segment:
+    """In-memory index of one segment file: entry offsets, timestamps and entry numbers per title."""
+
+    def __init__(self, seq, path):
+        self.seq = seq
+        self.path = path
+        self.size = 0       # bytes indexed so far
+        self.offsets = []   # entry number -> byte offset
+        self.times = []     # entry number -> timestamp (non-decreasing)
+        self.titles = {}    # title -> [entry numbers]
+
+    def add(self, offset, ts, title):
+        self.titles.setdefault(title, []).append(len(self.offsets))
+        self.offsets.append(offset)
+        self.times.append(ts)
+
+    def scan(self):
+        """Index complete lines appended since the last scan."""
+        try:
+            f = open(self.path, "rb")
+        except FileNotFoundError:
+            return
+        with f:
+            f.seek(self.size)
+            start = self.size
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # still being written, or torn by a crash
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    entry = None
+                if isinstance(entry, dict):
+                    self.add(self.size, entry["ts"], entry["title"])
+                self.size += len(line)
+        metrics.count_io("log", "read", self.size - start)
+
+    def to_json(self):
+        return {"size": self.size, "offsets": self.offsets, "times": self.times, "titles": self.titles}
+
+    @classmethod
+    def from_json(cls, seq, path, data):
+        segment = cls(seq, path)
+        segment.size = data["size"]
+        segment.offsets = data["offsets"]
+        segment.times = data["times"]
+        segment.titles = data["titles"]
+        return segment
+
+
+class LogStore:
+    """
+    Append-only, time-ordered log entries, kept apart from the note graph.
+
+    Entries are JSON lines {"ts", "title", "text"} in numbered segment files
+    (graph.logs/00000001.jsonl, ...). Writers append to the newest segment
+    under a file lock and start a new one once it reaches segment_bytes, so
+    adding an entry costs one small append whatever the log size. Sealed
+    segments get an index file (.idx) with their entry offsets, timestamps
+    and entries per title; only the newest segment is scanned on open.
+
+    An entry's position is [segment number, entry number]; positions order
+    entries by time and serve as pagination cursors. Segment 0 holds logs
+    imported from graph files written by older versions.
+    """
+
+    def __init__(self, directory, segment_bytes=SEGMENT_BYTES, fsync=True):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+        self.lock = threading.RLock()
+        self.file_lock = FileLock(os.path.join(directory, "lock"))
+        self.segments = {}  # seq -> Segment
+
+    def _path(self, seq):
+        return os.path.join(self.directory, _segment_name(seq))
+
+    def refresh(self):
+        """Pick up segments and entries written by other processes."""
+        with self.lock:
+            try:
+                names = os.listdir(self.directory)
+            except FileNotFoundError:
+                return
+            seqs = sorted(int(name[:-6]) for name in names if name.endswith(".jsonl") and name[:-6].isdigit())
+            if not seqs:
+                return
+            # Only the newest segment grows; the previous newest may have a tail we have not seen
+            previous = max(self.segments) if self.segments else None
+            for seq in seqs:
+                if seq not in self.segments:
+                    self.segments[seq] = self._open_segment(seq, sealed=seq != seqs[-1])
+            for seq in {previous, seqs[-1]}:
+                if seq in self.segments:
+                    self.segments[seq].scan()
+
+    def _open_segment(self, seq, sealed):
+        path = self._path(seq)
+        index_path = path[:-6] + ".idx"
+        if sealed:
+            try:
+                with open(index_path, "r") as f:
+                    return Segment.from_json(seq, path, json.load(f))
+            except (FileNotFoundError, json.JSONDecodeError, KeyError):
+                pass
+        segment = Segment(seq, path)
+        segment.scan()
+        if sealed:
+            atomic_write_json(index_path, segment.to_json(), "log", separators=(",", ":"))
+        return segment
+
+    def _seal(self, segment):
+        atomic_write_json(segment.path[:-6] + ".idx", segment.to_json(), "log", separators=(",", ":"))
+
+    def append(self, title, text):
+        """Durably add one entry; returns its position."""
+        return self.append_many([(title, text)])[0]
+
+    def append_many(self, entries, times=None):
+        """
+        Durably add several (title, text) entries with a single write; returns
+        their positions. Entries are stamped now, or with times (e.g. when
+        importing) as far as that keeps the log in time order; an entry
+        stamped later than its given time keeps that time as "origin_ts".
+        """
+        with self.file_lock, self.lock:
+            self.refresh()
+            seqs = sorted(self.segments)
+            segment = self.segments[seqs[-1]] if seqs else None
+            if segment is None or segment.size >= self.segment_bytes:
+                if segment is not None:
+                    self._seal(segment)
+                seq = segment.seq + 1 if segment is not None else 1
+                segment = self.segments[seq] = Segment(seq, self._path(seq))
+                os.makedirs(self.directory, exist_ok=True)
+
+            # Keep timestamps ordered even if the clock steps back
+            ts = max([time.time()] + segment.times[-1:])
+            stamps = []
+            for given in (times if times is not None else [ts] * len(entries)):
+                stamps.append(max([given] + stamps[-1:] + segment.times[-1:]))
+            lines = []
+            for (title, text), stamp, given in zip(entries, stamps, times if times is not None else stamps):
+                entry = {"ts": stamp, "title": title, "text": text}
+                if given != stamp:
+                    entry["origin_ts"] = given
+                lines.append((json.dumps(entry) + "\n").encode("utf-8"))
+            with open(segment.path, "ab") as f:
+                if f.tell() > segment.size:
+                    # isolate a torn line left by a crash
+                    f.write(b"\n")
+                    segment.size = f.tell()
+                f.write(b"".join(lines))
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+            metrics.count_io("log", "write", sum(map(len, lines)))
+
+            positions = []
+            for line, (title, _), stamp in zip(lines, entries, stamps):
+                positions.append([segment.seq, len(segment.offsets)])
+                segment.add(segment.size, stamp, title)
+                segment.size += len(line)
+            return positions
+
+    def import_legacy(self, logs, ts=0.0):
+        """
+        Import the {title: text or [texts]} logs of an older graph file as
+        segment 0, once; the segment is written atomically, so a crash cannot
+        import them twice. Returns the number of entries imported.
+        """
+        with self.file_lock, self.lock:
+            path = self._path(0)
+            if os.path.exists(path):
+                return 0
+            self.refresh()
+            first = [self.segments[seq].times[0] for seq in sorted(self.segments) if self.segments[seq].times][:1]
+            ts = min([ts] + first)
+            lines = []
+            for title, log_data in logs.items():
+                for text in (log_data if isinstance(log_data, list) else [log_data]):
+                    lines.append(json.dumps({"ts": ts, "title": title, "text": str(text)}) + "\n")
+            atomic_write_text(path, "".join(lines), "log")
+            self.refresh()
+            return len(lines)
+
+    def end(self):
+        """Position just after the newest entry."""
+        with self.lock:
+            self.refresh()
+            if not self.segments:
+                return [0, 0]
+            segment = self.segments[max(self.segments)]
+            return [segment.seq, len(segment.offsets)]
+
+    def titles(self):
+        """Sorted titles that have at least one entry."""
+        with self.lock:
+            self.refresh()
+            return sorted(set().union(*(segment.titles for segment in self.segments.values())))
+
+    def get(self, position):
+        """The entry at a position, or None."""
+        seq, number = position
+        with self.lock:
+            segment = self.segments.get(seq)
+            if segment is None or not 0 <= number < len(segment.offsets):
+                return None
+        with open(segment.path, "rb") as f:
+            return self._read(f, segment, number)
+
+    @staticmethod
+    def _read(f, segment, number):
+        f.seek(segment.offsets[number])
+        line = f.readline()
+        metrics.count_io("log", "read", len(line))
+        entry = json.loads(line)
+        entry["id"] = [segment.seq, number]
+        return entry
+
+    def entries(self, title=None, since=None, until=None, cursor=None, reverse=False):
+        """
+        Lazily yield entries {"id", "ts", "title", "text"} oldest first (newest
+        first with reverse), optionally only those of one title and with
+        since <= ts < until. With a cursor (a position) iteration resumes just
+        past it. Entries appended while iterating are not included.
+        """
+        with self.lock:
+            self.refresh()
+            # Segments only ever grow, so their lengths now bound this iteration
+            plan = [(self.segments[seq], len(self.segments[seq].offsets)) for seq in sorted(self.segments, reverse=reverse)]
+
+        for segment, count in plan:
+            if count == 0:
+                continue
+            lo = bisect_left(segment.times, since, 0, count) if since is not None else 0
+            hi = bisect_left(segment.times, until, 0, count) if until is not None else count
+            if cursor is not None:
+                if reverse:
+                    hi = min(hi, cursor[1]) if segment.seq == cursor[0] else (hi if segment.seq < cursor[0] else 0)
+                else:
+                    lo = max(lo, cursor[1] + 1) if segment.seq == cursor[0] else (lo if segment.seq > cursor[0] else count)
+            if lo >= hi:
+                continue
+            if title is not None:
+                numbers = segment.titles.get(title, [])
+                numbers = numbers[bisect_left(numbers, lo):bisect_right(numbers, hi - 1)]
+            else:
+                numbers = range(lo, hi)
+            if reverse:
+                numbers = reversed(numbers)
+            with open(segment.path, "rb") as f:
+                for number in numbers:
+                    yield self._read(f, segment, number)
@@ -1,10 +1,8 @@
 import argparse
 import os
-from graph import Graph
-import subprocess
+import sys
 import storage
 from dotenv import load_dotenv
-import analysis
 # Load .env variables
 load_dotenv()
 
@@ -13,11 +11,12 @@ GRAPH_FILE = os.getenv("GRAPH_FILE", os.path.expanduser("~/.sodium/graph.json"))
 NOTES_DIR = os.getenv("NOTES_DIR", "/Users/sudarshan/Desktop/gg3141/code/projects/sodium/notes")
 DEFAULT_EDITOR = os.getenv("EDITOR", "subl")
 
-# Initialize graph
-graph = Graph(GRAPH_FILE, NOTES_DIR)
+# Shared with storage; the graph file is only read once a command needs it
+graph = storage.get_graph(GRAPH_FILE, NOTES_DIR)
 
 def main():
     parser = argparse.ArgumentParser(description="Sodium CLI - CLI-based Second-Brain")
+    parser.add_argument("--profile", metavar="FILE", help="Profile the command with cProfile, write pstats data to FILE and print a summary to stderr")
     subparsers = parser.add_subparsers(dest="command")
 
     open_parser = subparsers.add_parser("open", help="Open a note in the editor")
@@ -42,10 +41,29 @@ def main():
     backlinks_parser = subparsers.add_parser("backlinks", help="Find notes linking to a given note")
     backlinks_parser.add_argument("note")
 
+    # Relationship queries
+    path_parser = subparsers.add_parser("path", help="Shortest chain of links between two notes")
+    path_parser.add_argument("source")
+    path_parser.add_argument("target")
+    hops_parser = subparsers.add_parser("hops", help="Notes within k links of a note")
+    hops_parser.add_argument("note")
+    hops_parser.add_argument("--depth", type=int, default=2)
+    common_parser = subparsers.add_parser("common", help="Notes linked with both notes")
+    common_parser.add_argument("note1")
+    common_parser.add_argument("note2")
+    related_parser = subparsers.add_parser("related", help="Notes sharing the most links and tags with a note")
+    related_parser.add_argument("note")
+    related_parser.add_argument("--limit", type=int, default=10)
+
     # Search notes
     search_parser = subparsers.add_parser("search", help="Search for a keyword")
     search_parser.add_argument("query")
 
+    # Find notes by (partial, misspelt) title
+    find_parser = subparsers.add_parser("find", help="Find notes by partial or misspelt title")
+    find_parser.add_argument("query")
+    find_parser.add_argument("--limit", type=int, default=10)
+
     # Tag a note
     tag_parser = subparsers.add_parser("tag", help="Add a tag to a note")
     tag_parser.add_argument("note")
@@ -59,37 +77,123 @@ def main():
     graph_parser.add_argument(
     "flag", choices=["hmap", "cen", "viz"], help="Choose: 'hmap' for heatmap, 'cen' for centrality, 'viz' for graph visualization"
     )
+    graph_parser.add_argument("--k", type=int, help="Estimate betweenness from k sampled nodes (faster on large graphs)")
+    graph_parser.add_argument("--top-k", type=int, help="Keep only the k strongest tag co-occurrences per note")
+    graph_parser.add_argument("--top-n", type=int, default=30, help="Number of notes shown in the heatmap and centrality charts")
+
+    clusters_parser = subparsers.add_parser("clusters", help="Show note communities (cached per graph version)")
+    clusters_parser.add_argument("note", nargs="?", help="Show only the cluster of this note")
+    clusters_parser.add_argument("--method", choices=["louvain", "lpa"], default="louvain")
+    clusters_parser.add_argument("--top", type=int, default=20, help="Number of clusters listed")
+
+    init_parser = subparsers.add_parser("init", help="Scan notes directory and add new notes to the graph")
+    init_parser.add_argument("--incremental", action="store_true", help="Only reparse notes changed since the last scan")
+    subparsers.add_parser("compact", help="Deduplicate links and tags and repeated [[link]] lines in note files")
+    migrate_parser = subparsers.add_parser("migrate", help="Copy the graph to another storage backend (e.g. graph.db for SQLite)")
+    migrate_parser.add_argument("target", help="Target graph file; .db/.sqlite selects the SQLite backend")
+
+    batch_parser = subparsers.add_parser("batch", help="Apply newline-delimited JSON operations in one transaction")
+    batch_parser.add_argument("file", nargs="?", default="-", help="NDJSON file of operations (default: stdin)")
+
+    export_parser = subparsers.add_parser("export", help="Stream notes, links, tags and logs into a tar archive")
+    export_parser.add_argument("archive", help="Archive file (.tar, .tar.gz, .tar.xz, .tar.zst) or - for stdout")
+    export_parser.add_argument("--tag", action="append", help="Only notes with this tag (repeatable)")
+    export_parser.add_argument("--subgraph", metavar="TITLE", help="Only notes within --depth links of TITLE")
+    export_parser.add_argument("--depth", type=int, default=1)
+    import_parser = subparsers.add_parser("import", help="Add the notes, links, tags and logs of an exported archive")
+    import_parser.add_argument("archive", help="Archive file or - for stdin")
+    import_parser.add_argument("--overwrite", action="store_true", help="Replace notes that already exist")
 
-    subparsers.add_parser("init", help="Scan notes directory and add new notes to the graph")
     log_parser = subparsers.add_parser("log", help="Create mono logs")
     log_parser.add_argument("title", help="Title of the log")
     log_parser.add_argument("log", help="Log text")
     args = parser.parse_args()
 
+    if args.profile:
+        profile_command(args, parser)
+    else:
+        run_command(args, parser)
+
+def profile_command(args, parser):
+    """Run a command under cProfile; the stats are saved even if it exits early."""
+    import cProfile
+    import pstats
+    import metrics
+
+    profiler = cProfile.Profile()
+    try:
+        profiler.runcall(run_command, args, parser)
+    finally:
+        profiler.dump_stats(args.profile)
+        pstats.Stats(profiler, stream=sys.stderr).sort_stats("cumulative").print_stats(25)
+        for name, calls, seconds in metrics.span_summary():
+            print(f"{name:<24} {calls:>8} calls {seconds * 1000:>10.1f} ms", file=sys.stderr)
+        print(f"Profile written to {args.profile} (inspect with: python -m pstats {args.profile})", file=sys.stderr)
+
+def run_command(args, parser):
     if args.command == "new":
         graph.create_note(args.title)
     elif args.command == "open":
-        storage.open_note(args.title)
+        storage.open_note(args.title, graph)
     elif args.command == "link":
         graph.create_link(args.note1, args.note2)
     elif args.command == "list":
         graph.list_links(args.note)
     elif args.command == "backlinks":
         graph.list_backlinks(args.note)
+    elif args.command == "path":
+        graph.list_path(args.source, args.target)
+    elif args.command == "hops":
+        graph.list_neighborhood(args.note, args.depth)
+    elif args.command == "common":
+        graph.list_common(args.note1, args.note2)
+    elif args.command == "related":
+        graph.list_related(args.note, args.limit)
     elif args.command == "search":
         graph.search_notes(args.query)
+    elif args.command == "find":
+        graph.find_notes(args.query, args.limit)
     elif args.command == "tag":
         graph.add_tag(args.note, args.tag)
     elif args.command == "tags":
         graph.list_tags()
     elif args.command == "graph":
-        analysis.analyse(GRAPH_FILE, args.flag)
+        import analysis  # networkx, matplotlib and seaborn are only needed here
+        analysis.analyse(GRAPH_FILE, args.flag, k=args.k, top_k=args.top_k, top_n=args.top_n)
+    elif args.command == "clusters":
+        from clusters import show_clusters
+        show_clusters(GRAPH_FILE, args.note, method=args.method, top=args.top)
     elif args.command == "init":
-        graph.init_graph()
+        graph.init_graph(incremental=args.incremental)
     elif args.command == "remove":
         graph.remove_note(args.title)
+    elif args.command == "compact":
+        graph.compact()
+    elif args.command == "migrate":
+        from graph import migrate_graph
+        migrate_graph(GRAPH_FILE, os.path.expanduser(args.target))
+    elif args.command == "batch":
+        from batch import run_batch
+        if args.file == "-":
+            failed = run_batch(graph, sys.stdin, sys.stdout)
+        else:
+            with open(args.file, "r") as f:
+                failed = run_batch(graph, f, sys.stdout)
+        if failed:
+            sys.exit(1)
+    elif args.command in ("export", "import"):
+        from archive import ArchiveError, export_vault, import_vault
+        archive = args.archive if args.archive == "-" else os.path.expanduser(args.archive)
+        try:
+            if args.command == "export":
+                export_vault(graph, archive, args.tag, args.subgraph, args.depth)
+            else:
+                import_vault(graph, archive, args.overwrite)
+        except (ArchiveError, OSError) as e:
+            print(e, file=sys.stderr)
+            sys.exit(1)
     elif args.command == "log":
-        storage.log_entry(GRAPH_FILE, args.title, args.log)
+        storage.log_entry(GRAPH_FILE, args.title, args.log, NOTES_DIR)
     else:
         parser.print_help()
 
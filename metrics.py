@@ -0,0 +1,155 @@
+"""
+In-process instrumentation: counters, latency histograms and timing spans,
+exported in the Prometheus text format by the server's /metrics route.
+
+Values are per process (each gunicorn worker or job process keeps its own).
+Only the standard library is used so the CLI can import this at no cost.
+"""
+import time
+import threading
+from functools import wraps
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_registry = []
+_lock = threading.Lock()
+
+
+def _label_key(names, labels):
+    return tuple(str(labels.get(name, "")) for name in names)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Counter:
+    """Monotonic counter, optionally split by labels."""
+
+    kind = "counter"
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(self.labels, labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        with _lock:
+            values = dict(self.values)
+        for key, value in sorted(values.items()):
+            yield self.name, _format_labels(self.labels, key), value
+
+
+class Histogram:
+    """Cumulative-bucket histogram of observed values (seconds), optionally split by labels."""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.values = {}  # label key -> [bucket counts..., count, sum]
+
+    def observe(self, value, **labels):
+        key = _label_key(self.labels, labels)
+        with _lock:
+            series = self.values.get(key)
+            if series is None:
+                series = self.values[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += 1
+            series[-1] += value
+
+    def samples(self):
+        with _lock:
+            values = {key: list(series) for key, series in self.values.items()}
+        for key, series in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                yield self.name + "_bucket", _format_labels(self.labels, key, [("le", repr(bound))]), cumulative
+            yield self.name + "_bucket", _format_labels(self.labels, key, [("le", "+Inf")]), series[-2]
+            yield self.name + "_count", _format_labels(self.labels, key), series[-2]
+            yield self.name + "_sum", _format_labels(self.labels, key), series[-1]
+
+
+def counter(name, documentation, labels=()):
+    metric = Counter(name, documentation, labels)
+    _registry.append(metric)
+    return metric
+
+
+def histogram(name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+    metric = Histogram(name, documentation, labels, buckets)
+    _registry.append(metric)
+    return metric
+
+
+REQUEST_SECONDS = histogram(
+    "sodium_http_request_duration_seconds", "Web request latency by route.", ("method", "route", "status")
+)
+IO_BYTES = counter("sodium_io_bytes_total", "Bytes read and written by graph, journal, note and sidecar I/O.", ("target", "direction"))
+SPAN_SECONDS = histogram("sodium_span_duration_seconds", "Duration of graph operations and analysis stages.", ("span",))
+
+
+def count_io(target, direction, nbytes):
+    """Record nbytes read or written for target (graph, journal, note or sidecar)."""
+    IO_BYTES.inc(nbytes, target=target, direction=direction)
+
+
+@contextmanager
+def span(name):
+    """Time the enclosed block into sodium_span_duration_seconds{span=name}."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        SPAN_SECONDS.observe(time.perf_counter() - start, span=name)
+
+
+def timed(name):
+    """Decorator form of span()."""
+    def decorate(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, labels, value in metric.samples():
+            lines.append(f"{name}{labels} {value:.6g}" if isinstance(value, float) else f"{name}{labels} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def span_summary():
+    """[(span, calls, total seconds)] recorded so far, slowest first."""
+    with _lock:
+        rows = [(key[0], series[-2], series[-1]) for key, series in SPAN_SECONDS.values.items()]
+    return sorted(rows, key=lambda row: -row[2])
@@ -0,0 +1,133 @@
+import os
+import html
+import hashlib
+import threading
+import xml.etree.ElementTree as etree
+from collections import OrderedDict
+import markdown
+from markdown.extensions import Extension
+from markdown.inlinepatterns import InlineProcessor
+from markdown.treeprocessors import Treeprocessor
+from graph import LINK_PATTERN
+import metrics
+
+
+class WikiLinkProcessor(InlineProcessor):
+    def __init__(self, pattern, md, resolve):
+        super().__init__(pattern, md)
+        self.resolve = resolve
+
+    def handleMatch(self, m, data):
+        title = m.group(1).strip()
+        url = self.resolve(title)
+        if url is None:
+            el = etree.Element("span")
+            el.set("class", "wikilink missing")
+            el.set("title", f"No note named '{title}'")
+        else:
+            el = etree.Element("a")
+            el.set("class", "wikilink")
+            el.set("href", url)
+        el.text = title
+        return el, m.start(0), m.end(0)
+
+
+class WikiLinkExtension(Extension):
+    """[[Title]] becomes a link to resolve(Title), or a span marked missing when that returns None."""
+
+    def __init__(self, resolve, **kwargs):
+        self.resolve = resolve
+        super().__init__(**kwargs)
+
+    def extendMarkdown(self, md):
+        # Runs before the emphasis and link patterns so titles are taken literally
+        md.inlinePatterns.register(WikiLinkProcessor(LINK_PATTERN.pattern, md, self.resolve), "wikilink", 175)
+
+
+# URL schemes links and images may use; URLs without a scheme (relative paths, #fragments) are always allowed
+SAFE_SCHEMES = ("http", "https", "mailto")
+
+
+def is_safe_url(value):
+    """True if a link or image URL has no scheme or one of SAFE_SCHEMES."""
+    # Browsers decode entities and ignore whitespace and control characters inside the scheme
+    url = "".join(ch for ch in html.unescape(value) if ch.isprintable() and not ch.isspace())
+    scheme, colon, _ = url.partition(":")
+    if not colon or any(ch in scheme for ch in "/?#"):
+        return True
+    return scheme.lower() in SAFE_SCHEMES
+
+
+class UnsafeUrlProcessor(Treeprocessor):
+    def run(self, root):
+        for el in root.iter():
+            for attribute in ("href", "src"):
+                value = el.get(attribute)
+                if value is not None and not is_safe_url(value):
+                    el.set(attribute, "#")
+
+
+class SafeHtmlExtension(Extension):
+    """Escape raw HTML instead of passing it through, and neutralise URLs with schemes other than SAFE_SCHEMES."""
+
+    def extendMarkdown(self, md):
+        md.preprocessors.deregister("html_block")
+        md.inlinePatterns.deregister("html")
+        md.treeprocessors.register(UnsafeUrlProcessor(md), "unsafe_urls", 0)
+
+
+def render_markdown(text, resolve):
+    """
+    Markdown to HTML with [[wiki]] references resolved through resolve(title) -> url or None.
+    Notes may come from archives or other editors, so raw HTML in them is escaped.
+    """
+    return markdown.markdown(text, extensions=["fenced_code", "tables", SafeHtmlExtension(), WikiLinkExtension(resolve)])
+
+
+class RenderCache:
+    """
+    LRU cache of rendered notes keyed by (path, mtime, size, graph version),
+    holding at most max_bytes of HTML. Entries are (html, etag, mtime).
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, path, version, render):
+        """
+        Cached render for the file at path; on a miss render(content) builds
+        the HTML. Raises FileNotFoundError if the file is gone.
+        """
+        st = os.stat(path)
+        key = (path, st.st_mtime_ns, st.st_size, version)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                return entry
+
+        with open(path, "r") as f:
+            text = f.read()
+        metrics.count_io("note", "read", len(text))
+        with metrics.span("note.render"):
+            html = render(text)
+        etag = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+        entry = (html, etag, st.st_mtime)
+
+        with self.lock:
+            if key not in self.entries:
+                self.entries[key] = entry
+                self.size += len(html)
+                while self.size > self.max_bytes and len(self.entries) > 1:
+                    _, (old_html, _, _) = self.entries.popitem(last=False)
+                    self.size -= len(old_html)
+        return entry
+
+    def discard(self, path):
+        """Drop every cached render of path."""
+        with self.lock:
+            for key in [key for key in self.entries if key[0] == path]:
+                self.size -= len(self.entries.pop(key)[0])
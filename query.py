@@ -0,0 +1,174 @@
+from itertools import chain
+import numpy as np
+from metrics import timed
+
+
+def _csr(n, sources, targets, columns=None):
+    """Deduplicated CSR matrix (indptr, indices) with n rows from parallel id arrays; rows are sorted."""
+    width = max(n if columns is None else columns, 1)
+    keys = np.sort(sources.astype(np.int64) * width + targets)
+    if keys.size:
+        keys = keys[np.concatenate(([True], keys[1:] != keys[:-1]))]
+    rows = (keys // width).astype(np.int32)
+    indices = (keys % width).astype(np.int32)
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n), out=indptr[1:])
+    return indptr, indices
+
+
+def _expand(indptr, indices, frontier):
+    """All (neighbor, origin) pairs for the rows in frontier, without a Python loop."""
+    starts = indptr[frontier]
+    counts = indptr[frontier + 1] - starts
+    total = int(counts.sum())
+    if total == 0:
+        return indices[:0], frontier[:0]
+    offsets = np.repeat(starts - (np.cumsum(counts) - counts), counts) + np.arange(total)
+    return indices[offsets], np.repeat(frontier, counts)
+
+
+class GraphQuery:
+    """
+    Read-only relationship queries over a snapshot of the graph.
+
+    Notes get integer ids and links are held as CSR arrays (indptr/indices)
+    for outgoing and undirected adjacency, plus note -> tag and tag -> note
+    incidence in the same form. Traversals expand a whole BFS level at a time
+    with numpy, so queries stay in the milliseconds on graphs with millions of
+    edges. Build one per graph version (see Graph.query); it does not follow
+    later mutations.
+    """
+
+    @timed("query.build")
+    def __init__(self, data):
+        self.version = data.get("version", 0)
+        tables = [data.get(name) for name in ("notes", "links", "tags")]
+        if all(getattr(table, "pristine", False) for table in tables) and len({id(table.snapshot) for table in tables}) == 1:
+            self._from_snapshot(tables[0].snapshot)
+            return
+
+        titles = dict.fromkeys(data.get("notes", {}))
+        titles.update(dict.fromkeys(data.get("links", {})))
+        titles.update(dict.fromkeys(chain.from_iterable(data.get("links", {}).values())))
+        titles.update(dict.fromkeys(chain.from_iterable(data.get("tags", {}).values())))
+        self.titles = list(titles)
+        self.ids = {title: i for i, title in enumerate(self.titles)}
+        n = len(self.titles)
+
+        lookup = self.ids.__getitem__
+        links = data.get("links", {})
+        sources, targets = self._pairs(links, lookup, lookup)
+        self.out_ptr, self.out_idx = _csr(n, sources, targets)
+        self.adj_ptr, self.adj_idx = _csr(n, np.concatenate([sources, targets]), np.concatenate([targets, sources]))
+
+        tags = data.get("tags", {})
+        self.tag_names = list(tags)
+        tag_ids, note_ids = self._pairs(tags, {tag: i for i, tag in enumerate(tags)}.__getitem__, lookup)
+        self.tag_ptr, self.tag_notes = _csr(len(self.tag_names), tag_ids, note_ids, n)
+        self.note_tag_ptr, self.note_tags = _csr(n, note_ids, tag_ids, len(self.tag_names))
+
+    def _from_snapshot(self, snap):
+        """Build the arrays straight from an unmodified binary snapshot, whose string ids already number the notes."""
+        n = snap.n_titles
+        self.titles = [snap.string(i) for i in range(n)]
+        self.ids = {title: i for i, title in enumerate(self.titles)}
+
+        link_ptr = snap.numpy("link_ptr")
+        sources = np.repeat(snap.numpy("link_sources"), np.diff(link_ptr))
+        targets = snap.numpy("link_targets")
+        self.out_ptr, self.out_idx = _csr(n, sources, targets)
+        self.adj_ptr, self.adj_idx = _csr(n, np.concatenate([sources, targets]), np.concatenate([targets, sources]))
+
+        tag_strings = snap.numpy("tag_ids")
+        self.tag_names = [snap.string(int(i)) for i in tag_strings]
+        tag_ids = np.repeat(np.arange(len(tag_strings), dtype=np.int32), np.diff(snap.numpy("tag_ptr")))
+        note_ids = snap.numpy("tag_notes")
+        self.tag_ptr, self.tag_notes = _csr(len(self.tag_names), tag_ids, note_ids, n)
+        self.note_tag_ptr, self.note_tags = _csr(n, note_ids, tag_ids, len(self.tag_names))
+
+    @staticmethod
+    def _pairs(mapping, key_id, value_id):
+        """Parallel id arrays for every (key, value) in a {key: [values]} dict."""
+        lengths = np.fromiter(map(len, mapping.values()), np.int64, len(mapping))
+        keys = np.repeat(np.fromiter(map(key_id, mapping), np.int32, len(mapping)), lengths)
+        values = np.fromiter(map(value_id, chain.from_iterable(mapping.values())), np.int32, int(lengths.sum()))
+        return keys, values
+
+    def _adjacency(self, directed):
+        return (self.out_ptr, self.out_idx) if directed else (self.adj_ptr, self.adj_idx)
+
+    def neighbors(self, title, directed=False):
+        indptr, indices = self._adjacency(directed)
+        i = self.ids[title]
+        return [self.titles[j] for j in indices[indptr[i]:indptr[i + 1]]]
+
+    def shortest_path(self, source, target, directed=True):
+        """Fewest-hops path from source to target as a list of titles, or None if unreachable."""
+        indptr, indices = self._adjacency(directed)
+        start, goal = self.ids[source], self.ids[target]
+        parent = np.full(len(self.titles), -1, dtype=np.int32)
+        parent[start] = start
+        frontier = np.array([start], dtype=np.int32)
+        while frontier.size and parent[goal] < 0:
+            reached, origin = _expand(indptr, indices, frontier)
+            new = parent[reached] < 0
+            reached, origin = reached[new], origin[new]
+            reached, first = np.unique(reached, return_index=True)
+            parent[reached] = origin[first]
+            frontier = reached
+        if parent[goal] < 0:
+            return None
+        path = [goal]
+        while path[-1] != start:
+            path.append(int(parent[path[-1]]))
+        return [self.titles[i] for i in reversed(path)]
+
+    def k_hop(self, title, k, directed=False, limit=None):
+        """[(title, hops)] for every note within k hops of title (excluding itself), nearest first."""
+        indptr, indices = self._adjacency(directed)
+        start = self.ids[title]
+        seen = np.zeros(len(self.titles), dtype=bool)
+        seen[start] = True
+        frontier = np.array([start], dtype=np.int32)
+        result = []
+        for hops in range(1, k + 1):
+            reached, _ = _expand(indptr, indices, frontier)
+            frontier = np.unique(reached[~seen[reached]])
+            if not frontier.size:
+                break
+            seen[frontier] = True
+            result.extend((self.titles[i], hops) for i in sorted(frontier, key=self.titles.__getitem__))
+            if limit is not None and len(result) >= limit:
+                return result[:limit]
+        return result
+
+    def common_neighbors(self, a, b):
+        """Notes linked with both a and b, in either direction."""
+        ia, ib = self.ids[a], self.ids[b]
+        ptr, idx = self.adj_ptr, self.adj_idx
+        common = np.intersect1d(idx[ptr[ia]:ptr[ia + 1]], idx[ptr[ib]:ptr[ib + 1]], assume_unique=True)
+        return sorted(self.titles[i] for i in common if i != ia and i != ib)
+
+    def related(self, title, limit=10, link_weight=1.0, tag_weight=1.0):
+        """
+        Notes ranked by how many neighbors they share with title plus how many
+        tags (the per-note slice of the tag co-occurrence matrix).
+        Returns [(title, score, shared_links, shared_tags)], best first.
+        """
+        i = self.ids[title]
+        n = len(self.titles)
+        ptr, idx = self.adj_ptr, self.adj_idx
+        two_hop, _ = _expand(ptr, idx, idx[ptr[i]:ptr[i + 1]])
+        shared_links = np.bincount(two_hop, minlength=n)
+        tagged, _ = _expand(self.tag_ptr, self.tag_notes, self.note_tags[self.note_tag_ptr[i]:self.note_tag_ptr[i + 1]])
+        shared_tags = np.bincount(tagged, minlength=n)
+
+        score = link_weight * shared_links + tag_weight * shared_tags
+        score[i] = 0
+        candidates = np.flatnonzero(score > 0)
+        if limit is not None and limit <= 0:
+            return []
+        if limit is not None and candidates.size > limit:
+            candidates = candidates[np.argpartition(-score[candidates], limit - 1)[:limit]]
+        ranked = sorted(candidates, key=lambda j: (-score[j], self.titles[j]))
+        return [(self.titles[j], float(score[j]), int(shared_links[j]), int(shared_tags[j])) for j in ranked]
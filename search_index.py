@@ -0,0 +1,229 @@
+import os
+import json
+import re
+import time
+import sqlite3
+import threading
+import contextlib
+import metrics
+
+TOKEN_PATTERN = re.compile(r"\w+")
+QUERY_PATTERN = re.compile(r'"([^"]*)"|(\S+)')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (id INTEGER PRIMARY KEY, doc_id TEXT UNIQUE NOT NULL, stamp TEXT);
+CREATE VIRTUAL TABLE IF NOT EXISTS terms USING fts5(body, tokenize = "unicode61 remove_diacritics 0");
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+
+def tokenize(text):
+    """Split text into lowercase word tokens."""
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def log_position(key):
+    """LogStore position of a log document key "<segment>:<entry>"."""
+    seq, number = key.split(":")
+    return [int(seq), int(number)]
+
+
+def _phrase(terms):
+    """FTS5 string for terms that must appear next to each other (a single term is a one-word phrase)."""
+    return '"' + " ".join(terms) + '"'
+
+
+class SearchIndex:
+    """
+    Persistent full-text index over note bodies and logs, kept in an SQLite
+    FTS5 table next to the graph file, so a query reads only the postings
+    it needs instead of loading the whole index.
+
+    Documents are keyed "note:<title>" or "log:<segment>:<entry>". Notes keep
+    a stamp (file mtime/size). The graph keeps notes current as they are
+    created, saved or synced (refresh_note, remove); refresh() re-stats the
+    whole notes directory only when the directory itself changed or
+    RESCAN_SECONDS have passed, to pick up edits nobody reported. Log
+    entries never change, so the index just records the log store position
+    it has read up to.
+
+    One instance is shared by the server's threads; lock serializes use of
+    its connection. Other processes share the database file.
+    """
+
+    # Re-stat every note at least this often, for files edited while no watcher ran
+    RESCAN_SECONDS = 60
+    # A notes directory modified this recently may change again without its mtime moving
+    RACY_SECONDS = 2
+
+    def __init__(self, index_file):
+        self.index_file = index_file
+        self.lock = threading.RLock()
+        directory = os.path.dirname(index_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(index_file, isolation_level=None, check_same_thread=False, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        with self.lock:
+            if self.conn.in_transaction:  # nested in another update
+                yield
+                return
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+
+    def _meta(self, key):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _set_meta(self, key, value):
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+
+    @property
+    def log_position(self):
+        """Position of the last indexed log entry, or None."""
+        with self.lock:
+            return self._meta("log_position")
+
+    def add(self, doc_id, text, stamp):
+        """(Re)index a single document."""
+        with self._transaction():
+            self.remove(doc_id)
+            cursor = self.conn.execute("INSERT INTO docs (doc_id, stamp) VALUES (?, ?)", (doc_id, json.dumps(stamp)))
+            self.conn.execute("INSERT INTO terms (rowid, body) VALUES (?, ?)", (cursor.lastrowid, text))
+            metrics.count_io("sidecar", "write", len(text))
+
+    def remove(self, doc_id):
+        """Drop a document from the index."""
+        with self._transaction():
+            row = self.conn.execute("SELECT id FROM docs WHERE doc_id = ?", (doc_id,)).fetchone()
+            if row is None:
+                return
+            self.conn.execute("DELETE FROM terms WHERE rowid = ?", row)
+            self.conn.execute("DELETE FROM docs WHERE id = ?", row)
+
+    def refresh_note(self, doc_id, path):
+        """Re-index one note file right away, e.g. after it was saved."""
+        with self.lock:
+            try:
+                st = os.stat(path)
+                with open(path, "r") as f:
+                    text = f.read()
+            except FileNotFoundError:
+                self.remove(doc_id)
+                return
+            metrics.count_io("note", "read", len(text))
+            self.add(doc_id, text, [st.st_mtime_ns, st.st_size])
+
+    def refresh(self, notes, logs, notes_dir=None, force=False):
+        """
+        Bring the index up to date with notes() -> {title: path} and the
+        LogStore logs. Notes are listed and re-stat'ed only when notes_dir
+        changed since the last scan, after RESCAN_SECONDS, or with force=True.
+        """
+        with self.lock:
+            end = logs.end() if logs is not None else None
+            scan_notes = force or self._notes_stale(notes_dir)
+            if not scan_notes and end == self._meta("log_end"):
+                return  # nothing to write, so no write lock either
+
+            with self._transaction():
+                if scan_notes:
+                    self._scan_notes(notes(), notes_dir)
+                if logs is not None:
+                    self._index_logs(logs, end)
+
+    def _index_logs(self, logs, end):
+        position = self._meta("log_position")
+        if position is not None and position >= end:
+            self._drop_logs()  # the log store was replaced
+            position = None
+        for entry in logs.entries(cursor=position):
+            seq, number = entry["id"]
+            self.add(f"log:{seq}:{number}", f"{entry['title']}\n{entry['text']}", None)
+            position = entry["id"]
+        self._set_meta("log_position", position)
+        self._set_meta("log_end", end)
+
+    def _dir_stamp(self, notes_dir):
+        if notes_dir is None:
+            return None
+        try:
+            return os.stat(notes_dir).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _notes_stale(self, notes_dir):
+        scan = self._meta("notes_scan")
+        if scan is None or time.time() - scan["at"] > self.RESCAN_SECONDS:
+            return True
+        return scan["dir"] != self._dir_stamp(notes_dir)
+
+    def _scan_notes(self, notes, notes_dir):
+        started = time.time()
+        dir_stamp = self._dir_stamp(notes_dir)
+        if dir_stamp is not None and dir_stamp / 1e9 > started - self.RACY_SECONDS:
+            # A change in the same mtime tick would not move the stamp, so scan again next time
+            dir_stamp = None
+        indexed = {doc_id: stamp for doc_id, stamp in self.conn.execute("SELECT doc_id, stamp FROM docs WHERE doc_id GLOB 'note:*'")}
+        seen = set()
+        for title, path in notes.items():
+            if not isinstance(path, str):
+                continue
+            doc_id = f"note:{title}"
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            seen.add(doc_id)
+            if indexed.get(doc_id) == json.dumps([st.st_mtime_ns, st.st_size]):
+                continue
+            self.refresh_note(doc_id, path)
+        for doc_id in indexed.keys() - seen:
+            self.remove(doc_id)
+        self._set_meta("notes_scan", {"at": started, "dir": dir_stamp})
+
+    def _drop_logs(self):
+        self.conn.execute("DELETE FROM terms WHERE rowid IN (SELECT id FROM docs WHERE doc_id GLOB 'log:*')")
+        self.conn.execute("DELETE FROM docs WHERE doc_id GLOB 'log:*'")
+        self._set_meta("log_position", None)
+
+    def _match(self, query):
+        """
+        FTS5 query for our syntax: quoted text is a phrase, a trailing * makes
+        a prefix query, anything else is a plain term. Every clause must match.
+        """
+        clauses = []
+        for phrase, word in QUERY_PATTERN.findall(query):
+            if phrase:
+                terms = tokenize(phrase)
+                if terms:
+                    clauses.append(_phrase(terms))
+            elif word.endswith("*"):
+                clauses.extend(_phrase([prefix]) + "*" for prefix in tokenize(word))
+            else:
+                clauses.extend(_phrase([term]) for term in tokenize(word))
+        return " AND ".join(clauses)
+
+    def search(self, query, limit=None):
+        """Return [(doc_id, score)] for documents matching every clause, best BM25 score first."""
+        match = self._match(query)
+        if not match:
+            return []
+        with self.lock:
+            # bm25() is lower for better matches
+            rows = self.conn.execute(
+                "SELECT docs.doc_id, bm25(terms) AS rank FROM terms JOIN docs ON docs.id = terms.rowid"
+                " WHERE terms MATCH ? ORDER BY rank, docs.doc_id LIMIT ?",
+                (match, limit if limit else -1),
+            ).fetchall()
+        return [(doc_id, -rank) for doc_id, rank in rows]
@@ -1,16 +1,80 @@
-from flask import Flask, request, render_template, redirect, url_for, jsonify, flash
+from flask import Flask, request, render_template, redirect, url_for, jsonify, flash, send_file, make_response, g, session, stream_template
 from storage import graph, open_note, log_entry
+from watcher import GraphWatcher
+from api import api, page, sorted_keys, job_queue, log_entries
+from jobs import QueueFull
+from graph import init_vault
+from note_render import RenderCache, render_markdown
+import matplotlib
+matplotlib.use("Agg")  # render off-screen; the server has no display
 import analysis
+import clusters
+import metrics
+import multiprocessing
 import os
-import json
+import time
+from datetime import datetime
 
 app = Flask(__name__)
 app.secret_key = "supersecret"  # for flash messages
+app.register_blueprint(api)
+PAGE_SIZE = 200
 GRAPH_FILE = os.getenv("GRAPH_FILE", os.path.expanduser("~/.sodium/graph.json"))
 
+# The server keeps one in-memory graph; the watcher applies changes made by the
+# CLI or an editor (journal appends, new or edited note files) as they happen.
+watcher = GraphWatcher(graph)
+note_cache = {}
+watcher.on_note_change(lambda title: note_cache.pop(title, None))
+# Rendered note HTML; entries are keyed by file mtime and graph version, so they never go stale
+rendered_notes = RenderCache(int(os.getenv("SODIUM_RENDER_CACHE_MB", "32")) * 1024 * 1024)
+# Job workers spawned by `python server.py` re-import this module; only the server process watches
+if os.getenv("SODIUM_WATCH", "1") != "0" and multiprocessing.parent_process() is None:
+    watcher.start()
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_latency(response):
+    start = g.pop("request_start", None)
+    if start is not None:
+        # Label by URL rule, not path, so the number of series stays bounded
+        route = request.url_rule.rule if request.url_rule else "<unmatched>"
+        labels = {"method": request.method, "route": route, "status": response.status_code}
+        if response.is_streamed:
+            # The body is generated after this hook returns; stop the clock once it has been sent
+            response.call_on_close(lambda: metrics.REQUEST_SECONDS.observe(time.perf_counter() - start, **labels))
+        else:
+            metrics.REQUEST_SECONDS.observe(time.perf_counter() - start, **labels)
+    return response
+
+@app.route("/metrics")
+def prometheus_metrics():
+    """Prometheus scrape endpoint; values are per worker process."""
+    return metrics.render(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+@app.template_filter("timestamp")
+def format_timestamp(ts):
+    return datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S") if ts else "imported"
+
+def read_note(title):
+    """Return a note's content, reading the file only on a cache miss."""
+    content = note_cache.get(title)
+    if content is None:
+        path = graph.graph["notes"][title]
+        with open(path, "r") as f:
+            content = f.read()
+        metrics.count_io("note", "read", len(content))
+        # Only files inside NOTES_DIR are watched, so only those can be cached safely
+        if os.path.dirname(os.path.abspath(path)) == os.path.abspath(graph.notes_dir):
+            note_cache[title] = content
+    return content
+
 @app.route("/", methods=["GET", "POST"])
 def index():
-    notes = sorted(graph.graph["notes"].keys())
+    notes, next_cursor = page(sorted_keys("notes"), request.args.get("cursor"), PAGE_SIZE)
     
     if request.method == "POST":
         log_title = request.form.get("log_title")
@@ -20,19 +84,87 @@ def index():
             log_entry(GRAPH_FILE, log_title, log_text)
             flash(f"Added log for '{log_title}'.", "success")
     
-    return render_template("index.html", notes=notes)
+    return render_template("index.html", notes=notes, next_cursor=next_cursor)
+
 
+def resolve_note(title):
+    """URL of a note for [[wiki]] links, or None if there is no such note."""
+    if title not in graph.graph["notes"]:
+        return None
+    return url_for("view_note", title=title)
 
 @app.route("/note/<title>")
 def view_note(title):
-    if title not in graph.graph["notes"]:
+    path = graph.graph["notes"].get(title)
+    if path is None:
         return f"Note '{title}' not found", 404
-    path = graph.graph["notes"][title]
-    with open(path, "r") as f:
-        content = f.read()
-    links = graph.graph["links"].get(title, [])
-    tags = [tag for tag, notes in graph.graph["tags"].items() if title in notes]
-    return render_template("note.html", title=title, content=content, links=links,tags=tags)
+    try:
+        html, etag, mtime = rendered_notes.get(path, graph.version, lambda text: render_markdown(text, resolve_note))
+    except FileNotFoundError:
+        return f"Note file for '{title}' not found", 404
+    cluster = cluster_of(title)
+    if cluster is not None:
+        etag = f"{etag}-c{cluster}"  # assignments can arrive after the graph version changed
+    # The page only changes with the file or the graph (links, tags), which both feed the etag.
+    # Pending flash messages (e.g. after /log) are shown once, so that page is neither a 304 nor cached.
+    flashes = "_flashes" in session
+    if etag in request.if_none_match and not flashes:
+        response = make_response("", 304)
+    else:
+        links = graph.graph["links"].get(title, [])
+        tags = graph.tags_of(title)
+        response = make_response(render_template("note.html", title=title, content=html, links=links, tags=tags, cluster=cluster))
+    if flashes:
+        response.cache_control.no_store = True
+        return response
+    response.set_etag(etag)
+    response.last_modified = mtime
+    response.cache_control.no_cache = True
+    return response
+
+_cluster_groups = {}
+_data_version = {}
+
+def data_version():
+    """graph_version of the in-memory graph, recounted only after it changed."""
+    with graph.lock:
+        key = (id(graph.graph), graph.version)
+        if _data_version.get("key") != key:
+            _data_version.update(key=key, value=clusters.graph_version(graph.graph))
+        return _data_version["value"]
+
+def current_clusters():
+    """(clusters or None, current, {id: members}); recomputation happens in the background."""
+    with graph.lock:
+        result, current = clusters.cluster_async(graph.storage_file, graph.graph, job_queue, version=data_version())
+    if result is None:
+        return None, current, {}
+    key = (result["version"], result["method"])
+    if _cluster_groups.get("key") != key:
+        _cluster_groups.update(key=key, groups=clusters.group_clusters(result["communities"]))
+    return result, current, _cluster_groups["groups"]
+
+def cluster_of(title):
+    """Community id of a note for navigation, only if clusters are up to date (never blocks)."""
+    saved = clusters.load_clusters(graph.storage_file)
+    if saved and saved.get("version") == data_version():
+        return saved["communities"].get(title)
+    return None
+
+@app.route("/clusters")
+def list_clusters():
+    _, current, groups = current_clusters()
+    start = max(0, request.args.get("start", 0, type=int))
+    shown = list(groups.items())[start:start + PAGE_SIZE]
+    next_start = start + PAGE_SIZE if start + PAGE_SIZE < len(groups) else None
+    return render_template("clusters.html", groups=groups, shown=shown, cluster=None, current=current, next_start=next_start)
+
+@app.route("/clusters/<int:cid>")
+def view_cluster(cid):
+    _, current, groups = current_clusters()
+    if cid not in groups:
+        return f"Cluster {cid} not found", 404
+    return render_template("clusters.html", groups=groups, cluster=cid, current=current)
 
 @app.route("/new", methods=["POST"])
 def new_note():
@@ -49,15 +181,22 @@ def edit_note(title):
     if request.method == "POST":
         with open(path, "w") as f:
             f.write(request.form.get("content", ""))
+            metrics.count_io("note", "write", f.tell())
+        note_cache.pop(title, None)
+        rendered_notes.discard(path)
+        # Re-parse only this note's [[references]] and apply the link delta
+        added, removed = graph.sync_note(title)
+        if added or removed:
+            flash(f"Links updated: {len(added)} added, {len(removed)} removed.", "info")
         return redirect(url_for("view_note", title=title))
     else:
-        with open(path, "r") as f:
-            content = f.read()
+        content = read_note(title)
         return render_template("edit.html", title=title, content=content)
 
 @app.route("/delete/<title>", methods=["POST"])
 def delete_note(title):
     graph.remove_note(title)
+    note_cache.pop(title, None)
     flash(f"Deleted note '{title}'.", "warning")
     return redirect(url_for("index"))
 
@@ -79,35 +218,78 @@ def tag_note():
 
 @app.route("/tags")
 def list_tags():
-    return render_template("tags.html", tags=graph.graph["tags"])
+    names, next_cursor = page(sorted_keys("tags"), request.args.get("cursor"), PAGE_SIZE)
+    tags = {tag: graph.graph["tags"].get(tag, []) for tag in names}
+    return render_template("tags.html", tags=tags, next_cursor=next_cursor)
 
 @app.route("/search")
 def search():
     query = request.args.get("q", "")
     found = []
     if query:
-        for note in graph.graph["notes"]:
-            path = graph.graph["notes"][note]
-            try:
-                with open(path, "r") as f:
-                    content = f.read()
-                    if query.lower() in content.lower():
-                        found.append(note)
-            except FileNotFoundError:
-                pass
+        found, _ = graph.search(query)
     return render_template("search.html", query=query, results=found)
 
+GRAPH_MODES = {"viz", "hmap", "cen"}
+IMAGE_TYPES = {"png": "image/png", "svg": "image/svg+xml"}
+
+def graph_params(mode):
+    """Rendering parameters from the query string that apply to the given mode."""
+    params = {}
+    if mode == "cen":
+        params["k"] = request.args.get("k", type=int)
+    if mode == "hmap":
+        params["top_k"] = request.args.get("top_k", type=int)
+    if mode in {"cen", "hmap"}:
+        params["top_n"] = request.args.get("top_n", 30, type=int)
+    return params
+
+def submit_render(mode, fmt):
+    """
+    (path, etag, job id): the render for the current graph version, with a job
+    id only if it is not on disk yet and was queued. Raises QueueFull.
+    """
+    params = graph_params(mode)
+    with graph.lock:
+        path, etag = analysis.render_path(graph.storage_file, mode, fmt, data=graph.graph, **params)
+    if os.path.exists(path):
+        return path, etag, None
+    job_id = job_queue.submit(analysis.render_job, graph.storage_file, mode, fmt,
+                              key=("render", path), name=f"render {mode}.{fmt}", **params)
+    return path, etag, job_id
+
 @app.route("/graph/<mode>")
 def visualize(mode):
-    if mode not in {"viz", "hmap", "cen"}:
+    if mode not in GRAPH_MODES:
         return "Invalid mode", 400
-    result = analysis.analyse(graph.graph_path, mode)
-    return render_template("graph.html", mode=mode, result=result)
+    try:
+        _, _, job_id = submit_render(mode, "png")
+    except QueueFull:
+        return "Too many graph jobs are running; try again shortly.", 503, {"Retry-After": "5"}
+    return render_template("graph.html", mode=mode, params=request.args.to_dict(), job_id=job_id)
+
+@app.route("/graph/<mode>.<fmt>")
+def graph_image(mode, fmt):
+    if mode not in GRAPH_MODES or fmt not in IMAGE_TYPES:
+        return "Invalid mode", 400
+    try:
+        path, etag, job_id = submit_render(mode, fmt)
+    except QueueFull:
+        return "Too many graph jobs are running; try again shortly.", 503, {"Retry-After": "5"}
+    if job_id is not None:
+        # Rendering happens in the job pool; poll the job, then request the image again
+        return {"job": job_id, "status": url_for("api.job_status", job_id=job_id)}, 202, {"Retry-After": "1"}
+    # conditional=True answers If-None-Match with 304 Not Modified
+    return send_file(path, mimetype=IMAGE_TYPES[fmt], etag=etag, conditional=True, max_age=0)
 
 @app.route("/init")
 def init_graph():
-    graph.init_graph()
-    flash("Graph initialized from notes directory.", "info")
+    try:
+        job_queue.submit(init_vault, graph.storage_file, graph.notes_dir, key=("init", graph.storage_file), name="init")
+    except QueueFull:
+        flash("Too many background jobs are running; try again shortly.", "warning")
+        return redirect(url_for("index"))
+    flash("Syncing the graph with the notes directory in the background.", "info")
     return redirect(url_for("index"))
 
 @app.route("/open/<title>")
@@ -126,18 +308,11 @@ def add_log():
 
 @app.route("/logs")
 def view_logs():
-    # Load logs from the graph file
-    logs = {}
-    if os.path.exists(GRAPH_FILE):
-        with open(GRAPH_FILE, "r") as f:
-            try:
-                data = json.load(f)
-                logs = data.get("logs", {})
-            except json.JSONDecodeError:
-                logs = {}
-
-    return render_template("logs.html", logs=logs)
+    # Entries are read from the log store while the page renders
+    entries, next_cursor = log_entries(PAGE_SIZE)
+    return stream_template("logs.html", entries=entries, next_cursor=next_cursor, title=request.args.get("title", ""))
 
 
 if __name__ == "__main__":
+    # Development server; see gunicorn.conf.py for production serving
     app.run(debug=True)
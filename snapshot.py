@@ -0,0 +1,346 @@
+"""
+Binary graph snapshot format (graph.snap), an alternative to the JSON
+snapshot for large vaults.
+
+Layout: the magic bytes, a little-endian u64 header length and a JSON header
+naming the sections, each 8-byte aligned:
+
+    string_offsets, string_data           interned string table, note titles first
+    notes, note_paths                     string ids per note
+    link_sources, link_ptr, link_targets  CSR adjacency, one row per graph["links"] key
+    tag_ids, tag_ptr, tag_notes           tag postings, one row per graph["tags"] key
+    weight_sources, weight_ptr,
+    weight_targets, weight_counts         graph["weights"] in the same form
+    <table>_order                         row numbers of each table sorted by key, for lookups
+
+Every title, tag and path is stored once however often it is referenced.
+load() maps the file and returns the usual graph dict, except that notes,
+links, tags and weights are SnapshotTable mappings that decode rows on
+access from the mapped arrays; a table turns into a plain dict the first
+time it is modified.
+"""
+import os
+import sys
+import json
+import mmap
+import struct
+from array import array
+from collections.abc import ItemsView, MutableMapping, ValuesView
+
+MAGIC = b"SODSNAP1"
+TABLES = ("notes", "links", "tags", "weights")
+# (row keys, row pointers, values) sections of the CSR tables
+CSR_SECTIONS = {
+    "links": ("link_sources", "link_ptr", "link_targets"),
+    "tags": ("tag_ids", "tag_ptr", "tag_notes"),
+    "weights": ("weight_sources", "weight_ptr", "weight_targets"),
+}
+_LITTLE = sys.byteorder == "little"
+
+
+def _pack(typecode, values):
+    data = array(typecode, values)
+    if not _LITTLE:
+        data.byteswap()
+    return data.tobytes()
+
+
+def encode(data):
+    """Serialize a graph dict to snapshot bytes."""
+    ids = {}
+    strings = []
+
+    def intern(value):
+        i = ids.get(value)
+        if i is None:
+            i = ids[value] = len(strings)
+            strings.append(value)
+        return i
+
+    notes = data.get("notes", {})
+    links = data.get("links", {})
+    tags = data.get("tags", {})
+    weights = data.get("weights", {})
+    for title in notes:
+        intern(title)
+    for source, targets in links.items():
+        intern(source)
+        for target in targets:
+            intern(target)
+    for members in tags.values():
+        for note in members:
+            intern(note)
+    n_titles = len(strings)
+
+    sections = {}
+    odd_paths = {}
+    note_ids, path_ids = [], []
+    for title, path in notes.items():
+        note_ids.append(intern(title))
+        if isinstance(path, str):
+            path_ids.append(intern(path))
+        else:
+            path_ids.append(-1)
+            odd_paths[title] = path
+    sections["notes"] = ("i", note_ids)
+    sections["note_paths"] = ("i", path_ids)
+    for table, mapping in (("links", links), ("tags", tags), ("weights", weights)):
+        keys, ptr, values = [], [0], []
+        for key, row in mapping.items():
+            keys.append(intern(key))
+            values.extend(map(intern, row))
+            ptr.append(len(values))
+        keys_name, ptr_name, values_name = CSR_SECTIONS[table]
+        sections[keys_name] = ("i", keys)
+        sections[ptr_name] = ("q", ptr)
+        sections[values_name] = ("i", values)
+    sections["weight_counts"] = ("i", [count for row in weights.values() for count in row.values()])
+
+    encoded = [s.encode("utf-8") for s in strings]
+    for table in TABLES:
+        keys = sections["notes" if table == "notes" else CSR_SECTIONS[table][0]][1]
+        sections[f"{table}_order"] = ("i", sorted(range(len(keys)), key=lambda row: encoded[keys[row]]))
+    offsets = [0]
+    for raw in encoded:
+        offsets.append(offsets[-1] + len(raw))
+    sections["string_offsets"] = ("q", offsets)
+
+    blobs = {name: _pack(typecode, values) for name, (typecode, values) in sections.items()}
+    blobs["string_data"] = b"".join(encoded)
+    typecodes = {name: typecode for name, (typecode, _) in sections.items()}
+    typecodes["string_data"] = "B"
+
+    extra = {key: value for key, value in data.items() if key not in TABLES}
+    if odd_paths:
+        extra["_note_paths"] = odd_paths
+    header = {"strings": len(strings), "titles": n_titles, "extra": extra, "sections": {}}
+
+    # Section offsets depend on the header length, so lay them out relative to the header's end
+    position = 0
+    for name, blob in blobs.items():
+        header["sections"][name] = [position, len(blob) // array(typecodes[name]).itemsize, typecodes[name]]
+        position += len(blob) + (-len(blob)) % 8
+    header_bytes = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    header_bytes += b" " * ((-(len(MAGIC) + 8 + len(header_bytes))) % 8)
+
+    parts = [MAGIC, struct.pack("<Q", len(header_bytes)), header_bytes]
+    for blob in blobs.values():
+        parts.append(blob)
+        parts.append(b"\0" * ((-len(blob)) % 8))
+    return b"".join(parts)
+
+
+def load(path):
+    """Map a snapshot file and return its lazily decoded graph dict, or None if it is missing or invalid."""
+    try:
+        with open(path, "rb") as f:
+            if os.name == "nt":
+                buffer = f.read()  # a mapped file could not be replaced by the next compaction
+            else:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (FileNotFoundError, ValueError):  # ValueError: empty file
+        return None
+    try:
+        return Snapshot(buffer).graph()
+    except (ValueError, KeyError, struct.error):
+        return None
+
+
+class Snapshot:
+    """Typed views over the sections of a mapped snapshot."""
+
+    def __init__(self, buffer):
+        if buffer[:len(MAGIC)] != MAGIC:
+            raise ValueError("not a graph snapshot")
+        (header_length,) = struct.unpack_from("<Q", buffer, len(MAGIC))
+        start = len(MAGIC) + 8
+        self.header = json.loads(bytes(buffer[start:start + header_length]))
+        self.base = start + header_length
+        self.buffer = buffer
+        self.view = memoryview(buffer)
+        self.n_titles = self.header["titles"]
+        self.strings = [None] * self.header["strings"]
+        self.string_offsets = self.section("string_offsets")
+        self.string_data = self.section("string_data")
+
+    def section(self, name):
+        """A section as a sequence of ints (a memoryview cast to its type, or a byteswapped array)."""
+        offset, count, typecode = self.header["sections"][name]
+        size = array(typecode).itemsize
+        view = self.view[self.base + offset:self.base + offset + count * size]
+        if typecode == "B":
+            return view
+        if _LITTLE:
+            return view.cast(typecode)
+        values = array(typecode, bytes(view))
+        values.byteswap()
+        return values
+
+    def numpy(self, name):
+        """A section as a read-only numpy array over the mapping, without copying."""
+        import numpy as np
+
+        offset, count, typecode = self.header["sections"][name]
+        dtype = {"i": "<i4", "q": "<i8"}[typecode]
+        return np.frombuffer(self.buffer, dtype=dtype, count=count, offset=self.base + offset)
+
+    def raw(self, i):
+        return bytes(self.string_data[self.string_offsets[i]:self.string_offsets[i + 1]])
+
+    def string(self, i):
+        """String i of the table; each is decoded once, so repeated references share one object."""
+        value = self.strings[i]
+        if value is None:
+            value = self.strings[i] = str(self.string_data[self.string_offsets[i]:self.string_offsets[i + 1]], "utf-8")
+        return value
+
+    def graph(self):
+        data = dict(self.header["extra"])
+        odd_paths = data.pop("_note_paths", {})
+        string = self.string
+
+        paths = self.section("note_paths")
+        data["notes"] = SnapshotTable(self, self.section("notes"), lambda i, key: string(paths[i]) if paths[i] >= 0 else odd_paths[key])
+        for table, names in CSR_SECTIONS.items():
+            keys, ptr, values = map(self.section, names)
+            if table == "weights":
+                counts = self.section("weight_counts")
+                decode = lambda i, key, ptr=ptr, values=values, counts=counts: {
+                    string(values[j]): counts[j] for j in range(ptr[i], ptr[i + 1])
+                }
+            else:
+                decode = lambda i, key, ptr=ptr, values=values: [string(j) for j in values[ptr[i]:ptr[i + 1]]]
+            data[table] = SnapshotTable(self, keys, decode, table, ptr)
+        for table in TABLES:
+            data[table].order = self.section(f"{table}_order")
+        return data
+
+
+class SnapshotTable(MutableMapping):
+    """
+    A {string: value} table of a snapshot that decodes rows when they are
+    read. The first write copies it into a plain dict, so apply_op can
+    mutate it like any other graph table.
+    """
+
+    # Binary searches before a key -> row dict is built instead
+    SEARCHES_BEFORE_INDEX = 256
+
+    def __init__(self, snapshot, keys, decode, name="notes", ptr=None):
+        self.snapshot = snapshot
+        self.name = name
+        self.order = None
+        self._keys = keys
+        self._ptr = ptr
+        self._searches = 0
+        self._decode = decode
+        self._positions = None
+        self._dict = None
+
+    @property
+    def pristine(self):
+        """True while the table still reads straight from the snapshot."""
+        return self._dict is None
+
+    def value_count(self):
+        """Total length of all rows, read from the row pointers while the table is pristine."""
+        if self._dict is None and self._ptr is not None:
+            return self._ptr[-1] if len(self._ptr) else 0
+        return sum(map(len, self.values()))
+
+    def _rows(self):
+        if self._positions is None:
+            string = self.snapshot.string
+            self._positions = {string(key): i for i, key in enumerate(self._keys)}
+        return self._positions
+
+    def _find(self, key):
+        """Row number of key, or None."""
+        if self._positions is None and self.order is not None and self._searches < self.SEARCHES_BEFORE_INDEX:
+            # A few lookups (a CLI command) do not need every key decoded
+            self._searches += 1
+            if not isinstance(key, str):
+                return None
+            target = key.encode("utf-8")
+            raw, keys, order = self.snapshot.raw, self._keys, self.order
+            lo, hi = 0, len(order)
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if raw(keys[order[mid]]) < target:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            if lo < len(order) and raw(keys[order[lo]]) == target:
+                return order[lo]
+            return None
+        return self._rows().get(key)
+
+    def _materialize(self):
+        if self._dict is None:
+            self._dict = dict(self._pairs())
+            self._positions = None
+        return self._dict
+
+    def _pairs(self):
+        string, decode = self.snapshot.string, self._decode
+        for i, key in enumerate(self._keys):
+            title = string(key)
+            yield title, decode(i, title)
+
+    def __getitem__(self, key):
+        if self._dict is not None:
+            return self._dict[key]
+        i = self._find(key)
+        if i is None:
+            raise KeyError(key)
+        return self._decode(i, key)
+
+    def __contains__(self, key):
+        if self._dict is not None:
+            return key in self._dict
+        return self._find(key) is not None
+
+    def __iter__(self):
+        if self._dict is not None:
+            return iter(self._dict)
+        return map(self.snapshot.string, self._keys)
+
+    def __len__(self):
+        return len(self._dict if self._dict is not None else self._keys)
+
+    def __setitem__(self, key, value):
+        self._materialize()[key] = value
+
+    def __delitem__(self, key):
+        del self._materialize()[key]
+
+    def setdefault(self, key, default=None):
+        # The default implementation would hand out a decoded copy that the caller then mutates
+        return self._materialize().setdefault(key, default)
+
+    def items(self):
+        return self._dict.items() if self._dict is not None else _Items(self)
+
+    def values(self):
+        return self._dict.values() if self._dict is not None else _Values(self)
+
+    def __repr__(self):
+        return f"<SnapshotTable {self.name} ({len(self)} rows)>"
+
+
+class _Items(ItemsView):
+    def __iter__(self):
+        table = self._mapping
+        if table._dict is not None:
+            return iter(table._dict.items())
+        return table._pairs()
+
+
+class _Values(ValuesView):
+    def __iter__(self):
+        return (value for _, value in _Items(self._mapping))
+
+
+def plain(data):
+    """The graph dict with snapshot tables copied into plain dicts, e.g. for JSON export."""
+    return {key: dict(value.items()) if isinstance(value, SnapshotTable) else value for key, value in data.items()}
@@ -0,0 +1,254 @@
+import os
+import json
+import sqlite3
+import threading
+from journal import apply_op, empty_graph
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS notes (title TEXT PRIMARY KEY, path TEXT);
+CREATE TABLE IF NOT EXISTS links (id INTEGER PRIMARY KEY, source TEXT NOT NULL, target TEXT NOT NULL, weight INTEGER NOT NULL DEFAULT 1);
+CREATE INDEX IF NOT EXISTS links_source ON links (source);
+CREATE INDEX IF NOT EXISTS links_target ON links (target);
+CREATE TABLE IF NOT EXISTS tags (id INTEGER PRIMARY KEY, tag TEXT NOT NULL, note TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS tags_tag ON tags (tag);
+CREATE INDEX IF NOT EXISTS tags_note ON tags (note);
+CREATE TABLE IF NOT EXISTS logs (title TEXT PRIMARY KEY, content TEXT);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER);
+CREATE TABLE IF NOT EXISTS changes (seq INTEGER PRIMARY KEY AUTOINCREMENT, op TEXT NOT NULL, args TEXT NOT NULL);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0), ('generation', 0);
+"""
+
+
+class SqliteStore:
+    """
+    SQLite storage backend (WAL mode) with the same interface as Journal.
+
+    Notes, links and tags live in indexed tables and every operation is
+    applied in its own IMMEDIATE transaction, so readers in other processes
+    keep working while one process writes. The logs table only holds logs
+    written by older versions; Graph moves them to its LogStore. Each operation is also recorded in
+    a changes table; other processes replay it in catch_up() instead of
+    reloading. compact() rewrites all tables and bumps the generation, which
+    forces other processes to reload.
+    """
+
+    # Keep at most this many rows in the changes table.
+    MAX_CHANGES = 10000
+
+    def __init__(self, db_file):
+        self.db_file = db_file
+        os.makedirs(os.path.dirname(os.path.abspath(db_file)), exist_ok=True)
+        self.conn = sqlite3.connect(db_file, isolation_level=None, check_same_thread=False, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        if "weight" not in [row[1] for row in self.conn.execute("PRAGMA table_info(links)")]:
+            try:
+                self.conn.execute("ALTER TABLE links ADD COLUMN weight INTEGER NOT NULL DEFAULT 1")
+            except sqlite3.OperationalError:
+                pass  # another process added it first
+        self.lock = threading.RLock()
+        self.pending = 0  # nothing is ever waiting to be folded into a snapshot
+        self.last_seq = 0
+        self.generation = 0
+        self._own = set()
+
+    @property
+    def watch_files(self):
+        return [self.db_file, self.db_file + "-wal"]
+
+    def _meta(self, key):
+        return self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()[0]
+
+    def load(self):
+        """Read the whole graph into the usual dict layout."""
+        with self.lock:
+            self.conn.execute("BEGIN")
+            try:
+                data = empty_graph()
+                for title, path in self.conn.execute("SELECT title, path FROM notes ORDER BY rowid"):
+                    data["notes"][title] = path
+                for source, target, weight in self.conn.execute("SELECT source, target, weight FROM links ORDER BY id"):
+                    data["links"].setdefault(source, []).append(target)
+                    if weight > 1:
+                        data.setdefault("weights", {}).setdefault(source, {})[target] = weight
+                for tag, note in self.conn.execute("SELECT tag, note FROM tags ORDER BY id"):
+                    data["tags"].setdefault(tag, []).append(note)
+                logs = self.conn.execute("SELECT title, content FROM logs ORDER BY rowid").fetchall()
+                if logs:
+                    data["logs"] = {title: json.loads(content) for title, content in logs}
+                data["version"] = self._meta("version")
+                self.generation = self._meta("generation")
+                self.last_seq = self.conn.execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()[0]
+            finally:
+                self.conn.execute("COMMIT")
+            self._own.clear()
+            return data
+
+    def catch_up(self, data, index=None):
+        """Replay operations other processes committed since the last load; None means reload."""
+        with self.lock:
+            self.conn.execute("BEGIN")
+            try:
+                if self._meta("generation") != self.generation:
+                    return None
+                oldest = self.conn.execute("SELECT MIN(seq) FROM changes").fetchone()[0]
+                if oldest is not None and oldest > self.last_seq + 1:
+                    return None  # the entries we needed were pruned
+                rows = self.conn.execute(
+                    "SELECT seq, op, args FROM changes WHERE seq > ? ORDER BY seq", (self.last_seq,)
+                ).fetchall()
+            finally:
+                self.conn.execute("COMMIT")
+            applied = 0
+            for seq, op, args in rows:
+                self.last_seq = seq
+                if seq in self._own:
+                    self._own.discard(seq)
+                    continue
+                apply_op(data, op, json.loads(args), index)
+                applied += 1
+            return applied
+
+    def append(self, op, *args):
+        self.append_many([(op, args)])
+
+    def append_many(self, entries):
+        """Apply operations to the tables in one transaction."""
+        if not entries:
+            return
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                caught_up = self.conn.execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()[0] == self.last_seq
+                seqs = []
+                for op, args in entries:
+                    self._apply(op, list(args))
+                    cursor = self.conn.execute(
+                        "INSERT INTO changes (op, args) VALUES (?, ?)", (op, json.dumps(list(args)))
+                    )
+                    seqs.append(cursor.lastrowid)
+                self.conn.execute("UPDATE meta SET value = value + ? WHERE key = 'version'", (len(entries),))
+                self.conn.execute(
+                    "DELETE FROM changes WHERE seq <= (SELECT MAX(seq) FROM changes) - ?", (self.MAX_CHANGES,)
+                )
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+            if caught_up:
+                self.last_seq = seqs[-1]
+            else:
+                self._own.update(seqs)  # skip these when catching up on the others' entries
+
+    def _apply(self, op, args):
+        execute = self.conn.execute
+        if op == "note":
+            execute(
+                "INSERT INTO notes (title, path) VALUES (?, ?) ON CONFLICT(title) DO UPDATE SET path = excluded.path",
+                args,
+            )
+        elif op == "link":
+            self._add_edge(*args)
+            self._add_edge(*args[::-1])
+        elif op == "ref":
+            self._add_edge(*args)
+        elif op == "tag":
+            note, tag = args
+            execute(
+                "INSERT INTO tags (tag, note) SELECT ?, ? WHERE NOT EXISTS (SELECT 1 FROM tags WHERE note = ? AND tag = ?)",
+                (tag, note, note, tag),
+            )
+        elif op == "log":
+            title, log_text = args
+            execute(
+                "INSERT INTO logs (title, content) VALUES (?, ?) ON CONFLICT(title) DO UPDATE SET content = excluded.content",
+                (title, json.dumps(log_text)),
+            )
+        elif op == "unlink":
+            note1, note2 = args
+            execute(
+                "DELETE FROM links WHERE (source = ? AND target = ?) OR (source = ? AND target = ?)",
+                (note1, note2, note2, note1),
+            )
+        elif op == "remove":
+            (title,) = args
+            execute("DELETE FROM notes WHERE title = ?", (title,))
+            execute("DELETE FROM links WHERE source = ? OR target = ?", (title, title))
+            execute("DELETE FROM tags WHERE note = ?", (title,))
+        elif op == "dedupe":
+            execute(
+                "UPDATE links SET weight = (SELECT SUM(l.weight) FROM links l WHERE l.source = links.source AND l.target = links.target) "
+                "WHERE id IN (SELECT MIN(id) FROM links GROUP BY source, target HAVING COUNT(*) > 1)"
+            )
+            execute("DELETE FROM links WHERE id NOT IN (SELECT MIN(id) FROM links GROUP BY source, target)")
+            execute("DELETE FROM tags WHERE id NOT IN (SELECT MIN(id) FROM tags GROUP BY tag, note)")
+        else:
+            raise ValueError(f"Unknown journal operation: {op}")
+
+    def _add_edge(self, source, target):
+        """Insert source -> target, or bump its weight if it already exists."""
+        cursor = self.conn.execute(
+            "UPDATE links SET weight = weight + 1 WHERE id = (SELECT MIN(id) FROM links WHERE source = ? AND target = ?)",
+            (source, target),
+        )
+        if cursor.rowcount == 0:
+            self.conn.execute("INSERT INTO links (source, target) VALUES (?, ?)", (source, target))
+
+    def compact(self, data):
+        """Replace the stored graph with data in one transaction."""
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                for table in ("notes", "links", "tags", "logs", "changes"):
+                    self.conn.execute(f"DELETE FROM {table}")
+                self.conn.executemany("INSERT INTO notes (title, path) VALUES (?, ?)", data["notes"].items())
+                weights = data.get("weights", {})
+                self.conn.executemany(
+                    "INSERT INTO links (source, target, weight) VALUES (?, ?, ?)",
+                    (
+                        (source, target, weights.get(source, {}).get(target, 1))
+                        for source, targets in data["links"].items()
+                        for target in targets
+                    ),
+                )
+                self.conn.executemany(
+                    "INSERT INTO tags (tag, note) VALUES (?, ?)",
+                    ((tag, note) for tag, notes in data["tags"].items() for note in notes),
+                )
+                self.conn.executemany(
+                    "INSERT INTO logs (title, content) VALUES (?, ?)",
+                    ((title, json.dumps(log)) for title, log in data.get("logs", {}).items()),
+                )
+                self.conn.execute("UPDATE meta SET value = ? WHERE key = 'version'", (data.get("version", 0),))
+                self.conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'generation'")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+            self.generation = self._meta("generation")
+            self.last_seq = self.conn.execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()[0]
+            self._own.clear()
+            self.conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+
+    # --- Point lookups that avoid loading the whole graph ---
+
+    def note_path(self, title):
+        with self.lock:
+            row = self.conn.execute("SELECT path FROM notes WHERE title = ?", (title,)).fetchone()
+        return row[0] if row else None
+
+    def links_of(self, note):
+        with self.lock:
+            rows = self.conn.execute("SELECT target FROM links WHERE source = ? ORDER BY id", (note,)).fetchall()
+        return [target for (target,) in rows]
+
+    def backlinks_of(self, note):
+        with self.lock:
+            rows = self.conn.execute("SELECT DISTINCT source FROM links WHERE target = ? ORDER BY source", (note,)).fetchall()
+        return [source for (source,) in rows]
+
+    def tags_of(self, note):
+        with self.lock:
+            rows = self.conn.execute("SELECT DISTINCT tag FROM tags WHERE note = ? ORDER BY tag", (note,)).fetchall()
+        return [tag for (tag,) in rows]
@@ -0,0 +1,15 @@
+// Title suggestions for <input data-complete="/api/complete" list="...">: the datalist is
+// filled from the server as the user types instead of shipping every title with the page.
+document.querySelectorAll("input[data-complete]").forEach(input => {
+  const list = document.getElementById(input.getAttribute("list"));
+  let pending;
+  input.addEventListener("input", () => {
+    clearTimeout(pending);
+    pending = setTimeout(() => {
+      if (!input.value.trim()) return;
+      fetch(input.dataset.complete + "?limit=10&q=" + encodeURIComponent(input.value))
+        .then(r => r.json())
+        .then(data => list.replaceChildren(...data.items.map(title => new Option(title))));
+    }, 100);
+  });
+});
@@ -2,7 +2,6 @@ from graph import Graph
 from dotenv import load_dotenv
 import os
 import subprocess
-import json
 
 # Load .env variables
 load_dotenv()
@@ -12,39 +11,34 @@ GRAPH_FILE = os.getenv("GRAPH_FILE", os.path.expanduser("~/.sodium/graph.json"))
 NOTES_DIR = os.getenv("NOTES_DIR", "notes/")
 DEFAULT_EDITOR = os.getenv("EDITOR", "nvim")
 
-graph = Graph(GRAPH_FILE, NOTES_DIR)
+_graphs = {}
 
-def open_note(title):
+
+def get_graph(graph_file=GRAPH_FILE, notes_dir=NOTES_DIR):
+    """Shared Graph for a graph file and notes directory, so a process builds and loads it only once."""
+    key = (os.path.abspath(graph_file), os.path.abspath(notes_dir))
+    if key not in _graphs:
+        _graphs[key] = Graph(graph_file, notes_dir)
+    return _graphs[key]
+
+
+def __getattr__(name):
+    # storage.graph is created on first use rather than at import time
+    if name == "graph":
+        return get_graph()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def open_note(title, graph=None):
     """Opens the note in the default editor."""
-    if title not in graph.graph["notes"]:
+    note_path = (graph or get_graph()).note_path(title)
+    if note_path is None:
         print(f"Note '{title}' does not exist.")
         return
 
-    note_path = graph.graph["notes"][title]
     subprocess.run([DEFAULT_EDITOR, note_path])
+    # The editor has exited (for terminal editors), so pick up added or removed [[links]]
+    (graph or get_graph()).sync_note(title)
 
-def log_entry(graph_file, title, log_text):
-    """Save a log entry in graph.json."""
-    
-    # Load existing data
-    if os.path.exists(graph_file):
-        with open(graph_file, "r") as f:
-            try:
-                data = json.load(f)
-            except json.JSONDecodeError:
-                data = {}
-    else:
-        data = {}
-    
-    # Ensure logs section exists
-    if "logs" not in data:
-        data["logs"] = {}
-    
-    # Save the log entry
-    data["logs"][title] = log_text
-    
-    # Write back to the JSON file
-    with open(graph_file, "w") as f:
-        json.dump(data, f, indent=4)
-    
-    print(f"Log saved: {title}")
+def log_entry(graph_file, title, log_text, notes_dir=NOTES_DIR):
+    """Append a timestamped log entry to the log store of the graph at graph_file."""
+    get_graph(graph_file, notes_dir).add_log(title, log_text)
@@ -0,0 +1,21 @@
+import os
+import matplotlib
+matplotlib.use("Agg")
+import analysis
+from graph import Graph
+
+
+def test_render_cache_keeps_each_parameter_set_until_the_graph_changes(tmp_path):
+    graph = Graph(str(tmp_path / "graph.json"), str(tmp_path / "notes"))
+    for title in ("Alpha", "Beta", "Gamma"):
+        graph.create_note(title)
+    graph.create_link("Alpha", "Beta")
+
+    top_10, _ = analysis.render_cached(graph.storage_file, "cen", data=graph.graph, top_n=10)
+    top_30, _ = analysis.render_cached(graph.storage_file, "cen", data=graph.graph, top_n=30)
+    assert top_10 != top_30
+    assert os.path.exists(top_10) and os.path.exists(top_30)
+
+    graph.create_link("Beta", "Gamma")
+    current, _ = analysis.render_cached(graph.storage_file, "cen", data=graph.graph, top_n=10)
+    assert sorted(os.listdir(os.path.dirname(current))) == [os.path.basename(current)]
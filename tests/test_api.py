@@ -0,0 +1,60 @@
+import os
+import sys
+import pytest
+from flask import Flask
+
+
+@pytest.fixture(scope="module")
+def client(tmp_path_factory):
+    # storage.graph is built from these on first use, so set them before api is imported
+    root = tmp_path_factory.mktemp("vault")
+    os.environ["GRAPH_FILE"] = str(root / "graph.json")
+    os.environ["NOTES_DIR"] = str(root / "notes")
+    for name in ("storage", "api"):
+        sys.modules.pop(name, None)
+    import api
+
+    with api.graph.batch():
+        for title in ("Alpha", "Beta", "Gamma"):
+            api.graph.create_note(title)
+        api.graph.create_link("Alpha", "Beta")
+        api.graph.create_link("Alpha", "Gamma")
+        api.graph.create_link("Beta", "Gamma")
+    app = Flask(__name__)
+    app.register_blueprint(api.api)
+    yield app.test_client(), api
+    api.job_queue.shutdown()
+
+
+def edges(response):
+    return [(item["source"], item["target"]) for item in response.get_json()["items"]]
+
+
+def test_links_pages_through_every_edge(client):
+    client, api = client
+    first = client.get("/api/links?limit=2").get_json()
+    assert [(i["source"], i["target"]) for i in first["items"]] == [("Alpha", "Beta"), ("Alpha", "Gamma")]
+    rest = client.get(f"/api/links?limit=10&cursor={first['next']}")
+    assert edges(rest) == [("Beta", "Alpha"), ("Beta", "Gamma"), ("Gamma", "Alpha"), ("Gamma", "Beta")]
+
+
+@pytest.mark.parametrize("after", [[1, 2], ["Alpha", "x"], ["Alpha", -1], "Alpha", ["Alpha"]])
+def test_links_ignores_malformed_cursor(client, after):
+    client, api = client
+    response = client.get(f"/api/links?cursor={api.encode_cursor(after)}")
+    assert response.status_code == 200
+    assert len(edges(response)) == 6
+
+
+@pytest.mark.parametrize("limit", [-5, 0, 1])
+def test_related_clamps_limit(client, limit):
+    client, api = client
+    response = client.get(f"/api/related/Alpha?limit={limit}")
+    assert response.status_code == 200
+    assert [item["title"] for item in response.get_json()["items"]] == ["Beta"]
+
+
+def test_query_related_with_non_positive_limit(client):
+    client, api = client
+    assert api.graph.query.related("Alpha", -3) == []
+    assert api.graph.query.related("Alpha", 0) == []
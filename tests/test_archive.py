@@ -0,0 +1,120 @@
+import io
+import time
+import tarfile
+import contextlib
+import pytest
+from archive import ArchiveError, export_vault, import_vault
+from graph import Graph
+
+
+def quiet():
+    return contextlib.redirect_stdout(io.StringIO())
+
+
+def make_graph(path):
+    return Graph(str(path / "graph.json"), str(path / "notes"))
+
+
+@pytest.fixture
+def source(tmp_path):
+    graph = make_graph(tmp_path / "source")
+    with quiet():
+        for title in ("Alpha", "Beta", "Gamma"):
+            graph.create_note(title)
+        graph.create_link("Alpha", "Beta")
+        graph.create_link("Alpha", "Beta")
+        graph.add_tag("Alpha", "draft")
+        graph.add_log("Alpha", "old entry")
+    return graph
+
+
+def logs_of(graph):
+    return sorted((entry["title"], entry["text"]) for entry in graph.logs.entries())
+
+
+def test_round_trip(source, tmp_path):
+    archive = str(tmp_path / "vault.tar.gz")
+    target = make_graph(tmp_path / "target")
+    with quiet():
+        export_vault(source, archive)
+        import_vault(target, archive)
+    assert set(target.graph["notes"]) == {"Alpha", "Beta", "Gamma"}
+    assert target.graph["links"]["Alpha"] == ["Beta"]
+    assert target.graph["weights"] == source.graph["weights"]
+    assert target.graph["tags"] == {"draft": ["Alpha"]}
+    assert logs_of(target) == [("Alpha", "old entry")]
+    with open(target.graph["notes"]["Alpha"]) as f, open(source.graph["notes"]["Alpha"]) as g:
+        assert f.read() == g.read()
+
+
+def test_reimport_changes_nothing(source, tmp_path):
+    archive = str(tmp_path / "vault.tar")
+    target = make_graph(tmp_path / "target")
+    with quiet():
+        export_vault(source, archive)
+        time.sleep(0.01)
+        target.add_log("X", "newer entry")  # imported entries get stamped after this one
+        import_vault(target, archive)
+        version = target.version
+        import_vault(target, archive)
+    assert target.version == version
+    assert logs_of(target) == [("Alpha", "old entry"), ("X", "newer entry")]
+
+
+def test_export_keeps_original_log_times(source, tmp_path):
+    first, second = str(tmp_path / "first.tar"), str(tmp_path / "second.tar")
+    target, copy = make_graph(tmp_path / "target"), make_graph(tmp_path / "copy")
+    original = [entry["ts"] for entry in source.logs.entries()]
+    with quiet():
+        export_vault(source, first)
+        time.sleep(0.01)
+        target.add_log("X", "newer entry")
+        import_vault(target, first)
+        export_vault(target, second)
+        import_vault(copy, second)
+    # Stamped after "newer entry" to keep the log in order, but the original time is kept alongside
+    assert [entry.get("origin_ts", entry["ts"]) for entry in copy.logs.entries(title="Alpha")] == original
+
+
+def test_tag_filter(source, tmp_path):
+    archive = str(tmp_path / "part.tar")
+    target = make_graph(tmp_path / "target")
+    with quiet():
+        export_vault(source, archive, tags=["draft"])
+        import_vault(target, archive)
+    assert set(target.graph["notes"]) == {"Alpha"}
+    assert target.graph["links"].get("Alpha", []) == []
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / "bad.tar"
+    path.write_bytes(b"not an archive" * 100)
+    with pytest.raises(ArchiveError):
+        import_vault(make_graph(tmp_path / "target"), str(path))
+
+
+def write_archive(path, members):
+    with tarfile.open(path, "w") as tar:
+        for name, data in members:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+
+
+HEADER = ("sodium.json", b'{"format": "sodium-archive", "version": 1}')
+
+
+@pytest.mark.parametrize("members, message", [
+    ([("sodium.json", b"[1]")], "Unsupported archive format"),
+    ([("sodium.json", b"{not json")], "Invalid sodium.json"),
+    ([HEADER, ("graph.ndjson", b'{"ref": ["Alpha"]}\n')], "graph.ndjson on line 1"),
+    ([HEADER, ("graph.ndjson", b'\n{"ref": ["Alpha", "Beta"], "weight": "x"}\n')], "graph.ndjson on line 2"),
+    ([HEADER, ("graph.ndjson", b'{"tag": "draft"}\n')], "graph.ndjson on line 1"),
+    ([HEADER, ("logs.ndjson", b'{"ts": 1, "title": "Alpha"}\n')], "logs.ndjson on line 1"),
+    ([HEADER, ("logs.ndjson", b'{"ts": "soon", "title": "Alpha", "text": "x"}\n')], "logs.ndjson on line 1"),
+])
+def test_malformed_records_raise_archive_error(tmp_path, members, message):
+    archive = str(tmp_path / "bad.tar")
+    write_archive(archive, members)
+    with quiet(), pytest.raises(ArchiveError, match=message):
+        import_vault(make_graph(tmp_path / "target"), archive)
@@ -0,0 +1,38 @@
+import json
+import multiprocessing
+from journal import atomic_write_json
+from search_index import SearchIndex
+
+
+def _add_to_index(path, n):
+    index = SearchIndex(path)
+    for i in range(n):
+        index.add(f"note:{multiprocessing.current_process().name}-{i}", f"text {i}", None)
+
+
+def _write_sidecar(path, n):
+    for i in range(n):
+        atomic_write_json(path, {"i": i})
+
+
+def _run(target, path, n=60, processes=3):
+    workers = [multiprocessing.Process(target=target, args=(path, n)) for _ in range(processes)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return [worker.exitcode for worker in workers]
+
+
+def test_concurrent_index_writers(tmp_path):
+    path = str(tmp_path / "graph.index.db")
+    assert _run(_add_to_index, path) == [0, 0, 0]
+    assert len(SearchIndex(path).search("text")) == 3 * 60
+
+
+def test_concurrent_atomic_writes(tmp_path):
+    path = str(tmp_path / "graph.layout.json")
+    assert _run(_write_sidecar, path) == [0, 0, 0]
+    with open(path) as f:
+        assert json.load(f) == {"i": 59}
+    assert [p.name for p in tmp_path.iterdir()] == ["graph.layout.json"]
@@ -0,0 +1,20 @@
+import io
+import json
+from batch import run_batch
+from graph import Graph
+
+
+def test_failing_operation_does_not_abort_batch(tmp_path):
+    graph = Graph(str(tmp_path / "graph.json"), str(tmp_path / "notes"))
+    lines = [
+        json.dumps({"op": "new", "title": "Ideas"}),
+        json.dumps({"op": "new", "title": "x/y"}),
+        "not json",
+        json.dumps({"op": "new", "title": "Projects"}),
+    ]
+    out = io.StringIO()
+    assert run_batch(graph, lines, out) == 2
+    results = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert [result["ok"] for result in results] == [True, False, False, True]
+    assert "FileNotFoundError" in results[1]["message"]
+    assert set(Graph(graph.storage_file, graph.notes_dir).graph["notes"]) == {"Ideas", "Projects"}
@@ -0,0 +1,38 @@
+import os
+import graph as graph_module
+from graph import Graph
+
+
+def make_vault(tmp_path):
+    notes = tmp_path / "notes"
+    notes.mkdir()
+    (notes / "Alpha.na.md").write_text("See [[Beta]].\n")
+    (notes / "Beta.na.md").write_text("Plain note.\n")
+    return Graph(str(tmp_path / "graph.json"), str(notes))
+
+
+def test_init_leaves_small_batches_in_the_journal(tmp_path):
+    graph = make_vault(tmp_path)
+    graph.init_graph()
+    assert 0 < graph.store.pending < Graph.COMPACT_EVERY
+    reopened = Graph(graph.storage_file, graph.notes_dir)
+    assert "Beta" in reopened.graph["links"]["Alpha"]
+
+
+def test_incremental_init_skips_touched_notes_with_same_content(tmp_path, monkeypatch):
+    graph = make_vault(tmp_path)
+    graph.init_graph(incremental=True)
+    path = graph.note_path("Beta")
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+
+    scanned = []
+    real_scan = graph_module.scan_note
+    monkeypatch.setattr(graph_module, "scan_note", lambda path: scanned.append(path) or real_scan(path))
+    graph.init_graph(incremental=True)
+    assert scanned == []
+
+    with open(path, "a") as f:
+        f.write("Now with [[Alpha]] too.\n")
+    graph.init_graph(incremental=True)
+    assert scanned == [path]
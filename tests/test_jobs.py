@@ -0,0 +1,29 @@
+import os
+import time
+from jobs import JobQueue
+
+
+def wait_for(queue, job_id, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        status = queue.status(job_id)
+        if status and status["state"] in ("done", "failed"):
+            return status
+        time.sleep(0.05)
+    raise AssertionError(f"job {job_id} did not finish: {queue.status(job_id)}")
+
+
+def test_queue_recovers_after_a_worker_dies(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs"), max_workers=1)
+    try:
+        crashed = queue.submit(os._exit, 1, name="crash")
+        status = wait_for(queue, crashed)
+        assert status["state"] == "failed"
+        assert "BrokenProcessPool" in status["error"]
+
+        job_id = queue.submit(pow, 2, 10, name="pow")
+        status = wait_for(queue, job_id)
+        assert status["state"] == "done"
+        assert status["result"] == 1024
+    finally:
+        queue.shutdown()
@@ -0,0 +1,132 @@
+import json
+import multiprocessing
+import threading
+import time
+import pytest
+from graph import Graph
+from journal import Journal, apply_op, atomic_write_json
+from locking import FileLock
+
+
+def journal_in(tmp_path):
+    return Journal(str(tmp_path / "graph.json"), str(tmp_path / "graph.journal"))
+
+
+def test_replay_skips_torn_last_line(tmp_path):
+    journal = journal_in(tmp_path)
+    journal.load()
+    journal.append("note", "Alpha", "Alpha.na.md")
+    journal.append("note", "Beta", "Beta.na.md")
+    with open(journal.journal_file, "ab") as f:
+        f.write(b'{"op": "note", "args": ["Gam')  # crash in the middle of an append
+
+    data = journal_in(tmp_path).load()
+    assert list(data["notes"]) == ["Alpha", "Beta"]
+    assert data["version"] == 2
+
+    # The next writer isolates the torn line instead of gluing onto it
+    journal = journal_in(tmp_path)
+    journal.load()
+    journal.append("note", "Delta", "Delta.na.md")
+    assert list(journal_in(tmp_path).load()["notes"]) == ["Alpha", "Beta", "Delta"]
+
+
+def test_crash_between_snapshot_replace_and_journal_reset(tmp_path):
+    journal = journal_in(tmp_path)
+    data = journal.load()
+    for op, args in [("note", ["Alpha", "a"]), ("note", ["Beta", "b"]), ("link", ["Alpha", "Beta"])]:
+        apply_op(data, op, args)
+        journal.append(op, *args)
+
+    # compact() got as far as replacing the snapshot; the old journal is still there
+    atomic_write_json(journal.snapshot_file, data, indent=4)
+
+    reloaded = journal_in(tmp_path).load()
+    assert reloaded["links"] == {"Alpha": ["Beta"], "Beta": ["Alpha"]}
+    assert "weights" not in reloaded or not reloaded["weights"]
+    assert reloaded["version"] == data["version"]
+
+
+def test_journal_catch_up_replays_only_new_entries(tmp_path):
+    writer, reader = journal_in(tmp_path), journal_in(tmp_path)
+    writer.load()
+    writer.append("note", "Alpha", "a")
+    data = reader.load()
+    writer.append_many([("note", ("Beta", "b")), ("tag", ("Beta", "draft"))])
+    assert reader.catch_up(data) == 2
+    assert reader.catch_up(data) == 0
+    assert data["tags"] == {"draft": ["Beta"]}
+
+    writer.compact(writer.load())
+    assert reader.catch_up(data) is None  # snapshot replaced: reload
+
+
+def write_notes(storage_file, notes_dir, worker, count):
+    Graph.COMPACT_EVERY = 7  # compact while the other writers are appending
+    graph = Graph(storage_file, notes_dir)
+    for n in range(count):
+        graph.create_note(f"w{worker}-{n}")
+        graph.add_tag(f"w{worker}-{n}", "shared")
+
+
+@pytest.mark.parametrize("suffix", [".json", ".snap", ".db"])
+def test_concurrent_writer_processes_lose_nothing(tmp_path, suffix):
+    storage_file, notes_dir = str(tmp_path / f"graph{suffix}"), str(tmp_path / "notes")
+    Graph(storage_file, notes_dir)
+    workers, count = 4, 15
+    context = multiprocessing.get_context("fork")
+    processes = [context.Process(target=write_notes, args=(storage_file, notes_dir, w, count)) for w in range(workers)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(60)
+        assert process.exitcode == 0
+
+    graph = Graph(storage_file, notes_dir).graph
+    expected = {f"w{w}-{n}" for w in range(workers) for n in range(count)}
+    assert set(graph["notes"]) == expected
+    assert sorted(graph["tags"]["shared"]) == sorted(expected)
+    assert graph["version"] == 2 * workers * count
+
+
+def test_sqlite_catch_up(tmp_path):
+    storage_file, notes_dir = str(tmp_path / "graph.db"), str(tmp_path / "notes")
+    writer, reader = Graph(storage_file, notes_dir), Graph(storage_file, notes_dir)
+    data = reader.graph
+    writer.create_note("Alpha")
+    writer.create_note("Beta")
+    writer.create_link("Alpha", "Beta")
+    writer.add_tag("Beta", "draft")
+    assert reader.store.catch_up(data) == 4
+    assert reader.store.catch_up(data) == 0
+    assert data["links"]["Alpha"] == ["Beta"]
+    assert data["tags"] == {"draft": ["Beta"]}
+
+    # Its own writes are not replayed a second time
+    reader.add_tag("Alpha", "draft")
+    assert reader.store.catch_up(reader.graph) == 0
+    assert reader.graph["tags"]["draft"] == ["Beta", "Alpha"]
+
+    # A compaction elsewhere forces a reload
+    writer.save_graph()
+    assert reader.store.catch_up(reader.graph) is None
+    assert reader.refresh() is True
+    assert json.dumps(reader.graph["tags"]) == json.dumps(writer.graph["tags"])
+
+
+def test_readers_do_not_wait_while_a_writer_waits_for_another_process(tmp_path):
+    graph = Graph(str(tmp_path / "graph.json"), str(tmp_path / "notes"))
+    graph.create_note("Alpha")
+    other_process = FileLock(graph.file_lock.path)  # a separate flock, like another process
+    other_process.acquire()
+    writer = threading.Thread(target=graph.add_tag, args=("Alpha", "draft"))
+    try:
+        writer.start()
+        time.sleep(0.1)  # the writer is now blocked on the file lock
+        assert writer.is_alive()
+        assert graph.lock.acquire(timeout=1)
+        graph.lock.release()
+    finally:
+        other_process.release()
+        writer.join()
+    assert graph.graph["tags"] == {"draft": ["Alpha"]}
@@ -0,0 +1,25 @@
+from graph import Graph, migrate_graph
+
+
+def log_rows(graph):
+    return [(entry["ts"], entry.get("origin_ts"), entry["title"], entry["text"]) for entry in graph.logs.entries()]
+
+
+def test_migrate_copies_notes_and_logs(tmp_path):
+    notes_dir = str(tmp_path / "notes")
+    source = Graph(str(tmp_path / "graph.json"), notes_dir)
+    source.create_note("Alpha")
+    source.add_log("Standup", "first")
+    source.logs.append_many([("Standup", "second"), ("Alpha", "older")], [5.0, 1.0])
+    source.add_log("Alpha", "last")
+
+    for target_file in ("vault.db", "vault.snap"):
+        migrate_graph(source.storage_file, str(tmp_path / target_file))
+        target = Graph(str(tmp_path / target_file), notes_dir)
+        assert list(target.graph["notes"]) == ["Alpha"]
+        assert log_rows(target) == log_rows(source)
+        assert target.search("second") == ([], [("Standup", "second")])
+
+    # A second migration into the same target does not duplicate the entries
+    migrate_graph(source.storage_file, str(tmp_path / "vault.db"))
+    assert len(log_rows(Graph(str(tmp_path / "vault.db"), notes_dir))) == 4
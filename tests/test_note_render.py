@@ -0,0 +1,38 @@
+from note_render import render_markdown
+
+
+def resolve(title):
+    return f"/note/{title}"
+
+
+def test_raw_html_is_escaped():
+    html = render_markdown("hi <script>alert(1)</script>\n\n<div onclick='x()'>a</div>", resolve)
+    assert "<script>" not in html
+    assert "<div" not in html
+    assert "&lt;script&gt;alert(1)&lt;/script&gt;" in html
+
+
+def test_script_urls_are_neutralised():
+    html = render_markdown("[x](javascript:alert(1)) ![i](data:text/html,x) [ok](https://example.com)", resolve)
+    assert "javascript:" not in html
+    assert "data:" not in html
+    assert 'href="https://example.com"' in html
+
+
+def test_markdown_and_wiki_links_still_render():
+    html = render_markdown("**bold** [[Other Note]] `<code>`", resolve)
+    assert "<strong>bold</strong>" in html
+    assert '<a class="wikilink" href="/note/Other Note">Other Note</a>' in html
+    assert "<code>&lt;code&gt;</code>" in html
+
+
+def test_encoded_script_urls_are_neutralised():
+    for url in ("&#106;avascript:alert(1)", "java&#x09;script:alert(1)", "&#x6A;ava\tscript:alert(1)", "JaVaScRiPt:alert(1)", "vbscript:x", "file:///etc/passwd"):
+        html = render_markdown(f"[x]({url}) ![i]({url})", resolve)
+        assert 'href="#"' in html and 'src="#"' in html, url
+
+
+def test_safe_urls_are_kept():
+    html = render_markdown("[a](http://a.example) [b](mailto:me@example.com) [c](other/page?x=a:b) [d](#top)", resolve)
+    for url in ("http://a.example", "mailto:me@example.com", "other/page?x=a:b", "#top"):
+        assert f'href="{url}"' in html
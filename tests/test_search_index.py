@@ -0,0 +1,90 @@
+import os
+import io
+import threading
+import contextlib
+from graph import Graph
+
+
+def test_search_while_notes_are_created(tmp_path):
+    graph = Graph(str(tmp_path / "graph.json"), str(tmp_path / "notes"))
+    errors = []
+    done = threading.Event()
+
+    def searcher():
+        while not done.is_set():
+            try:
+                graph.search("note")
+            except Exception as e:  # noqa: BLE001 - any failure is the bug
+                errors.append(e)
+
+    threads = [threading.Thread(target=searcher) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            for i in range(150):
+                graph.create_note(f"note {i}")
+    finally:
+        done.set()
+        for thread in threads:
+            thread.join()
+
+    assert errors == []
+    assert len(graph.search("note")[0]) == 150
+
+
+def make_graph(tmp_path):
+    graph = Graph(str(tmp_path / "graph.json"), str(tmp_path / "notes"))
+    with contextlib.redirect_stdout(io.StringIO()):
+        for title, text in [("Alpha", "research draft on graphs"), ("Beta", "draft research"), ("Gamma", "project notes")]:
+            graph.create_note(title)
+            with open(graph.note_path(title), "a") as f:
+                f.write(text + "\n")
+        graph.add_log("Standup", "reviewed the research draft")
+    return graph
+
+
+def test_phrase_prefix_and_log_queries(tmp_path):
+    graph = make_graph(tmp_path)
+    assert graph.search('"research draft"') == (["Alpha"], [("Standup", "reviewed the research draft")])
+    assert sorted(graph.search("draft research")[0]) == ["Alpha", "Beta"]
+    assert graph.search("proj*")[0] == ["Gamma"]
+    assert graph.search("nonexistentword") == ([], [])
+
+
+def test_queries_skip_the_notes_scan_until_something_changed(tmp_path, monkeypatch):
+    graph = make_graph(tmp_path)
+    index = graph.search_index
+    index.RACY_SECONDS = 0
+    graph.search("draft")
+    scans = []
+    real_scan = index._scan_notes
+    monkeypatch.setattr(index, "_scan_notes", lambda *args: scans.append(args) or real_scan(*args))
+
+    for _ in range(5):
+        graph.search("draft")
+    assert scans == []
+
+    # An edit reported through sync_note (the watcher, `open`, the web editor) is indexed right away
+    with open(graph.note_path("Gamma"), "a") as f:
+        f.write("now a draft too\n")
+    with contextlib.redirect_stdout(io.StringIO()):
+        graph.sync_note("Gamma")
+    assert sorted(graph.search("draft")[0]) == ["Alpha", "Beta", "Gamma"]
+    assert scans == []
+
+    # Edits nobody reported are found by the periodic rescan
+    with open(graph.note_path("Beta"), "w") as f:
+        f.write("rewritten\n")
+    index.RESCAN_SECONDS = 0
+    assert sorted(graph.search("draft")[0]) == ["Alpha", "Gamma"]
+    assert len(scans) == 1
+
+
+def test_search_reopens_the_index_in_a_new_graph(tmp_path):
+    graph = make_graph(tmp_path)
+    graph.search("draft")
+    open(graph.sidecar_path("index.json"), "w").close()  # left behind by an older version
+    reopened = Graph(graph.storage_file, graph.notes_dir)
+    assert sorted(reopened.search("draft")[0]) == ["Alpha", "Beta"]
+    assert not os.path.exists(graph.sidecar_path("index.json"))
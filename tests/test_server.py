@@ -0,0 +1,82 @@
+import os
+import sys
+import time
+import threading
+import multiprocessing
+import pytest
+from flask import Response
+
+
+@pytest.fixture(scope="module")
+def server(tmp_path_factory):
+    root = tmp_path_factory.mktemp("vault")
+    os.environ["GRAPH_FILE"] = str(root / "graph.json")
+    os.environ["NOTES_DIR"] = str(root / "notes")
+    os.environ["SODIUM_WATCH"] = "0"
+    for name in ("storage", "api", "server"):
+        sys.modules.pop(name, None)
+    import server
+
+    def slow_stream():
+        def body():
+            yield "first"
+            time.sleep(0.05)
+            yield "second"
+        return Response(body())
+
+    server.app.add_url_rule("/_slow_stream", view_func=slow_stream)
+    yield server
+    server.job_queue.shutdown()
+
+
+def observed(route):
+    import metrics
+
+    series = metrics.REQUEST_SECONDS.values.get(("GET", route, "200"))
+    return (series[-2], series[-1]) if series else (0, 0.0)
+
+
+def test_streamed_latency_includes_body_generation(server):
+    response = server.app.test_client().get("/_slow_stream")
+    assert observed("/_slow_stream") == (0, 0.0)  # nothing until the body has been sent
+    assert response.get_data(as_text=True) == "firstsecond"
+    response.close()
+    count, seconds = observed("/_slow_stream")
+    assert count == 1
+    assert seconds >= 0.05
+
+
+def test_buffered_latency_is_recorded_right_away(server):
+    server.app.test_client().get("/metrics")
+    assert observed("/metrics")[0] == 1
+
+
+def report_threads(results):
+    import server  # noqa: F401 - importing it is what starts the watcher
+
+    results.put(sorted(thread.name for thread in threading.enumerate()))
+    server.job_queue.shutdown()
+
+
+def test_job_workers_do_not_start_a_watcher(server, monkeypatch):
+    monkeypatch.setenv("SODIUM_WATCH", "1")
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    worker = context.Process(target=report_threads, args=(results,))
+    worker.start()
+    threads = results.get(timeout=60)
+    worker.join(60)
+    assert "sodium-watcher" not in threads
+
+
+def test_flash_after_log_is_not_swallowed_by_a_304(server):
+    client = server.app.test_client()
+    server.graph.create_note("Journal")
+    etag = client.get("/note/Journal").headers["ETag"]
+
+    response = client.post("/log", data={"title": "Journal", "log": "hello"}, headers={"If-None-Match": etag}, follow_redirects=True)
+    assert response.status_code == 200
+    assert "Added log to &#39;Journal&#39;." in response.get_data(as_text=True)
+    assert "ETag" not in response.headers
+
+    assert client.get("/note/Journal", headers={"If-None-Match": etag}).status_code == 304
@@ -0,0 +1,66 @@
+import io
+import contextlib
+import pytest
+import snapshot
+from graph import Graph
+
+
+@pytest.fixture
+def snap_graph(tmp_path):
+    """A .snap vault where A <-> B was linked twice (weight 2) and A <-> C once, reopened from the snapshot."""
+    storage_file, notes_dir = str(tmp_path / "graph.snap"), str(tmp_path / "notes")
+    with contextlib.redirect_stdout(io.StringIO()):
+        graph = Graph(storage_file, notes_dir)
+        for title in "ABC":
+            graph.create_note(title)
+        graph.create_link("A", "B")
+        graph.create_link("A", "B")
+        graph.create_link("A", "C")
+        graph.save_graph()
+    reopened = Graph(storage_file, notes_dir)
+    assert isinstance(reopened.graph["weights"], snapshot.SnapshotTable)
+    assert reopened.graph["weights"]["A"] == {"B": 2}
+    return reopened
+
+
+def reload(graph):
+    graph.save_graph()
+    return Graph(graph.storage_file, graph.notes_dir).graph
+
+
+def test_encode_round_trip():
+    data = {
+        "notes": {"A": "a.na.md", "B": "b.na.md"},
+        "links": {"A": ["B"], "B": ["A"]},
+        "tags": {"t": ["A"]},
+        "weights": {"A": {"B": 3}},
+        "version": 7,
+    }
+    loaded = snapshot.plain(snapshot.Snapshot(snapshot.encode(data)).graph())
+    assert loaded == data
+
+
+def test_unlink_drops_weights(snap_graph):
+    snap_graph._commit("unlink", "A", "B")
+    assert "A" not in snap_graph.graph["weights"]
+    data = reload(snap_graph)
+    assert "B" not in data["links"].get("A", [])
+    assert "A" not in data["weights"]
+
+
+def test_remove_note_drops_weights(snap_graph):
+    with contextlib.redirect_stdout(io.StringIO()):
+        snap_graph.remove_note("B")
+    data = reload(snap_graph)
+    assert "B" not in data["notes"]
+    assert dict(data["weights"].items()) == {}
+    assert data["links"]["A"] == ["C"]
+
+
+def test_relinking_after_unlink_starts_over(snap_graph):
+    snap_graph._commit("unlink", "A", "B")
+    with contextlib.redirect_stdout(io.StringIO()):
+        snap_graph.create_link("A", "B")
+    data = reload(snap_graph)
+    assert "A" not in data["weights"]
+    assert "B" in data["links"]["A"]
@@ -0,0 +1,42 @@
+import sys
+import threading
+from title_index import TitleIndex
+
+
+def test_complete_ranks_prefix_then_words_then_typos():
+    index = TitleIndex(["Project meeting", "Meeting notes", "Weekly project review", "Recipes"])
+    assert index.complete("proj") == ["Project meeting", "Weekly project review"]
+    assert index.complete("meeting proj") == ["Project meeting"]
+    assert index.complete("recipse") == ["Recipes"]
+
+
+def test_complete_while_titles_change():
+    index = TitleIndex([f"note {i}" for i in range(500)])
+    errors = []
+    done = threading.Event()
+
+    def completer():
+        while not done.is_set():
+            try:
+                index.complete("note 1", 50)
+                index.complete("nots", 50)  # walks the posting set of "note" being updated
+            except Exception as e:  # noqa: BLE001 - any failure is the bug
+                errors.append(e)
+
+    threads = [threading.Thread(target=completer) for _ in range(3)]
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)  # switch threads often enough to interleave with the updates
+    for thread in threads:
+        thread.start()
+    try:
+        for i in range(500, 2000):
+            index.add(f"note {i} word{i}")
+            index.remove(f"note {i - 500}")
+    finally:
+        done.set()
+        for thread in threads:
+            thread.join()
+        sys.setswitchinterval(interval)
+
+    assert errors == []
+    assert index.complete("word1999")[0] == "note 1999 word1999"
@@ -0,0 +1,186 @@
+import re
+import sys
+import threading
+from bisect import bisect_left, insort
+
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def _words(text):
+    return [sys.intern(word) for word in WORD_PATTERN.findall(text.lower())]
+
+
+def _deletes(word):
+    """word with each single character removed (SymSpell-style typo keys)."""
+    return {word[:i] + word[i + 1:] for i in range(len(word))}
+
+
+class TitleIndex:
+    """
+    In-memory completion index over note titles.
+
+    complete() ranks titles that start with the query first, then titles
+    whose words match every query word: exactly, by prefix or with one
+    typo. Typos are found through a map from every word with one character
+    deleted to the words it came from, so a lookup costs a few dict probes
+    instead of a scan. Each word has a posting set of titles; candidates
+    come from the rarest query word and are narrowed by the others.
+
+    One instance is shared by the server's threads; lock serializes updates
+    and lookups.
+    """
+
+    # Prefix words expanded per query word; the most common ones are kept
+    MAX_PREFIX_WORDS = 64
+    # Titles scored per query, bounding very unspecific queries
+    MAX_CANDIDATES = 5000
+    # Words shorter than this are not matched with typos
+    MIN_TYPO_LENGTH = 4
+
+    def __init__(self, titles=(), version=None):
+        self.version = version
+        self.lock = threading.RLock()
+        self.titles = set()
+        self.lowered = []    # sorted (title.lower(), title)
+        self.postings = {}   # word -> {titles}
+        self.vocabulary = [] # sorted words
+        self.typos = {}      # word with one character deleted -> {words}
+        # Bulk load: sort once instead of inserting into the sorted lists one by one
+        for title in titles:
+            if title not in self.titles:
+                self.titles.add(title)
+                self._add_words(title, new_words=None)
+        self.lowered = sorted((title.lower(), title) for title in self.titles)
+        self.vocabulary = sorted(self.postings)
+        for word in self.vocabulary:
+            for variant in _deletes(word):
+                self.typos.setdefault(variant, set()).add(word)
+
+    def _add_words(self, title, new_words):
+        for word in set(_words(title)):
+            titles = self.postings.get(word)
+            if titles is None:
+                titles = self.postings[word] = set()
+                if new_words is not None:
+                    new_words.append(word)
+            titles.add(title)
+
+    def add(self, title):
+        with self.lock:
+            if title in self.titles:
+                return
+            self.titles.add(title)
+            insort(self.lowered, (title.lower(), title))
+            new_words = []
+            self._add_words(title, new_words)
+            for word in new_words:
+                insort(self.vocabulary, word)
+                for variant in _deletes(word):
+                    self.typos.setdefault(variant, set()).add(word)
+
+    def remove(self, title):
+        with self.lock:
+            if title not in self.titles:
+                return
+            self.titles.discard(title)
+            key = (title.lower(), title)
+            i = bisect_left(self.lowered, key)
+            if i < len(self.lowered) and self.lowered[i] == key:
+                del self.lowered[i]
+            for word in set(_words(title)):
+                titles = self.postings.get(word)
+                if titles is None:
+                    continue
+                titles.discard(title)
+                if not titles:
+                    del self.postings[word]
+                    i = bisect_left(self.vocabulary, word)
+                    if i < len(self.vocabulary) and self.vocabulary[i] == word:
+                        del self.vocabulary[i]
+                    for variant in _deletes(word):
+                        words = self.typos.get(variant)
+                        if words is not None:
+                            words.discard(word)
+                            if not words:
+                                del self.typos[variant]
+
+    def sync(self, titles, version):
+        """Reconcile with the current set of titles (e.g. after changes made by other processes)."""
+        with self.lock:
+            current = titles.keys() if hasattr(titles, "keys") else set(titles)
+            for title in self.titles - current:
+                self.remove(title)
+            for title in current - self.titles:
+                self.add(title)
+            self.version = version
+
+    def _word_matches(self, word):
+        """[(posting set, quality)] for vocabulary words matching a query word."""
+        matches = {}
+        if word in self.postings:
+            matches[word] = 3
+        # Abbreviated words, or the one still being typed
+        i = bisect_left(self.vocabulary, word)
+        expanded = []
+        while i < len(self.vocabulary) and self.vocabulary[i].startswith(word):
+            if self.vocabulary[i] != word:
+                expanded.append(self.vocabulary[i])
+            i += 1
+        if len(expanded) > self.MAX_PREFIX_WORDS:
+            expanded = sorted(expanded, key=lambda w: -len(self.postings[w]))[:self.MAX_PREFIX_WORDS]
+        for candidate in expanded:
+            matches.setdefault(candidate, 2)
+        if len(word) >= self.MIN_TYPO_LENGTH:
+            deletes = _deletes(word)
+            # A shared deletion: one character substituted or two swapped; the word itself: one left out
+            for variant in deletes | {word}:
+                for candidate in self.typos.get(variant, ()):
+                    matches.setdefault(candidate, 1)
+            # One character too many
+            for candidate in self.postings.keys() & deletes:
+                matches.setdefault(candidate, 1)
+        return [(self.postings[w], quality) for w, quality in matches.items()]
+
+    def complete(self, query, limit=10):
+        """Up to limit titles for a partial, possibly misspelt query, best first."""
+        with self.lock:
+            lowered = query.lower().strip()
+            if not lowered:
+                return []
+            results = []
+            seen = set()
+            i = bisect_left(self.lowered, (lowered,))
+            while i < len(self.lowered) and len(results) < limit and self.lowered[i][0].startswith(lowered):
+                results.append(self.lowered[i][1])
+                seen.add(self.lowered[i][1])
+                i += 1
+            if len(results) >= limit:
+                return results
+
+            words = _words(lowered)
+            if not words:
+                return results
+            matches = [self._word_matches(word) for word in words]
+            if not all(matches):
+                return results
+            order = sorted(range(len(words)), key=lambda n: sum(len(titles) for titles, _ in matches[n]))
+
+            # Best matches of the rarest word first, so the cap drops the weakest candidates
+            scores = {}
+            for titles, quality in sorted(matches[order[0]], key=lambda match: -match[1]):
+                for title in titles:
+                    if scores.get(title, 0) < quality:
+                        scores[title] = quality
+                if len(scores) >= self.MAX_CANDIDATES:
+                    break
+            for n in order[1:]:
+                candidates = set(scores)
+                best = {}
+                for titles, quality in matches[n]:
+                    for title in titles & candidates:  # costs the smaller of the two sets
+                        if best.get(title, 0) < quality:
+                            best[title] = quality
+                scores = {title: scores[title] + quality for title, quality in best.items()}
+
+            ranked = sorted((title for title in scores if title not in seen), key=lambda t: (-scores[t], len(t), t))
+            return results + ranked[:limit - len(results)]
@@ -0,0 +1,130 @@
+import os
+import threading
+
+
+def _stamp(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+class GraphWatcher:
+    """
+    Keeps a long-lived Graph in sync with changes made by other processes.
+
+    Changes to the graph's storage files (graph.json and its journal, or the
+    SQLite database) are applied with Graph.refresh(), which only replays the
+    operations other processes appended. New .na.md files in the notes
+    directory are registered as notes, created or modified notes get their
+    links re-synced with their [[references]] (Graph.sync_note), and every
+    created, modified or deleted note file is reported to the on_note_change
+    callbacks so callers can drop cached content. Uses watchdog (inotify/FSEvents) when it is installed and
+    falls back to polling with os.stat otherwise.
+    """
+
+    def __init__(self, graph, interval=0.5):
+        self.graph = graph
+        self.interval = interval
+        self.callbacks = []
+        self._files = {}
+        self._graph_stamps = None
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+        self._observer = None
+
+    def on_note_change(self, callback):
+        """Register callback(title) for note files created, modified or deleted on disk."""
+        self.callbacks.append(callback)
+        return callback
+
+    def start(self):
+        self._graph_stamps = self._current_graph_stamps()
+        self._files = self._scan_notes_dir()
+        self._observer = self._start_observer()
+        self._thread = threading.Thread(target=self._run, name="sodium-watcher", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._observer is not None:
+            self._observer.stop()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _start_observer(self):
+        """Use filesystem notifications if watchdog is available; the poll loop then just waits for them."""
+        try:
+            from watchdog.observers import Observer
+            from watchdog.events import FileSystemEventHandler
+        except ImportError:
+            return None
+
+        wake = self._wake
+
+        class Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                wake.set()
+
+        observer = Observer()
+        observer.schedule(Handler(), os.path.dirname(os.path.abspath(self.graph.storage_file)))
+        if os.path.abspath(self.graph.notes_dir) != os.path.dirname(os.path.abspath(self.graph.storage_file)):
+            observer.schedule(Handler(), os.path.abspath(self.graph.notes_dir))
+        observer.daemon = True
+        observer.start()
+        return observer
+
+    def _run(self):
+        while not self._stop.is_set():
+            if self._observer is not None:
+                # Notifications arrive in bursts; poll again occasionally in case one is missed.
+                self._wake.wait(timeout=30)
+            else:
+                self._wake.wait(timeout=self.interval)
+            self._wake.clear()
+            if not self._stop.is_set():
+                self.check()
+
+    def check(self):
+        """Apply any pending external changes now."""
+        stamps = self._current_graph_stamps()
+        if stamps != self._graph_stamps:
+            self._graph_stamps = stamps
+            self.graph.refresh()
+
+        files = self._scan_notes_dir()
+        if files == self._files:
+            return
+        changed = {name for name in files.keys() | self._files.keys() if files.get(name) != self._files.get(name)}
+        self._files = files
+        for filename in changed:
+            title = filename[:-6]
+            if filename in files:
+                if title not in self.graph.graph["notes"]:
+                    self.graph.register_note(title, os.path.join(self.graph.notes_dir, filename))
+                self.graph.sync_note(title)
+            for callback in self.callbacks:
+                callback(title)
+
+    def _current_graph_stamps(self):
+        return tuple(_stamp(path) for path in self.graph.store.watch_files)
+
+    def _scan_notes_dir(self):
+        files = {}
+        try:
+            entries = os.scandir(self.graph.notes_dir)
+        except FileNotFoundError:
+            return files
+        with entries:
+            for entry in entries:
+                if entry.name.endswith(".na.md"):
+                    try:
+                        st = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    files[entry.name] = (st.st_mtime_ns, st.st_size)
+        return files